@@ -0,0 +1,35 @@
+import os
+import signal
+
+import sentry_sdk
+
+import setup_logging
+from src.daemon import UpdateDaemon
+from src.scheduler import UpdateScheduler
+from src.utils import sessions
+
+logger = setup_logging.setup()
+
+if 'SENTRY_URL' in os.environ:
+    sentry_sdk.init(
+        os.environ['SENTRY_URL'],
+        traces_sample_rate=1.0
+    )
+else:
+    logger.info('Skipping sentry initialization')
+
+scheduler = UpdateScheduler()
+daemon = UpdateDaemon(scheduler, use_async=bool(os.environ.get('SCHEDULER_ASYNC')))
+signal.signal(signal.SIGTERM, daemon.stop)
+signal.signal(signal.SIGINT, daemon.stop)
+
+try:
+    daemon.run()
+except:
+    logger.exception('Update daemon stopped unexpectedly')
+
+sessions.log_host_stats()
+sessions.close_sessions()
+scheduler.es.close()
+scheduler.pool.close()
+sentry_sdk.flush()
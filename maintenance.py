@@ -8,13 +8,18 @@ setup_logging.setup('debug')
 logger = setup_logging.setup('maintenance')
 
 parser = ArgumentParser()
-parser.add_argument('--manga', '-m', type=int, required=True)
+parser.add_argument('--manga', '-m', type=int)
 parser.add_argument('--update-interval', '-ui', action='store_true')
 parser.add_argument('--update-estimate', '-ue', action='store_true')
+parser.add_argument('--rebuild-release-windows', '-rw', action='store_true',
+                    help='Rebuild release windows of the given manga or every manga if no manga is given')
 parser.add_argument('--production', '-p', action='store_true')
 
 args = parser.parse_args()
 
+if args.manga is None and (args.update_interval or args.update_estimate):
+    parser.error('--manga is required when updating interval or estimate')
+
 if args.production:
     logger.warning('using production environment. Type yes to continue')
     resp = input()
@@ -34,6 +39,18 @@ with scheduler.conn() as conn:
                 logger.info(f'Updating interval for {args.manga}')
                 dbutil.update_chapter_interval(args.manga, cur=cur)
 
+            if args.rebuild_release_windows:
+                if args.manga is not None:
+                    manga_ids = [args.manga]
+                else:
+                    cur.execute('SELECT manga_id FROM manga ORDER BY manga_id')
+                    manga_ids = [row['manga_id'] for row in cur.fetchall()]
+
+                logger.info(f'Rebuilding release windows of {len(manga_ids)} manga')
+                batch_size = 1000
+                for i in range(0, len(manga_ids), batch_size):
+                    dbutil.rebuild_release_windows(manga_ids[i:i+batch_size], cur=cur)
+
             if args.update_estimate:
                 logger.info(f'Updating estimate for {args.manga}')
                 dbutil.update_estimated_release(args.manga, cur=cur)
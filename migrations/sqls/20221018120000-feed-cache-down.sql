@@ -0,0 +1 @@
+DROP TABLE feed_cache;
@@ -0,0 +1,7 @@
+CREATE TABLE feed_cache (
+    feed_url      TEXT PRIMARY KEY,
+    etag          TEXT DEFAULT NULL,
+    last_modified TEXT DEFAULT NULL,
+    content_hash  TEXT DEFAULT NULL,
+    last_check    TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
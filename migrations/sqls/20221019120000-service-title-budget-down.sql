@@ -0,0 +1,2 @@
+ALTER TABLE service_config DROP COLUMN title_budget;
+ALTER TABLE service_config DROP COLUMN title_budget_refill;
@@ -0,0 +1,2 @@
+ALTER TABLE service_config ADD COLUMN title_budget SMALLINT NOT NULL DEFAULT 6;
+ALTER TABLE service_config ADD COLUMN title_budget_refill INTERVAL NOT NULL DEFAULT INTERVAL '10 minutes';
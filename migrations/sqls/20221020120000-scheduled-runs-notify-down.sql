@@ -0,0 +1,2 @@
+DROP TRIGGER IF EXISTS scheduled_runs_notify ON scheduled_runs;
+DROP FUNCTION IF EXISTS notify_scheduled_run();
@@ -0,0 +1,9 @@
+CREATE OR REPLACE FUNCTION notify_scheduled_run() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('scheduled_runs', json_build_object('manga_id', NEW.manga_id, 'service_id', NEW.service_id)::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER scheduled_runs_notify AFTER INSERT ON scheduled_runs
+    FOR EACH ROW EXECUTE FUNCTION notify_scheduled_run();
@@ -0,0 +1 @@
+DROP TABLE manga_release_intervals;
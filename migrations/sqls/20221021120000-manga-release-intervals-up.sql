@@ -0,0 +1,8 @@
+CREATE TABLE manga_release_intervals (
+    manga_id        INT PRIMARY KEY REFERENCES manga ON DELETE CASCADE,
+    -- Latest consecutive whole chapters and their release dates, newest first
+    chapter_numbers INT[] NOT NULL,
+    release_dates   TIMESTAMP WITH TIME ZONE[] NOT NULL,
+    -- Rounded intervals in seconds between the latest consecutive whole chapters, oldest first
+    intervals       INT[] NOT NULL DEFAULT '{}'
+);
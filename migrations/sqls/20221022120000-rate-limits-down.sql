@@ -0,0 +1 @@
+DROP TABLE rate_limits;
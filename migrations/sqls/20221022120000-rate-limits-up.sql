@@ -0,0 +1,7 @@
+-- Token buckets of rate limits shared between scraper processes
+CREATE TABLE rate_limits (
+    host          TEXT PRIMARY KEY,
+    tokens        DOUBLE PRECISION         NOT NULL,
+    updated_at    TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT clock_timestamp(),
+    blocked_until TIMESTAMP WITH TIME ZONE DEFAULT NULL
+);
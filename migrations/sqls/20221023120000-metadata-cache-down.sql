@@ -0,0 +1 @@
+DROP TABLE metadata_cache;
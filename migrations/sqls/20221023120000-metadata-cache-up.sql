@@ -0,0 +1,9 @@
+-- Content hashes of the manga metadata fetched from a service
+CREATE TABLE metadata_cache (
+    service_id   SMALLINT                 NOT NULL REFERENCES services ON DELETE CASCADE,
+    title_id     TEXT                     NOT NULL,
+    content_hash TEXT                     NOT NULL,
+    last_check   TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_update  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (service_id, title_id)
+);
@@ -0,0 +1 @@
+DROP FUNCTION ingest_chapters(INT, TEXT[], TEXT[], TEXT[], INT[], SMALLINT[], TEXT[], TIMESTAMP WITH TIME ZONE[], INT[]);
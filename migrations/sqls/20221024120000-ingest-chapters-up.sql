@@ -0,0 +1,97 @@
+-- Adds a batch of parsed chapters of a single service in one call.
+-- Titles are resolved to existing manga and new titles get their manga and manga_service rows.
+-- Returns one row for each title of the batch with chapter_id set to NULL and one row
+-- for each inserted chapter. Chapters of titles that are not returned were not added.
+CREATE OR REPLACE FUNCTION ingest_chapters(
+    p_service_id          INT,
+    p_title_ids           TEXT[],
+    p_manga_titles        TEXT[],
+    p_titles              TEXT[],
+    p_chapter_numbers     INT[],
+    p_chapter_decimals    SMALLINT[],
+    p_chapter_identifiers TEXT[],
+    p_release_dates       TIMESTAMP WITH TIME ZONE[],
+    p_group_ids           INT[]
+)
+    RETURNS TABLE (manga_id INT, title_id TEXT, new_manga_title TEXT, service_added BOOLEAN,
+                   chapter_id INT, chapter_number INT, chapter_decimal SMALLINT,
+                   release_date TIMESTAMP WITH TIME ZONE, chapter_identifier TEXT) AS
+$$
+#variable_conflict use_column
+BEGIN
+    CREATE TEMPORARY TABLE ingest_titles (
+        title_id    TEXT PRIMARY KEY,
+        manga_title TEXT,
+        manga_id    INT,
+        existing    BOOLEAN NOT NULL DEFAULT FALSE,
+        created     BOOLEAN NOT NULL DEFAULT FALSE
+    ) ON COMMIT DROP;
+
+    INSERT INTO ingest_titles (title_id, manga_title)
+    SELECT DISTINCT ON (t.title_id) t.title_id, t.manga_title
+    FROM unnest(p_title_ids, p_manga_titles) AS t(title_id, manga_title)
+    ORDER BY t.title_id;
+
+    -- Titles that already exist on the service
+    UPDATE ingest_titles it SET manga_id=ms.manga_id, existing=TRUE
+    FROM manga_service ms
+    WHERE ms.service_id=p_service_id AND ms.title_id=it.title_id;
+
+    -- New titles sharing a name within the batch are left to be resolved manually
+    DELETE FROM ingest_titles it
+    WHERE NOT it.existing AND (it.manga_title IS NULL OR LOWER(it.manga_title) IN (
+        SELECT LOWER(t.manga_title) FROM ingest_titles t
+        WHERE NOT t.existing
+        GROUP BY LOWER(t.manga_title)
+        HAVING COUNT(*) > 1
+    ));
+
+    -- New titles with a single manga of the same name that is not on this service use that manga
+    UPDATE ingest_titles it SET manga_id=m.manga_id
+    FROM (
+        SELECT LOWER(m.title) AS title, MIN(m.manga_id) AS manga_id
+        FROM manga m
+        LEFT JOIN manga_service ms ON ms.service_id=p_service_id AND ms.manga_id=m.manga_id
+        WHERE ms.manga_id IS NULL AND LOWER(m.title) IN (SELECT LOWER(t.manga_title) FROM ingest_titles t WHERE NOT t.existing)
+        GROUP BY LOWER(m.title)
+        HAVING COUNT(*) = 1
+    ) m
+    WHERE NOT it.existing AND LOWER(it.manga_title)=m.title;
+
+    WITH inserted AS (
+        INSERT INTO manga (title)
+        SELECT t.manga_title FROM ingest_titles t WHERE t.manga_id IS NULL
+        RETURNING manga.manga_id, manga.title
+    )
+    UPDATE ingest_titles it SET manga_id=i.manga_id, created=TRUE
+    FROM inserted i
+    WHERE it.manga_id IS NULL AND it.manga_title=i.title;
+
+    INSERT INTO manga_service (manga_id, service_id, title_id, disabled)
+    SELECT t.manga_id, p_service_id, t.title_id, TRUE
+    FROM ingest_titles t
+    WHERE NOT t.existing;
+
+    RETURN QUERY
+    WITH inserted AS (
+        INSERT INTO chapters AS c (manga_id, service_id, title, chapter_number, chapter_decimal,
+                                   chapter_identifier, release_date, group_id)
+        SELECT t.manga_id, p_service_id, ch.title, ch.chapter_number, ch.chapter_decimal,
+               ch.chapter_identifier, ch.release_date, ch.group_id
+        FROM unnest(p_title_ids, p_titles, p_chapter_numbers, p_chapter_decimals,
+                    p_chapter_identifiers, p_release_dates, p_group_ids)
+            AS ch(title_id, title, chapter_number, chapter_decimal, chapter_identifier, release_date, group_id)
+        INNER JOIN ingest_titles t ON t.title_id=ch.title_id
+        ON CONFLICT DO NOTHING
+        RETURNING c.chapter_id, c.manga_id, c.chapter_number, c.chapter_decimal, c.release_date, c.chapter_identifier
+    )
+    SELECT t.manga_id, t.title_id, CASE WHEN t.created THEN t.manga_title END, NOT t.existing,
+           NULL::INT, NULL::INT, NULL::SMALLINT, NULL::TIMESTAMP WITH TIME ZONE, NULL::TEXT
+    FROM ingest_titles t
+    UNION ALL
+    SELECT i.manga_id, NULL, NULL, NULL, i.chapter_id, i.chapter_number, i.chapter_decimal, i.release_date, i.chapter_identifier
+    FROM inserted i;
+
+    DROP TABLE ingest_titles;
+END
+$$ LANGUAGE plpgsql;
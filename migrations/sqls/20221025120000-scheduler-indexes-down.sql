@@ -0,0 +1,7 @@
+CREATE INDEX chapters_manga_id_index ON chapters (manga_id);
+
+DROP INDEX chapters_manga_id_release_date_index;
+DROP INDEX chapters_manga_id_service_id_index;
+DROP INDEX chapters_whole_chapters_index;
+DROP INDEX user_follows_manga_id_index;
+DROP INDEX manga_service_due_index;
@@ -0,0 +1,13 @@
+-- Due titles of a service are found by their next update
+CREATE INDEX manga_service_due_index ON manga_service (service_id, next_update) WHERE NOT disabled;
+
+-- Follower count of each due title. The unique keys are partial and cannot be used for it
+CREATE INDEX user_follows_manga_id_index ON user_follows (manga_id);
+
+-- Whole chapters of a manga used for release intervals and the latest chapter
+CREATE INDEX chapters_whole_chapters_index ON chapters (manga_id, chapter_number, release_date) WHERE chapter_decimal IS NULL;
+CREATE INDEX chapters_manga_id_service_id_index ON chapters (manga_id, service_id);
+CREATE INDEX chapters_manga_id_release_date_index ON chapters (manga_id, release_date);
+
+-- Covered by the composite indexes
+DROP INDEX chapters_manga_id_index;
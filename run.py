@@ -1,9 +1,11 @@
+import asyncio
 import os
 
 import sentry_sdk
 
 import setup_logging
 from src.scheduler import UpdateScheduler
+from src.utils import sessions
 from src.utils.utilities import utcnow
 
 logger = setup_logging.setup()
@@ -18,10 +20,16 @@ else:
 
 scheduler = UpdateScheduler()
 try:
-    logger.debug("Next update in %s", scheduler.run_once()-utcnow())
+    if os.environ.get('SCHEDULER_ASYNC'):
+        next_update = asyncio.run(scheduler.run_once_async())
+    else:
+        next_update = scheduler.run_once()
+    logger.debug("Next update in %s", next_update-utcnow())
 except:
     logger.exception('Failed to run once')
 
+sessions.log_host_stats()
+sessions.close_sessions()
 scheduler.es.close()
 scheduler.pool.close()
 sentry_sdk.flush()
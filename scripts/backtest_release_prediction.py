@@ -0,0 +1,81 @@
+"""
+Replays the chapter history of manga in the database to compare release prediction
+based polling against polling at a fixed interval.
+"""
+import argparse
+import statistics
+from datetime import timedelta
+from typing import Dict, List
+
+from src.scheduler import UpdateScheduler
+from src.utils.release_interval import ChapterRelease
+from src.utils.release_prediction import (
+    BacktestResult, PollStrategy, backtest, predict_next_poll
+)
+
+
+def get_chapters(limit: int, min_chapters: int) -> Dict[int, List[ChapterRelease]]:
+    sql = '''
+        SELECT manga_id, chapter_number, MIN(release_date) as release_date FROM chapters
+        WHERE chapter_decimal IS NULL AND manga_id IN (
+            SELECT manga_id FROM chapters
+            WHERE chapter_decimal IS NULL
+            GROUP BY manga_id
+            HAVING COUNT(DISTINCT chapter_number) >= %s
+            ORDER BY MAX(release_date) DESC
+            LIMIT %s
+        )
+        GROUP BY manga_id, chapter_number
+    '''
+
+    chapters: Dict[int, List[ChapterRelease]] = {}
+    with UpdateScheduler().conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (min_chapters, limit))
+            for row in cur:
+                chapters.setdefault(row['manga_id'], []).append((row['chapter_number'], row['release_date']))
+
+    return chapters
+
+
+def report(name: str, results: List[BacktestResult]) -> None:
+    polls = sum(r.polls for r in results)
+    found = sum(r.chapters for r in results)
+    latencies = [latency.total_seconds() / 3600 for r in results for latency in r.latencies]
+    if not found:
+        print(f'{name}: no chapters found')
+        return
+
+    print(f'{name}: {polls} polls, {found} chapters, {polls / found:.2f} polls per chapter, '
+          f'detection latency mean {statistics.mean(latencies):.2f}h '
+          f'median {statistics.median(latencies):.2f}h '
+          f'max {max(latencies):.2f}h')
+
+
+def main(limit: int, min_chapters: int, check_interval: timedelta, warmup: int) -> None:
+    chapters = get_chapters(limit, min_chapters)
+    print(f'Replaying the releases of {len(chapters)} manga with a check interval of {check_interval}')
+
+    strategies: Dict[str, PollStrategy] = {
+        'Fixed interval': lambda history, now: now + check_interval,
+        'Predicted': lambda history, now: predict_next_poll(history, now, check_interval),
+    }
+
+    for name, strategy in strategies.items():
+        report(name, [backtest(c, strategy, warmup) for c in chapters.values()])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--limit', default=500, type=int,
+                        help='Maximum amount of manga replayed')
+    parser.add_argument('--min-chapters', default=10, type=int,
+                        help='Minimum amount of whole chapters a manga must have to be replayed')
+    parser.add_argument('--check-interval', default=1, type=float,
+                        help='Check interval of the service in hours')
+    parser.add_argument('--warmup', default=5, type=int,
+                        help='Amount of chapters used as the initial history of a manga')
+
+    parsed = parser.parse_args()
+
+    main(parsed.limit, parsed.min_chapters, timedelta(hours=parsed.check_interval), parsed.warmup)
@@ -0,0 +1,55 @@
+"""
+Measures the per chapter cost of parsing MangaDex chapter pages with the pydantic
+models and with the slim chapter records. Uses the recorded api responses of the tests
+or the given json files.
+"""
+import argparse
+import json
+import os
+import timeit
+from typing import List
+
+from src.scrapers.mangadex import MangaDex
+from src.scrapers.mangadex.mangadex_api import ChapterResult, json_loads, parse_models, parse_chapter_records
+
+DEFAULT_PAYLOAD = os.path.join(os.path.dirname(__file__), '..', 'src', 'tests', 'scrapers', 'mangadex', 'api_data', 'chapters.json')
+
+
+def load_page(paths: List[str], page_size: int) -> bytes:
+    chapters = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            chapters.extend(json.load(f)['data'])
+
+    # Repeat the recorded chapters to get a full page
+    data = [chapters[i % len(chapters)] for i in range(page_size)]
+    return json.dumps({'data': data, 'limit': page_size, 'offset': 0, 'total': page_size}).encode('utf-8')
+
+
+def parse_models_page(content: bytes) -> None:
+    MangaDex.parse_feed(parse_models(json.loads(content)['data'], ChapterResult))
+
+
+def parse_records_page(content: bytes) -> None:
+    MangaDex.parse_feed(parse_chapter_records(json_loads(content)['data']))
+
+
+def main(paths: List[str], page_size: int, repeat: int) -> None:
+    content = load_page(paths, page_size)
+    print(f'Parsing {repeat} pages of {page_size} chapters ({len(content)} bytes per page) with {json_loads.__module__}')
+
+    for name, parse in (('Models', parse_models_page), ('Records', parse_records_page)):
+        seconds = min(timeit.repeat(lambda: parse(content), number=repeat, repeat=3))
+        print(f'{name}: {seconds / (repeat * page_size) * 1e6:.1f}us per chapter')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('payloads', nargs='*', default=[DEFAULT_PAYLOAD],
+                        help='Recorded MangaDex chapter list responses')
+    parser.add_argument('--page-size', default=100, type=int)
+    parser.add_argument('--repeat', default=50, type=int)
+
+    parsed = parser.parse_args()
+
+    main(parsed.payloads, parsed.page_size, parsed.repeat)
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import select
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import psycopg
+from psycopg import Connection, Notify
+
+from src.scheduler import UpdateScheduler
+from src.utils.utilities import utcnow
+
+logger = logging.getLogger('debug')
+
+SCHEDULED_RUNS_CHANNEL = 'scheduled_runs'
+"""Channel notified by the database when a scheduled run is added"""
+
+
+class UpdateDaemon:
+    """
+    Runs the update scheduler continuously in a single process so the connection pool,
+    http sessions and caches stay alive between runs. Sleeps until the next update
+    returned by the scheduler and wakes early when a scheduled run is added.
+    """
+    MIN_SLEEP = 5.0
+    """Minimum amount of seconds slept between runs"""
+    MAX_SLEEP = 600.0
+    """Maximum amount of seconds slept between runs"""
+    WAIT_SLICE = 1.0
+    """Interval in seconds between checks for a stop request while sleeping"""
+
+    def __init__(self, scheduler: UpdateScheduler, use_async: bool = False):
+        self.scheduler = scheduler
+        self.use_async = use_async
+        self._listen_conn: Optional[Connection] = None
+        self._stop = threading.Event()
+        self._notified = threading.Event()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def stop(self, *_) -> None:
+        """
+        Requests the daemon to stop after the current run. Can be used as a signal handler.
+        """
+        logger.info('Stopping update daemon')
+        self._stop.set()
+
+    def _on_notify(self, notify: Notify) -> None:
+        logger.debug(f'Received notification on {notify.channel}: {notify.payload}')
+        self._notified.set()
+
+    def listen(self) -> Connection:
+        """
+        Returns the connection listening for scheduled run notifications.
+        Connects if the connection does not exist or was closed.
+        """
+        if self._listen_conn is not None and not self._listen_conn.closed:
+            return self._listen_conn
+
+        conn = psycopg.connect(autocommit=True, **self.scheduler.db_config)
+        conn.add_notify_handler(self._on_notify)
+        conn.execute(f'LISTEN {SCHEDULED_RUNS_CHANNEL}')
+        self._listen_conn = conn
+        return conn
+
+    def close(self) -> None:
+        if self._listen_conn is not None:
+            self._listen_conn.close()
+            self._listen_conn = None
+
+    def get_sleep_time(self, next_update: Optional[datetime]) -> float:
+        if next_update is None:
+            return self.MAX_SLEEP
+
+        seconds = (next_update - utcnow()).total_seconds()
+        return min(max(seconds, self.MIN_SLEEP), self.MAX_SLEEP)
+
+    def _poll_notifications(self, timeout: float) -> None:
+        try:
+            conn = self.listen()
+            # Notifications are delivered to the notify handler when the connection processes input
+            if select.select([conn.fileno()], [], [], timeout)[0]:
+                conn.execute('SELECT 1')
+        except psycopg.OperationalError:
+            logger.exception('Listen connection failed. Reconnecting')
+            self.close()
+            time.sleep(timeout)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Waits until the timeout has passed, a notification is received or the daemon is stopped.
+        Returns True if woken up by a notification.
+        """
+        deadline = time.monotonic() + timeout
+        while not self.stopped:
+            if self._notified.is_set():
+                self._notified.clear()
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            self._poll_notifications(min(remaining, self.WAIT_SLICE))
+
+        return False
+
+    def run_once(self) -> Optional[datetime]:
+        try:
+            if self.use_async:
+                return asyncio.run(self.scheduler.run_once_async())
+            return self.scheduler.run_once()
+        except:
+            logger.exception('Failed to run once')
+            return None
+
+    def run_scheduled_runs(self) -> None:
+        try:
+            self.scheduler.run_scheduled_runs()
+        except:
+            logger.exception('Failed to do scheduled runs')
+
+    def get_next_scheduled_run(self) -> Optional[datetime]:
+        try:
+            return self.scheduler.get_next_scheduled_run()
+        except:
+            logger.exception('Failed to get next scheduled run')
+            return None
+
+    def run(self) -> None:
+        """
+        Runs full update cycles until stopped. Scheduled runs added between cycles
+        are done as soon as they are added or their service comes off cooldown.
+        """
+        logger.info('Starting update daemon')
+        try:
+            self.listen()
+        except psycopg.OperationalError:
+            logger.exception('Failed to listen for scheduled runs')
+
+        next_run = utcnow()
+        try:
+            while not self.stopped:
+                if utcnow() >= next_run:
+                    next_update = self.run_once()
+                    next_run = utcnow() + timedelta(seconds=self.get_sleep_time(next_update))
+                else:
+                    self.run_scheduled_runs()
+
+                if self.stopped:
+                    break
+
+                wake_at = next_run
+                next_scheduled = self.get_next_scheduled_run()
+                if next_scheduled is not None:
+                    wake_at = min(wake_at, max(next_scheduled, utcnow() + timedelta(seconds=self.MIN_SLEEP)))
+
+                timeout = (wake_at - utcnow()).total_seconds()
+                logger.debug(f'Next update in {timeout:.0f}s')
+                if self.wait(timeout):
+                    logger.info('Scheduled run added')
+        finally:
+            self.close()
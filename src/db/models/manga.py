@@ -1,5 +1,5 @@
 from datetime import timedelta, datetime
-from typing import Optional, Type, TYPE_CHECKING
+from typing import Optional, Type, TYPE_CHECKING, List
 
 from psycopg import Connection
 from pydantic import BaseModel, Field
@@ -29,6 +29,27 @@ class MangaForNotifications(BaseModel):
     service_id: int
 
 
+class MangaReleaseWindow(BaseModel):
+    """
+    Latest consecutive whole chapters of a manga and the rounded release intervals
+    in seconds between them. Intervals are ordered from oldest to newest
+    """
+    manga_id: int
+    chapter_numbers: List[int]
+    """Chapter numbers ordered from newest to oldest"""
+    release_dates: List[datetime]
+    """Release dates of the chapters in chapter_numbers"""
+    intervals: List[int] = Field(default_factory=list)
+
+    @property
+    def latest_chapter(self) -> int:
+        return self.chapter_numbers[0]
+
+    @property
+    def latest_release(self) -> datetime:
+        return self.release_dates[0]
+
+
 class MangaInfo(BaseModel):
     manga_id: int
     cover: Optional[str] = None
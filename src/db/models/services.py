@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class Service(BaseModel):
@@ -28,4 +28,28 @@ class ServiceConfig(BaseModel):
     check_interval: timedelta = timedelta(hours=1)
     scheduled_run_limit: int = 5
     scheduled_runs_enabled: bool = True
-    scheduled_run_min_interval: timedelta = timedelta(hours=1)
+    scheduled_run_min_interval: timedelta = Field(timedelta(hours=1), alias='scheduled_run_interval')
+    title_budget: int = 6
+    """Maximum amount of titles checked from this service in a single run"""
+    title_budget_refill: timedelta = timedelta(minutes=10)
+    """Time it takes for an empty title budget to refill completely"""
+
+    class Config:
+        allow_population_by_field_name = True
+
+
+class FeedCache(BaseModel):
+    feed_url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+
+
+class MetadataCache(BaseModel):
+    service_id: int
+    title_id: str
+    content_hash: str
+    last_check: datetime
+    """When the metadata was last fetched"""
+    last_update: datetime
+    """When the metadata was last written to the database"""
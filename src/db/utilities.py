@@ -86,3 +86,74 @@ def execute_values(cur: psycopg.Cursor[T],
         return result
 
     return None
+
+
+def unnest_template(types: Sequence[str]) -> str:
+    """
+    Returns an unnest call with one typed array parameter per column.
+    e.g. ["int", "text"] returns "unnest(%s::int[], %s::text[])"
+    """
+    return f'unnest({", ".join(f"%s::{t}[]" for t in types)})'
+
+
+@overload
+def execute_unnest(cur: psycopg.Cursor[T],
+                   sql: str,
+                   values: Sequence[Sequence[Any]],
+                   types: Sequence[str],
+                   *,
+                   fetch: Literal[False] = False,
+                   prepare: bool | None = None) -> None: ...
+
+
+@overload
+def execute_unnest(cur: psycopg.Cursor[T],
+                   sql: str,
+                   values: Sequence[Sequence[Any]],
+                   types: Sequence[str],
+                   *,
+                   fetch: Literal[True],
+                   prepare: bool | None = None) -> list[T]: ...
+
+
+@overload
+def execute_unnest(cur: psycopg.Cursor[T],
+                   sql: str,
+                   values: Sequence[Sequence[Any]],
+                   types: Sequence[str],
+                   *,
+                   fetch: bool = False,
+                   prepare: bool | None = None) -> list[T] | None: ...
+
+
+def execute_unnest(cur: psycopg.Cursor[T],
+                   sql: str,
+                   values: Sequence[Sequence[Any]],
+                   types: Sequence[str],
+                   *,
+                   fetch: bool = False,
+                   prepare: bool | None = None) -> list[T] | None:
+    """
+    Execute multiple values as arrays passed to unnest, one array per column.
+    Unlike execute_values the statement text does not depend on the amount of values,
+    so it can be prepared once and reused.
+    Args:
+        cur: Cursor object
+        sql: The sql statement with a single "%s" where the unnest call is placed. e.g. "SELECT * FROM %s"
+        values: List of values
+        types: Postgres types of the columns of the values
+        fetch: Whether to fetch the results or not.
+        prepare: Passed to execute. By default the statement is prepared after it has been executed a few times.
+    """
+    if not values:
+        return [] if fetch else None
+
+    columns = [list(col) for col in zip(*values)]
+    if len(columns) != len(types):
+        raise ValueError(f'Expected {len(types)} columns but got {len(columns)}')
+
+    cur.execute(sql % unnest_template(types), columns, prepare=prepare)
+    if fetch:
+        return cur.fetchall()
+
+    return None
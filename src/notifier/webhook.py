@@ -2,13 +2,13 @@ import json
 import logging
 from typing import List, Tuple, Dict
 
-import requests
 from pydantic import Field
 
 from src.db.models.notifications import InputField, NotificationOptions
 from src.notifier.base_notifier import (
     NotifierBase, NotificationChapter, BaseEmbedInputs
 )
+from src.utils import sessions
 
 logger = logging.getLogger('debug')
 
@@ -80,7 +80,7 @@ class WebhookNotifier(NotifierBase):
             data[chapters_array_key] = chapters_array
 
             try:
-                r = requests.post(options.destination, json=data)
+                r = sessions.post(options.destination, json=data)
                 times_executed += 1
                 if not r.ok:
                     return times_executed, False
@@ -1,15 +1,16 @@
+import asyncio
 import logging
 import os
 import random
 import time
 from collections import Counter
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, Future
 from contextlib import contextmanager
-from datetime import timedelta
+from datetime import timedelta, datetime
 from itertools import groupby
 from operator import attrgetter
-from typing import Type, ContextManager, TypedDict, Optional, Collection, List, \
-    Set, cast, Tuple, Dict
+from typing import Any, Type, ContextManager, TypedDict, Optional, Collection, List, \
+    Set, cast, Tuple, Dict, Iterable
 
 import psycopg
 import psycopg.rows
@@ -24,9 +25,15 @@ from src.elasticsearch.configuration import get_client
 from src.elasticsearch.methods import ElasticMethods
 from src.notifier import NOTIFIERS
 from src.scrapers import SCRAPERS, SCRAPERS_ID
-from src.scrapers.base_scraper import BaseScraper
-from src.utils.dbutils import DbUtil
-from src.utils.utilities import inject_service_values, utcnow
+from src.scrapers.base_scraper import BaseScraper, ScrapeServiceRetVal, \
+    SeriesFetchResult, SeriesInfo, SeriesBatchFetchResult
+from src.utils.dbutils import DbUtil, DeferredWrites
+from src.utils import rate_limit
+from src.utils.cache import invalidate_identity_caches, invalidate_on_error
+from src.utils.pipeline import PersistPipeline
+from src.utils.release_prediction import predict_next_poll
+from src.utils.token_bucket import TokenBucket
+from src.utils.utilities import inject_service_values, utcnow, LatestChapters
 
 logger = logging.getLogger('debug')
 db_logger = logging.getLogger('database')
@@ -53,9 +60,39 @@ class LoggingCursor(Cursor):
 
 class UpdateScheduler:
     MAX_POOLS = 5
+    PERSIST_WORKERS = 2
+    """Amount of threads adding the results of fetch stages to the database"""
+    PERSIST_QUEUE_SIZE = 10
+    """Maximum amount of fetch results waiting to be added to the database"""
+    RATE_LIMIT_POOL_SIZE = 2
+    """Maximum amount of connections used for shared rate limits"""
+    RATE_LIMIT_POOL_TIMEOUT = 5
+    """Seconds to wait for a rate limit connection before falling back to the local limit"""
+
+    NEXT_UPDATE_SQL = '''
+    SELECT MIN(t.update) as update FROM (
+        SELECT
+           LEAST(
+               GREATEST(
+                   (SELECT MIN(ms.next_update) FROM manga_service ms WHERE ms.service_id = s.service_id AND NOT ms.disabled),
+                   s.disabled_until
+               ),
+               (
+                   SELECT MIN(GREATEST(sw.next_update, s2.disabled_until))
+                   FROM service_whole sw
+                       INNER JOIN services s2 ON s2.service_id = sw.service_id
+                   WHERE s2.disabled=FALSE
+               )
+           ) as update
+        FROM services s
+        WHERE s.disabled=FALSE
+          AND EXISTS (SELECT 1 FROM manga_service ms WHERE ms.service_id = s.service_id AND NOT ms.disabled)
+    ) as t
+    '''
+    """Time of the next required update. The per service minimum is read from manga_service_due_index"""
 
     def __init__(self):
-        config = {
+        self.db_config: Dict[str, Any] = {
             'host': os.environ['DB_HOST'],
             'dbname': os.environ['DB_NAME'],
             'user': os.environ['DB_USER'],
@@ -66,12 +103,32 @@ class UpdateScheduler:
 
         self.pool: ConnectionPool = ConnectionPool(
             min_size=1,
-            max_size=self.MAX_POOLS,
-            kwargs=config
+            max_size=self.MAX_POOLS + self.PERSIST_WORKERS,
+            kwargs=self.db_config
         )
         self.thread_pool = ThreadPoolExecutor(max_workers=self.MAX_POOLS-1)
+        self.persist_pipeline = PersistPipeline(self.PERSIST_WORKERS, self.PERSIST_QUEUE_SIZE)
+        self.title_budgets: Dict[int, TokenBucket] = {}
+        self.latest_chapters = LatestChapters()
+        """Latest chapters found during the current run. Written once in finish_run"""
+        self.deferred_writes = DeferredWrites()
+        """Bookkeeping updates of the current run. Written once in finish_run"""
         self._es: Elasticsearch = get_client()
 
+        self.rate_limit_pool: Optional[ConnectionPool] = None
+        """
+        Separate autocommit connections for shared rate limits so requests never wait
+        for connections held by scrapers and failures do not roll back their transactions
+        """
+        if os.environ.get('SHARED_RATE_LIMITS'):
+            self.rate_limit_pool = ConnectionPool(
+                min_size=1,
+                max_size=self.RATE_LIMIT_POOL_SIZE,
+                kwargs={**self.db_config, 'autocommit': True},
+                timeout=self.RATE_LIMIT_POOL_TIMEOUT
+            )
+            rate_limit.share_rate_limits(self.rate_limit_pool.connection)
+
         with self.conn() as conn:
             inject_service_values(DbUtil(conn, self.es_methods))
 
@@ -94,6 +151,7 @@ class UpdateScheduler:
                 yield conn
             except Exception:
                 conn.rollback()
+                invalidate_identity_caches()
                 raise
             else:
                 conn.commit()
@@ -102,12 +160,24 @@ class UpdateScheduler:
 
         return wrapper()
 
+    def scraper_dbutil(self, conn: Connection) -> DbUtil:
+        """
+        Returns a DbUtil for scrapers of a scheduled update. Latest chapters
+        of the updated manga and bookkeeping updates are collected and written in finish_run.
+        """
+        return DbUtil(conn, self.es_methods, self.latest_chapters, self.deferred_writes)
+
     def do_scheduled_runs(self) -> Tuple[List[int], List[int]]:
+        """
+        Runs the scheduled runs that are not on cooldown. Runs are claimed and the
+        services put on cooldown before scraping, after which the runs are
+        scraped concurrently. At most scheduled_run_limit runs are done for a service at once.
+        """
+        runs: List[Tuple[int, int]] = []
+
         with self.conn() as conn:
             dbutil = DbUtil(conn, self.es_methods)
             delete = []
-            manga_ids = []
-            chapter_ids = []
             service_counter: Counter = Counter()
 
             disabled_services = set(map(attrgetter('service_id'), filter(attrgetter('disabled'), dbutil.get_services())))
@@ -138,17 +208,90 @@ class UpdateScheduler:
                     delete.append((manga_id, service_id))
                     continue
 
-                retval = self.force_run(service_id, manga_id)
                 delete.append((manga_id, service_id))
-                manga_ids.append(manga_id)
-                if retval:
-                    _, chs = retval
-                    chapter_ids.extend(chs)
+                runs.append((service_id, manga_id))
 
             dbutil.delete_scheduled_runs(delete)
             dbutil.update_scheduled_run_disabled(list(service_counter.keys()))
 
-            return manga_ids, chapter_ids
+        futures = [self.thread_pool.submit(self.force_run, service_id, manga_id) for service_id, manga_id in runs]
+
+        manga_ids = []
+        chapter_ids = []
+        for (_, manga_id), fut in zip(runs, futures):
+            manga_ids.append(manga_id)
+            retval = fut.result()
+            if retval:
+                _, chs = retval
+                chapter_ids.extend(chs)
+
+        return manga_ids, chapter_ids
+
+    def run_scheduled_runs(self) -> datetime:
+        """
+        Does the scheduled runs outside of a full update cycle.
+        Returns the time of the next required update.
+        """
+        manga_ids, chapter_ids = self.do_scheduled_runs()
+        return self._finish_run_pooled(set(manga_ids), chapter_ids)
+
+    def get_next_scheduled_run(self) -> Optional[datetime]:
+        """
+        Returns the time the earliest waiting scheduled run can be done at
+        """
+        with self.conn() as conn:
+            return DbUtil(conn, None).get_next_scheduled_run()
+
+    def scrape_manga(self, scraper: BaseScraper, service_id: int,
+                     info: MangaServiceInfo,
+                     fetched: Optional[SeriesFetchResult] = None) -> Tuple[Optional[Set[int]], bool]:
+        """
+        Scrapes a single title using the given scraper. If the result of the fetch stage
+        is given only the persist stage of the scrape is done.
+        Returns the ids of the new chapters and whether the scrape failed.
+        """
+        title_id = info['title_id']
+        manga_id = info['manga_id']
+        logger.info(f'Updating {title_id} on service {service_id}')
+
+        try:
+            with invalidate_on_error(), scraper.conn.transaction():
+                if fetched is not None:
+                    res = scraper.persist_series(fetched)
+                else:
+                    res = scraper.scrape_series(title_id, service_id, manga_id, info['feed_url'])
+        except psycopg.Error:
+            logger.exception(f'Database error while updating manga {title_id} on service {service_id}')
+            scraper.dbutil.update_manga_next_update(service_id, manga_id, scraper.next_update())
+            return None, True
+        except:
+            logger.exception(f'Unknown error while updating manga {title_id} on service {service_id}')
+            scraper.dbutil.update_manga_next_update(service_id, manga_id, scraper.next_update())
+            return None, True
+
+        if res is None:
+            logger.error(f'Failed to scrape series {title_id} {manga_id}')
+            return None, True
+
+        self.schedule_next_updates(scraper, service_id, [manga_id])
+        return res, False
+
+    @staticmethod
+    def schedule_next_updates(scraper: BaseScraper, service_id: int, manga_ids: Collection[int]) -> None:
+        """
+        Schedules the next updates of successfully updated titles around their predicted releases.
+        Titles without enough release history are updated again after the check interval of the service.
+        """
+        now = utcnow()
+        check_interval = scraper.min_update_interval()
+        try:
+            histories = scraper.dbutil.get_release_histories(manga_ids)
+            scraper.dbutil.update_predicted_next_updates(service_id, [
+                (manga_id, predict_next_poll(histories.get(manga_id), now, check_interval))
+                for manga_id in manga_ids
+            ])
+        except psycopg.Error:
+            logger.exception(f'Failed to schedule next updates on service {service_id}')
 
     # noinspection PyPep8Naming
     def scrape_service(self,
@@ -156,7 +299,7 @@ class UpdateScheduler:
                        Scraper: Type[BaseScraper],
                        manga_info: Collection[MangaServiceInfo]) -> Tuple[Set[int], List[int]]:
         with self.conn() as conn:
-            scraper = Scraper(conn, DbUtil(conn, self.es_methods))
+            scraper = Scraper(conn, self.scraper_dbutil(conn))
             rng = random.Random()
             manga_ids: Set[int] = set()
             chapter_ids: List[int] = []
@@ -164,26 +307,11 @@ class UpdateScheduler:
 
             idx = 0
             for info in manga_info:
-                title_id = info['title_id']
-                manga_id = info['manga_id']
-                feed_url = info['feed_url']
-                logger.info(f'Updating {title_id} on service {service_id}')
-                try:
-                    with conn.transaction():
-                        if res := scraper.scrape_series(title_id, service_id,
-                                                        manga_id, feed_url):
-                            manga_ids.add(manga_id)
-                            chapter_ids.extend(res)
-                        elif res is None:
-                            errors += 1
-                            logger.error(f'Failed to scrape series {title_id} {manga_id}')
-                except psycopg.Error:
-                    logger.exception(f'Database error while updating manga {title_id} on service {service_id}')
-                    scraper.dbutil.update_manga_next_update(service_id, manga_id, scraper.next_update())
-                    errors += 1
-                except:
-                    logger.exception(f'Unknown error while updating manga {title_id} on service {service_id}')
-                    scraper.dbutil.update_manga_next_update(service_id, manga_id, scraper.next_update())
+                res, failed = self.scrape_manga(scraper, service_id, info)
+                if res:
+                    manga_ids.add(info['manga_id'])
+                    chapter_ids.extend(res)
+                elif failed:
                     errors += 1
 
                 if errors > 1:
@@ -191,12 +319,277 @@ class UpdateScheduler:
 
                 idx += 1
                 if idx != len(manga_info):
-                    time.sleep(rng.randint(200, 1000)/100)
+                    time.sleep(Scraper.title_delay(rng))
 
             scraper.set_checked(service_id)
 
             return manga_ids, chapter_ids
 
+    @staticmethod
+    def fetch_manga(scraper: BaseScraper, service_id: int,
+                    info: MangaServiceInfo) -> Tuple[Optional[SeriesFetchResult], bool]:
+        """
+        Runs the network only fetch stage for a single title.
+        Returns the fetch result and whether fetching raised an error.
+        """
+        title_id = info['title_id']
+        manga_id = info['manga_id']
+        logger.info(f'Fetching {title_id} on service {service_id}')
+
+        try:
+            res = scraper.fetch_series(title_id, service_id, manga_id, info['feed_url'])
+        except:
+            logger.exception(f'Unknown error while fetching manga {title_id} on service {service_id}')
+            return None, True
+
+        if res is None:
+            logger.error(f'Failed to fetch series {title_id} {manga_id}')
+
+        return res, False
+
+    # noinspection PyPep8Naming
+    def fetch_service(self,
+                      service_id: int,
+                      Scraper: Type[BaseScraper],
+                      manga_info: Collection[MangaServiceInfo]) -> Tuple[Set[int], List[int]]:
+        """
+        Version of scrape_service for scrapers that support separate fetch and persist stages.
+        Titles are fetched without holding a database connection and the results are
+        added to the database by the persist pipeline.
+        """
+        # The fetch stage does not use the database
+        scraper = Scraper(None)
+        rng = random.Random()
+        manga_ids: Set[int] = set()
+        chapter_ids: List[int] = []
+        futures: List[Tuple[MangaServiceInfo, 'Future[Tuple[Optional[Set[int]], bool]]']] = []
+        errors = 0
+
+        for idx, info in enumerate(manga_info):
+            if idx:
+                time.sleep(Scraper.title_delay(rng))
+
+            fetched, raised = self.fetch_manga(scraper, service_id, info)
+            if fetched is not None:
+                futures.append((info, self.persist_pipeline.submit(
+                    self._scrape_manga_pooled, service_id, Scraper, info, fetched
+                )))
+            else:
+                errors += 1
+                if raised:
+                    self.persist_pipeline.submit(
+                        self._update_next_update_pooled, service_id, Scraper, info['manga_id']
+                    )
+
+            if errors > 1:
+                break
+
+        checked = self.persist_pipeline.submit(self._set_checked_pooled, service_id, Scraper)
+
+        for info, fut in futures:
+            res, _ = fut.result()
+            if res:
+                manga_ids.add(info['manga_id'])
+                chapter_ids.extend(res)
+
+        checked.result()
+        return manga_ids, chapter_ids
+
+    def persist_batch(self, scraper: BaseScraper, service_id: int,
+                      batch: SeriesBatchFetchResult) -> Tuple[Set[int], List[int]]:
+        """
+        Adds the fetch results of multiple titles to the database in a single batch.
+        Titles whose fetch raised an error are handled like in scrape_manga.
+        """
+        for manga_id in batch.errors:
+            scraper.dbutil.update_manga_next_update(service_id, manga_id, scraper.next_update())
+
+        fetched = batch.results
+        if not fetched:
+            return set(), []
+
+        try:
+            with invalidate_on_error(), scraper.conn.transaction():
+                retval = scraper.persist_series_batch(fetched)
+
+            if retval is None:
+                return set(), []
+
+            # Titles that failed to be fetched are left due like in scrape_manga
+            self.schedule_next_updates(scraper, service_id, [r.manga_id for r in fetched])
+            return set(retval.manga_ids), list(retval.chapter_ids)
+        except psycopg.Error:
+            logger.exception(f'Database error while updating {len(fetched)} manga on service {service_id}')
+        except:
+            logger.exception(f'Unknown error while updating {len(fetched)} manga on service {service_id}')
+
+        for result in fetched:
+            scraper.dbutil.update_manga_next_update(service_id, result.manga_id, scraper.next_update())
+
+        return set(), []
+
+    @staticmethod
+    def fetch_batch(scraper: BaseScraper, service_id: int,
+                    manga_info: Collection[MangaServiceInfo]) -> SeriesBatchFetchResult:
+        """
+        Runs the fetch stage for all of the titles at once. Failed titles count
+        towards the same error limit as in scrape_service.
+        """
+        logger.info(f'Fetching {len(manga_info)} titles on service {service_id}')
+        try:
+            return scraper.fetch_series_batch(service_id, [
+                SeriesInfo(info['title_id'], info['manga_id'], info['feed_url'])
+                for info in manga_info
+            ], max_errors=1)
+        except:
+            logger.exception(f'Unknown error while fetching manga on service {service_id}')
+            manga_ids = [info['manga_id'] for info in manga_info]
+            return SeriesBatchFetchResult(failed=manga_ids, errors=list(manga_ids))
+
+    # noinspection PyPep8Naming
+    def fetch_service_batch(self,
+                            service_id: int,
+                            Scraper: Type[BaseScraper],
+                            manga_info: Collection[MangaServiceInfo]) -> Tuple[Set[int], List[int]]:
+        """
+        Version of scrape_service for scrapers that support batches.
+        All titles are fetched at once and persisted with a single job in the persist pipeline.
+        """
+        fetched = self.fetch_batch(Scraper(None), service_id, manga_info)
+        persisted = self.persist_pipeline.submit(
+            self._persist_batch_pooled, service_id, Scraper, fetched
+        )
+        checked = self.persist_pipeline.submit(self._set_checked_pooled, service_id, Scraper)
+
+        retval = persisted.result()
+        checked.result()
+        return retval
+
+    # noinspection PyPep8Naming
+    def scrape_service_whole(self, service_id: int, Scraper: Type[BaseScraper],
+                             feed_url: str, conn: Connection) -> Optional[ScrapeServiceRetVal]:
+        """
+        Scrapes the feed of a service_whole row and marks the service as checked
+        """
+        scraper = Scraper(conn, self.scraper_dbutil(conn))
+        logger.info(f'Updating service {Scraper.URL}')
+
+        with conn.transaction():
+            try:
+                retval = scraper.scrape_service(service_id, feed_url, None)
+            except psycopg.Error:
+                invalidate_identity_caches()
+                logger.exception(f'Database error while scraping {feed_url}')
+                retval = None
+            except:
+                invalidate_identity_caches()
+                logger.exception(f'Failed to scrape service {feed_url}')
+                retval = None
+
+        scraper.set_checked(service_id)
+        return retval
+
+    # noinspection PyPep8Naming
+    def _scrape_manga_pooled(self, service_id: int, Scraper: Type[BaseScraper],
+                             info: MangaServiceInfo,
+                             fetched: Optional[SeriesFetchResult] = None) -> Tuple[Optional[Set[int]], bool]:
+        with self.conn() as conn:
+            return self.scrape_manga(Scraper(conn, self.scraper_dbutil(conn)), service_id, info, fetched)
+
+    # noinspection PyPep8Naming
+    def _persist_batch_pooled(self, service_id: int, Scraper: Type[BaseScraper],
+                              batch: SeriesBatchFetchResult) -> Tuple[Set[int], List[int]]:
+        with self.conn() as conn:
+            return self.persist_batch(Scraper(conn, self.scraper_dbutil(conn)), service_id, batch)
+
+    # noinspection PyPep8Naming
+    def _update_next_update_pooled(self, service_id: int, Scraper: Type[BaseScraper], manga_id: int) -> None:
+        with self.conn() as conn:
+            scraper = Scraper(conn, self.scraper_dbutil(conn))
+            scraper.dbutil.update_manga_next_update(service_id, manga_id, scraper.next_update())
+
+    # noinspection PyPep8Naming
+    def _set_checked_pooled(self, service_id: int, Scraper: Type[BaseScraper]) -> None:
+        with self.conn() as conn:
+            Scraper(conn, self.scraper_dbutil(conn)).set_checked(service_id)
+
+    # noinspection PyPep8Naming
+    def _scrape_service_whole_pooled(self, service_id: int, Scraper: Type[BaseScraper],
+                                     feed_url: str) -> Optional[ScrapeServiceRetVal]:
+        with self.conn() as conn:
+            return self.scrape_service_whole(service_id, Scraper, feed_url, conn)
+
+    # noinspection PyPep8Naming
+    async def scrape_service_async(self,
+                                   service_id: int,
+                                   Scraper: Type[BaseScraper],
+                                   manga_info: Collection[MangaServiceInfo],
+                                   db_slots: asyncio.Semaphore) -> Tuple[Set[int], List[int]]:
+        """
+        Asyncio version of scrape_service. The politeness delay between titles
+        is awaited so delays of different services overlap. A pooled connection
+        is only held while a single title is being scraped.
+        """
+        if Scraper.supports_batch():
+            batch = await asyncio.to_thread(self.fetch_batch, Scraper(None), service_id, manga_info)
+            async with db_slots:
+                retval = await asyncio.to_thread(self._persist_batch_pooled, service_id, Scraper, batch)
+                await asyncio.to_thread(self._set_checked_pooled, service_id, Scraper)
+
+            return retval
+
+        rng = random.Random()
+        manga_ids: Set[int] = set()
+        chapter_ids: List[int] = []
+        errors = 0
+        # Scrapers with separate stages only hold a connection during the persist stage
+        fetch_scraper = Scraper(None) if Scraper.supports_pipeline() else None
+
+        for idx, info in enumerate(manga_info):
+            if idx:
+                await asyncio.sleep(Scraper.title_delay(rng))
+
+            if fetch_scraper is None:
+                async with db_slots:
+                    res, failed = await asyncio.to_thread(self._scrape_manga_pooled, service_id, Scraper, info)
+            else:
+                fetched, raised = await asyncio.to_thread(self.fetch_manga, fetch_scraper, service_id, info)
+                if fetched is None:
+                    res, failed = None, True
+                    if raised:
+                        async with db_slots:
+                            await asyncio.to_thread(self._update_next_update_pooled, service_id, Scraper, info['manga_id'])
+                else:
+                    async with db_slots:
+                        res, failed = await asyncio.to_thread(
+                            self._scrape_manga_pooled, service_id, Scraper, info, fetched
+                        )
+
+            if res:
+                manga_ids.add(info['manga_id'])
+                chapter_ids.extend(res)
+            elif failed:
+                errors += 1
+
+            if errors > 1:
+                break
+
+        async with db_slots:
+            await asyncio.to_thread(self._set_checked_pooled, service_id, Scraper)
+
+        return manga_ids, chapter_ids
+
+    # noinspection PyPep8Naming
+    async def scrape_service_whole_async(self, service_id: int, Scraper: Type[BaseScraper],
+                                         feed_url: str, db_slots: asyncio.Semaphore) -> Tuple[Set[int], List[int]]:
+        async with db_slots:
+            retval = await asyncio.to_thread(self._scrape_service_whole_pooled, service_id, Scraper, feed_url)
+
+        if not retval:
+            return set(), []
+
+        return set(retval.manga_ids), list(retval.chapter_ids)
+
     def force_run(self, service_id: int, manga_id: int = None) -> Optional[Tuple[Set[int], List[int]]]:
         if service_id not in SCRAPERS_ID:
             logger.warning(f'No service found with id {service_id}')
@@ -278,70 +671,109 @@ class UpdateScheduler:
 
                 return manga_ids, chapter_ids
 
-    def run_once(self):
-        with self.conn() as conn:
-            futures = []
-            sql = '''
-                SELECT ms.service_id, s.url, array_agg(json_build_object('title_id', ms.title_id, 'manga_id', ms.manga_id, 'feed_url', ms.feed_url)) as manga_info
-                FROM manga_service ms
-                INNER JOIN services s ON s.service_id=ms.service_id
-                WHERE NOT (s.disabled OR ms.disabled) AND (s.disabled_until IS NULL OR s.disabled_until < NOW()) AND (ms.next_update IS NULL OR ms.next_update < NOW())
-                GROUP BY ms.service_id, s.url
-            '''
-
-            with conn.cursor() as cursor:
-                cursor.execute(sql)
+    def get_title_budget(self, Scraper: Type[BaseScraper]) -> TokenBucket:
+        """
+        Returns the token bucket limiting how many titles of the given service are checked.
+        Buckets persist between runs so a service can't exceed its budget
+        even when runs are started often.
+        """
+        bucket = self.title_budgets.get(Scraper.ID)
+        if bucket is None:
+            bucket = TokenBucket(Scraper.CONFIG.title_budget, Scraper.CONFIG.title_budget_refill.total_seconds())
+            self.title_budgets[Scraper.ID] = bucket
+
+        return bucket
+
+    def get_due_manga(self, conn: Connection) -> List[Tuple[int, Type[BaseScraper], List[MangaServiceInfo]]]:
+        """
+        Returns a batch of titles to update for each service with titles that need an update.
+        Titles are picked in the order of their update priority and the amount of titles
+        is limited by the title budget of the service.
+        """
+        budgets: Dict[int, int] = {}
+        for service_id, Scraper in SCRAPERS_ID.items():
+            if Scraper.CONFIG is NotImplemented:
+                continue
+
+            budgets[service_id] = int(self.get_title_budget(Scraper).tokens)
+
+        rows = DbUtil(conn, None).get_due_manga_services(budgets)
+
+        due = []
+        for service_id, service_rows in groupby(rows, key=attrgetter('service_id')):
+            Scraper = SCRAPERS_ID[service_id]
+            manga_info = [
+                MangaServiceInfo(title_id=row.title_id, manga_id=row.manga_id, service_id=service_id, feed_url=cast(str, row.feed_url))
+                for row in service_rows
+            ]
+            self.get_title_budget(Scraper).consume(len(manga_info))
+            due.append((service_id, Scraper, manga_info))
+
+        return due
+
+    @staticmethod
+    def resolve_groups(conn: Connection, scrapers: Iterable[Type[BaseScraper]]) -> None:
+        """
+        Resolves the groups the given scrapers use in a single batch
+        so the scrapes of the run find them from the group registry
+        """
+        group_names = {name for Scraper in scrapers for name in Scraper.group_names()}
+        if not group_names:
+            return
 
-                manga_ids: Set[int] = set()
-                chapter_ids: List[int] = []
-                for row in cursor:
-                    batch_size = random.randint(3, 6)
-                    Scraper = SCRAPERS.get(row['url'])
-                    if not Scraper:
-                        logger.error(f'Failed to find scraper for {row}')
-                        continue
-
-                    futures.append(self.thread_pool.submit(
-                        self.scrape_service, row['service_id'],
-                        Scraper, row['manga_info'][:batch_size]
-                    ))
-
-            sql = """SELECT s.service_id, sw.feed_url, s.url
-                     FROM service_whole sw INNER JOIN services s on sw.service_id = s.service_id
-                     WHERE NOT s.disabled AND (sw.next_update IS NULL OR sw.next_update < NOW())"""
-
-            services = []
-            with conn.cursor() as cursor:
-                cursor.execute(sql)
-                for row in cursor:
-                    services.append(row)
-
-            for service in services:
-                service_id = service['service_id']
-                feed_url = service['feed_url']
-                url = service['url']
-
-                Scraper = SCRAPERS.get(url)
+        try:
+            with conn.transaction():
+                DbUtil(conn, None).get_or_create_groups(group_names)
+        except psycopg.Error:
+            logger.exception('Failed to resolve groups')
+
+    def get_due_services(self, conn: Connection) -> List[Tuple[int, Type[BaseScraper], str]]:
+        """
+        Returns the service_whole feeds that need an update
+        """
+        sql = """SELECT s.service_id, sw.feed_url, s.url
+                 FROM service_whole sw INNER JOIN services s on sw.service_id = s.service_id
+                 WHERE NOT s.disabled AND (sw.next_update IS NULL OR sw.next_update < NOW())"""
+
+        due = []
+        with conn.cursor() as cursor:
+            cursor.execute(sql)
+            for row in cursor:
+                Scraper = SCRAPERS.get(row['url'])
                 if not Scraper:
-                    logger.error(f'Failed to find scraper for {service}')
+                    logger.error(f'Failed to find scraper for {row}')
                     continue
 
-                scraper = Scraper(conn, DbUtil(conn, self.es_methods))
-                logger.info(f'Updating service {url}')
+                due.append((row['service_id'], Scraper, row['feed_url']))
 
-                with conn.transaction():
-                    try:
-                        retval = scraper.scrape_service(service_id, feed_url, None)
-                    except psycopg.Error:
-                        logger.exception(f'Database error while scraping {feed_url}')
-                        scraper.set_checked(service_id)
-                        continue
-                    except:
-                        logger.exception(f'Failed to scrape service {feed_url}')
-                        scraper.set_checked(service_id)
-                        continue
+        return due
+
+    def run_once(self):
+        with self.conn() as conn:
+            futures = []
+            manga_ids: Set[int] = set()
+            chapter_ids: List[int] = []
 
-                scraper.set_checked(service_id)
+            due_manga = self.get_due_manga(conn)
+            due_services = self.get_due_services(conn)
+            self.resolve_groups(conn, [Scraper for _, Scraper, _ in [*due_manga, *due_services]])
+            conn.commit()
+
+            for service_id, Scraper, manga_info in due_manga:
+                if Scraper.supports_batch():
+                    scrape = self.fetch_service_batch
+                elif Scraper.supports_pipeline():
+                    scrape = self.fetch_service
+                else:
+                    scrape = self.scrape_service
+
+                futures.append(self.thread_pool.submit(
+                    scrape, service_id,
+                    Scraper, manga_info
+                ))
+
+            for service_id, Scraper, feed_url in due_services:
+                retval = self.scrape_service_whole(service_id, Scraper, feed_url, conn)
                 if retval:
                     manga_ids.update(retval.manga_ids)
                     chapter_ids.extend(retval.chapter_ids)
@@ -358,51 +790,90 @@ class UpdateScheduler:
                     manga_ids.update(res[0])
                     chapter_ids.extend(res[1])
 
-            with conn.transaction():
-                if manga_ids:
-                    logger.debug(f"Updating interval of {len(manga_ids)} manga")
-                    dbutil = DbUtil(conn, self.es_methods)
-                    with conn.cursor() as cursor:
-                        dbutil.update_latest_release(list(manga_ids), cur=cursor)
-                        for manga_id in manga_ids:
-                            dbutil.update_chapter_interval(manga_id, cur=cursor)
+            return self.finish_run(conn, manga_ids, chapter_ids)
+
+    async def run_once_async(self):
+        """
+        Runs a single update cycle with every service scraped concurrently in an asyncio loop.
+        Blocking scraper calls are run in worker threads and the amount of
+        simultaneously used database connections is limited by the connection pool size.
+        """
+        db_slots = asyncio.Semaphore(self.MAX_POOLS - 1)
+
+        async with db_slots:
+            due_manga, due_services = await asyncio.to_thread(self._get_due_pooled)
+
+        tasks = [
+            self.scrape_service_async(service_id, Scraper, manga_info, db_slots)
+            for service_id, Scraper, manga_info in due_manga
+        ]
+        tasks.extend(
+            self.scrape_service_whole_async(service_id, Scraper, feed_url, db_slots)
+            for service_id, Scraper, feed_url in due_services
+        )
 
-            try:
-                self.send_notifications(manga_ids, chapter_ids)
-            except:
-                logger.exception('Failed to send notifications')
-
-            sql = '''
-            SELECT MIN(t.update) as update FROM (
-                SELECT
-                   LEAST(
-                       GREATEST(MIN(ms.next_update), s.disabled_until),
-                       (
-                           SELECT MIN(GREATEST(sw.next_update, s2.disabled_until))
-                           FROM service_whole sw 
-                               INNER JOIN services s2 ON s2.service_id = sw.service_id 
-                           WHERE s2.disabled=FALSE
-                       )
-                   ) as update
-                FROM manga_service ms
-                INNER JOIN services s ON s.service_id = ms.service_id
-                WHERE s.disabled=FALSE AND ms.disabled=FALSE
-                GROUP BY s.service_id, ms.service_id
-            ) as t
-            '''
-            with conn.cursor() as cursor:
-                cursor.execute(sql)
-                retval = cursor.fetchone()
-                if not retval:
-                    return utcnow() + timedelta(hours=1)
-                return retval['update']
+        manga_ids: Set[int] = set()
+        chapter_ids: List[int] = []
+        for res in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(res, BaseException):
+                logger.error('Failed to scrape service', exc_info=res)
+                continue
+
+            manga_ids.update(res[0])
+            chapter_ids.extend(res[1])
+
+        m_ids, c_ids = await asyncio.to_thread(self.do_scheduled_runs)
+        manga_ids.update(m_ids)
+        chapter_ids.extend(c_ids)
+
+        return await asyncio.to_thread(self._finish_run_pooled, manga_ids, chapter_ids)
+
+    def _get_due_pooled(self) -> Tuple[List[Tuple[int, Type[BaseScraper], List[MangaServiceInfo]]],
+                                       List[Tuple[int, Type[BaseScraper], str]]]:
+        with self.conn() as conn:
+            due_manga, due_services = self.get_due_manga(conn), self.get_due_services(conn)
+            self.resolve_groups(conn, [Scraper for _, Scraper, _ in [*due_manga, *due_services]])
+            return due_manga, due_services
+
+    def _finish_run_pooled(self, manga_ids: Set[int], chapter_ids: List[int]) -> datetime:
+        with self.conn() as conn:
+            return self.finish_run(conn, manga_ids, chapter_ids)
+
+    def finish_run(self, conn: Connection, manga_ids: Set[int], chapter_ids: List[int]) -> datetime:
+        """
+        Updates latest chapters and release intervals of the updated manga, sends notifications
+        of new chapters and returns the time of the next required update.
+        """
+        with conn.transaction():
+            dbutil = self.scraper_dbutil(conn)
+            dbutil.flush_writes()
+            # Chapters of manga that failed to update are discarded
+            dbutil.flush_latest_chapters(manga_ids)
+            if manga_ids:
+                logger.debug(f"Updating interval of {len(manga_ids)} manga")
+                with conn.cursor() as cursor:
+                    dbutil.update_latest_release(list(manga_ids), cur=cursor)
+                    dbutil.update_chapter_intervals(manga_ids, cur=cursor)
+
+        try:
+            self.send_notifications(manga_ids, chapter_ids)
+        except:
+            logger.exception('Failed to send notifications')
+
+        with conn.cursor() as cursor:
+            cursor.execute(self.NEXT_UPDATE_SQL)
+            retval = cursor.fetchone()
+            if not retval:
+                return utcnow() + timedelta(hours=1)
+            return retval['update']
 
     def send_notifications(self, manga_ids: Set[int], chapter_ids: List[int]):
         if not (manga_ids and chapter_ids):
             return
 
         with self.conn() as conn:
-            dbutil = DbUtil(conn, self.es_methods)
+            # Notification stats are written after every notification has been sent
+            dbutil = DbUtil(conn, self.es_methods, deferred_writes=DeferredWrites())
 
             partial_notifications = dbutil.get_notifications_by_manga_ids(list(manga_ids))
             manga_ids = {pn.manga_id for pn in partial_notifications}
@@ -439,24 +910,27 @@ class UpdateScheduler:
                 if v
             }
 
-            for notification_id, chapters_notif in mapped_notifications.items():
-                notification = dbutil.get_notification_info(notification_id)
-                notifier = NOTIFIERS[notification.notification_type]()
+            try:
+                for notification_id, chapters_notif in mapped_notifications.items():
+                    notification = dbutil.get_notification_info(notification_id)
+                    notifier = NOTIFIERS[notification.notification_type]()
+
+                    input_fields = dbutil.get_notification_inputs(notification_id)
 
-                input_fields = dbutil.get_notification_inputs(notification_id)
+                    try:
+                        sent, success = notifier.send_notification(
+                            chapters_notif,
+                            notification,
+                            input_fields
+                        )
+                    except:
+                        sent = 0
+                        success = False
 
-                try:
-                    sent, success = notifier.send_notification(
-                        chapters_notif,
-                        notification,
-                        input_fields
+                    dbutil.update_notification_stats(
+                        notification_id,
+                        sent,
+                        0 if success else 1
                     )
-                except:
-                    sent = 0
-                    success = False
-
-                dbutil.update_notification_stats(
-                    notification_id,
-                    sent,
-                    0 if success else 1
-                )
+            finally:
+                dbutil.flush_writes()
@@ -3,7 +3,8 @@ import logging
 import re
 from abc import ABC
 from datetime import datetime, timezone
-from typing import Optional, Set, cast, List, Type, TypeVar, Dict, Tuple
+from typing import Optional, Set, cast, List, Type, TypeVar, Dict, Tuple, \
+    Collection
 
 from lxml import etree
 
@@ -166,6 +167,10 @@ class Azuki(BaseScraperWhole):
     CHAPTER_URL_FORMAT = 'https://www.azuki.co/series/{title_id}/read/{}'
     MANGA_URL_FORMAT = 'https://www.azuki.co/series/{}'
 
+    @classmethod
+    def group_names(cls) -> Collection[str]:
+        return cls.NAME,
+
     @staticmethod
     def parse_chapters(rows: List[etree.ElementBase], chapter_cls: Type[TChapter], group_id: int) -> List[TChapter]:
         chapters = []
@@ -219,11 +224,17 @@ class Azuki(BaseScraperWhole):
     def scrape_service(self, service_id: int, feed_url: str,
                        last_update: Optional[datetime],
                        title_id: Optional[str] = None) -> Optional[ScrapeServiceRetVal]:
-        r = self.fetch_url(feed_url)
-        if r is None:
+        fetched = self.fetch_feed(feed_url)
+        if fetched is None:
             return None
 
-        root = etree.HTML(r.text)
+        if fetched.response is None:
+            return ScrapeServiceRetVal(
+                manga_ids=set(),
+                chapter_ids=set()
+            )
+
+        root = etree.HTML(fetched.response.text)
         chapter_rows = root.cssselect('table tbody tr')
 
         group_id = self.dbutil.get_or_create_group(self.NAME).group_id
@@ -231,6 +242,7 @@ class Azuki(BaseScraperWhole):
 
         chapters = list(self.dbutil.get_only_latest_entries(service_id, chapters))
         if not chapters:
+            self.save_feed_cache(fetched)
             return ScrapeServiceRetVal(
                 manga_ids=set(),
                 chapter_ids=set()
@@ -256,4 +268,6 @@ class Azuki(BaseScraperWhole):
 
                     temp._chapter_title = c.chapter_title
 
-        return self.handle_adding_chapters(chapters, service_id)
+        retval = self.handle_adding_chapters(chapters, service_id)
+        self.save_feed_cache(fetched)
+        return retval
@@ -4,7 +4,7 @@ from abc import ABC, abstractmethod
 from calendar import timegm
 from datetime import datetime, timedelta
 from typing import Optional, List, Iterable, Dict, Pattern, Any, Type, Union, \
-    Set
+    Set, Collection
 
 import feedparser
 
@@ -178,6 +178,10 @@ class BaseRSS(BaseScraperWhole, ABC):
         """
         return False
 
+    @classmethod
+    def group_names(cls) -> Collection[str]:
+        return cls.NAME,
+
     def get_group_id(self) -> int:
         return self.dbutil.get_or_create_group(self.NAME).group_id
 
@@ -236,8 +240,12 @@ class BaseRSS(BaseScraperWhole, ABC):
                       feed_url: Optional[str] = None) -> Optional[Set[int]]:
         pass
 
-    def get_feed_chapters(self, feed_url):
-        feed = feedparser.parse(feed_url)
+    def get_feed_chapters(self, feed_url, content: Optional[bytes] = None):
+        """
+        Parses the chapters of the given feed. If content is given it is
+        used instead of fetching the feed url
+        """
+        feed = feedparser.parse(feed_url if content is None else content)
         try:
             is_valid_feed(feed)
         except (FeedHttpError, InvalidFeedError):
@@ -247,11 +255,21 @@ class BaseRSS(BaseScraperWhole, ABC):
         return self.parse_feed(feed.entries, self.get_group_id())
 
     def add_from_feed_url(self, service_id: int, feed_url: str) -> Optional[ScrapeServiceRetVal]:
-        entries = self.get_feed_chapters(feed_url)
+        fetched = self.fetch_feed(feed_url)
+        if fetched is None:
+            return None
+
+        # Feed not changed since last fetch
+        if fetched.response is None:
+            return ScrapeServiceRetVal()
+
+        entries = self.get_feed_chapters(feed_url, fetched.response.content)
         if entries is None:
             return None
 
-        return self.handle_adding_chapters(entries, service_id)
+        retval = self.handle_adding_chapters(entries, service_id)
+        self.save_feed_cache(fetched)
+        return retval
 
     def scrape_service(self, service_id: int, feed_url: str,
                        last_update: Optional[datetime],
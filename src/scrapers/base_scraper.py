@@ -1,12 +1,16 @@
 import abc
+import hashlib
 import logging
+import random
 from abc import ABC
 from datetime import timedelta, datetime, timezone
 from inspect import isabstract
 from itertools import groupby
 from operator import attrgetter
 from typing import (Optional, TYPE_CHECKING, ClassVar, Set, Dict, List,
-                    Sequence, Iterable, TypeVar, Mapping, cast, Collection)
+                    Sequence, Iterable, TypeVar, Mapping, Collection,
+                    Any, NamedTuple)
+from urllib.parse import urlsplit
 
 import psycopg
 import pydantic
@@ -17,7 +21,8 @@ from pydantic import BaseModel, Field
 from src.db.mappers.chapter_mapper import ChapterMapper
 from src.db.models.chapter import Chapter as ChapterModel
 from src.db.models.manga import MangaService
-from src.db.models.services import ServiceConfig
+from src.db.models.services import ServiceConfig, FeedCache
+from src.utils import sessions, rate_limit
 from src.utils.utilities import get_latest_chapters, utcnow
 
 if TYPE_CHECKING:
@@ -211,6 +216,66 @@ class ScrapeServiceRetVal(BaseModel):
     chapter_ids: Set[int] = Field(default_factory=set)
 
 
+class SeriesInfo(NamedTuple):
+    title_id: str
+    manga_id: int
+    feed_url: Optional[str] = None
+
+
+class SeriesFetchResult:
+    """
+    Result of the network only fetch stage of a series scrape.
+    Contains everything the persist stage needs to update the database.
+    """
+    def __init__(self,
+                 title_id: str,
+                 service_id: int,
+                 manga_id: int,
+                 chapters: Sequence[BaseChapter],
+                 data: Any = None):
+        self.title_id = title_id
+        self.service_id = service_id
+        self.manga_id = manga_id
+        self.chapters = chapters
+        self.data = data
+        """Scraper specific data required by the persist stage"""
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.service_id}, {self.title_id}, {len(self.chapters)} chapters)'
+
+
+class SeriesBatchFetchResult:
+    """
+    Result of the fetch stage of multiple titles
+    """
+    def __init__(self,
+                 results: Optional[List[SeriesFetchResult]] = None,
+                 failed: Optional[List[int]] = None,
+                 errors: Optional[List[int]] = None):
+        self.results: List[SeriesFetchResult] = results if results is not None else []
+        self.failed: List[int] = failed if failed is not None else []
+        """Manga ids of the titles that could not be fetched"""
+        self.errors: List[int] = errors if errors is not None else []
+        """Manga ids of the failed titles whose fetch raised an error"""
+
+    def __repr__(self):
+        return f'{type(self).__name__}({len(self.results)} results, failed={self.failed}, errors={self.errors})'
+
+
+class FeedFetchResult:
+    """
+    Result of a conditional feed fetch. The response is None when the feed
+    has not changed since the last successful fetch.
+    """
+    def __init__(self, response: Optional[requests.Response], cache: FeedCache):
+        self.response = response
+        self.cache = cache
+
+    @property
+    def modified(self) -> bool:
+        return self.response is not None
+
+
 class BaseScraper(abc.ABC):
     ID: ClassVar[int] = NotImplemented
     """Database id of this service"""
@@ -270,9 +335,8 @@ class BaseScraper(abc.ABC):
         with self.conn.cursor() as cursor:
             now = utcnow()
             disabled_until = now + self.min_update_interval()
-            sql = "UPDATE services SET last_check = %s, disabled_until = %s WHERE service_id=%s"
             try:
-                cursor.execute(sql, (utcnow(), disabled_until, service_id))
+                self.dbutil.update_service_checked(service_id, now, disabled_until, cur=cursor)
             except psycopg.Error:
                 logger.exception(f'Failed to update last check of {service_id}')
                 return
@@ -300,6 +364,147 @@ class BaseScraper(abc.ABC):
                        title_id: Optional[str] = None) -> Optional[ScrapeServiceRetVal]:
         raise NotImplementedError
 
+    def fetch_series(self, title_id: str, service_id: int, manga_id: int, feed_url: str) -> Optional[SeriesFetchResult]:
+        """
+        Network only part of scrape_series. Must not use the database connection
+        as it might not exist during this stage.
+
+        Returns:
+            The fetched data that is passed to persist_series.
+            Returns None if fetching failed
+        """
+        raise NotImplementedError
+
+    def persist_series(self, result: SeriesFetchResult) -> Optional[Set[int]]:
+        """
+        Database only part of scrape_series. Adds the results of fetch_series to the database.
+
+        Returns:
+            Set of new chapter ids.
+            Returns None if updating failed
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def title_delay(cls, rng: random.Random) -> float:
+        """
+        Seconds waited between updating two titles of this service. Services with
+        a rate limited host are not delayed since their requests are already limited.
+        """
+        for url in (cls.URL, cls.FEED_URL):
+            host = urlsplit(url).hostname if isinstance(url, str) else None
+            if host and rate_limit.get_limiter(host) is not None:
+                return 0
+
+        return rng.randint(200, 1000)/100
+
+    @classmethod
+    def group_names(cls) -> Collection[str]:
+        """
+        Names of the groups that every scrape of this service uses.
+        They are resolved in a single batch before the scrapes of a run.
+        """
+        return ()
+
+    @classmethod
+    def supports_pipeline(cls) -> bool:
+        """
+        Whether the scraper implements separate fetch and persist stages for series
+        """
+        return cls.fetch_series is not BaseScraper.fetch_series and \
+            cls.persist_series is not BaseScraper.persist_series
+
+    def fetch_series_batch(self, service_id: int, series: Sequence[SeriesInfo],
+                           max_errors: Optional[int] = None) -> SeriesBatchFetchResult:
+        """
+        Runs the fetch stage for multiple titles of this service.
+        Titles that fail to be fetched are returned as failed instead of results.
+        Fetching stops once more than max_errors titles have failed.
+        """
+        batch = SeriesBatchFetchResult()
+        for info in series:
+            try:
+                result = self.fetch_series(info.title_id, service_id, info.manga_id, info.feed_url)  # type: ignore[arg-type]
+            except Exception:
+                logger.exception(f'Unknown error while fetching manga {info.title_id} on service {service_id}')
+                batch.errors.append(info.manga_id)
+                result = None
+
+            if result is None:
+                logger.error(f'Failed to fetch series {info.title_id} {info.manga_id}')
+                batch.failed.append(info.manga_id)
+                if max_errors is not None and len(batch.failed) > max_errors:
+                    break
+                continue
+
+            batch.results.append(result)
+
+        return batch
+
+    def persist_series_batch(self, results: Sequence[SeriesFetchResult]) -> Optional[ScrapeServiceRetVal]:
+        """
+        Runs the persist stage for the results of multiple titles.
+        Scrapers can override this to share database operations between the titles.
+        """
+        retval = ScrapeServiceRetVal()
+        for result in results:
+            chapter_ids = self.persist_series(result)
+            if chapter_ids:
+                retval.manga_ids.add(result.manga_id)
+                retval.chapter_ids.update(chapter_ids)
+
+        return retval
+
+    @classmethod
+    def supports_batch(cls) -> bool:
+        """
+        Whether the scraper persists multiple titles more efficiently in a single batch
+        """
+        return cls.supports_pipeline() and \
+            cls.persist_series_batch is not BaseScraper.persist_series_batch
+
+    def scrape_series_batch(self, service_id: int, series: Sequence[SeriesInfo]) -> Optional[ScrapeServiceRetVal]:
+        """
+        Scrapes multiple titles of this service at once. Scrapers with separate
+        stages fetch all titles first and then persist them together.
+        Other scrapers scrape the titles one by one.
+
+        Returns:
+            Updated manga ids and the new chapter ids.
+            Returns None if all of the titles failed
+        """
+        if self.supports_pipeline():
+            results = self.fetch_series_batch(service_id, series).results
+            if not results:
+                return None
+
+            return self.persist_series_batch(results)
+
+        retval = ScrapeServiceRetVal()
+        failed = True
+        for info in series:
+            chapter_ids = self.scrape_series(info.title_id, service_id, info.manga_id, info.feed_url)  # type: ignore[arg-type]
+            if chapter_ids is None:
+                logger.error(f'Failed to scrape series {info.title_id} {info.manga_id}')
+                continue
+
+            failed = False
+            if chapter_ids:
+                retval.manga_ids.add(info.manga_id)
+                retval.chapter_ids.update(chapter_ids)
+
+        return None if failed else retval
+
+    def scrape_series_staged(self, title_id: str, service_id: int, manga_id: int, feed_url: str) -> Optional[Set[int]]:
+        """
+        Runs both stages of the series scrape one after another
+        """
+        result = self.fetch_series(title_id, service_id, manga_id, feed_url)
+        if result is None:
+            return None
+
+        return self.persist_series(result)
+
     def add_service(self):
         sql = 'SELECT 1 FROM services WHERE url=%s OR service_id=%s'
         with self.conn.cursor() as cur:
@@ -412,7 +617,7 @@ class BaseScraper(abc.ABC):
 
     def fetch_url(self, url: str, headers: Dict[str, str] = None) -> Optional[requests.Response]:
         try:
-            r = requests.get(url, headers=headers)
+            r = sessions.get(url, headers=headers)
         except requests.RequestException:
             logger.exception(f'Failed to fetch {self.__class__.__name__} url {url}')
             return None
@@ -423,6 +628,58 @@ class BaseScraper(abc.ABC):
 
         return r
 
+    def fetch_feed(self, feed_url: str, headers: Optional[Dict[str, str]] = None) -> Optional[FeedFetchResult]:
+        """
+        Fetches a feed using a conditional request based on the cached validators of the feed.
+        If the feed is modified save_feed_cache must be called after the feed has been processed.
+
+        Returns:
+            None if fetching failed
+        """
+        cached = self.dbutil.get_feed_cache(feed_url)
+        headers = dict(headers or {})
+        if cached:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
+        try:
+            r = sessions.get(feed_url, headers=headers)
+        except requests.RequestException:
+            logger.exception(f'Failed to fetch {self.__class__.__name__} feed {feed_url}')
+            return None
+
+        if r.status_code == 304 and cached:
+            logger.info(f'{self.NAME} feed {feed_url} not modified')
+            return FeedFetchResult(None, cached)
+
+        if not r.ok:
+            logger.error(f'Failed to fetch {self.__class__.__name__} feed {feed_url}. HTTP {r.status_code}')
+            return None
+
+        cache = FeedCache(
+            feed_url=feed_url,
+            etag=r.headers.get('ETag'),
+            last_modified=r.headers.get('Last-Modified'),
+            content_hash=hashlib.sha256(r.content).hexdigest()
+        )
+
+        if cached and cached.content_hash == cache.content_hash:
+            logger.info(f'{self.NAME} feed {feed_url} content unchanged')
+            if cached != cache:
+                self.dbutil.update_feed_cache(cache)
+            return FeedFetchResult(None, cache)
+
+        return FeedFetchResult(r, cache)
+
+    def save_feed_cache(self, result: FeedFetchResult) -> None:
+        """
+        Saves the validators of a modified feed after it has been successfully processed
+        """
+        if result.modified:
+            self.dbutil.update_feed_cache(result.cache)
+
 
 class BaseScraperWhole(BaseScraper, ABC):
     def add_service(self) -> Optional[int]:
@@ -463,34 +720,10 @@ class BaseScraperWhole(BaseScraper, ABC):
         if not entries:
             return None
 
-        titles = self.group_by_manga(entries)
-
-        chapters = []
-        manga_ids = set()
-
-        # Find already added titles
-        for ms in self.dbutil.find_added_titles(service_id, tuple(titles.keys())):
-            manga_ids.add(ms.manga_id)
-            for chapter in titles.pop(ms.title_id):
-                chapters.append(ChapterMapper.base_chapter_to_db(chapter, ms.manga_id, service_id))
-
-        # Add new manga
-        mangas = self.titles_dict_to_manga_service(titles, service_id, True)
-
-        self.add_new_manga_with_dupe_check(
-            service_id,
-            mangas,
-            cast(Set[int], manga_ids),
-            chapters,
-            titles
-        )
-
-        inserted = self.dbutil.add_chapters(chapters, fetch=True)
-
-        self.update_latest_chapter(chapters)
+        # Titles, manga and chapters are all added with a single database call
+        result = self.dbutil.ingest_chapters(service_id, list(entries))
 
-        # At this point the set has no None values
         return ScrapeServiceRetVal(
-            manga_ids=cast(Set[int], manga_ids),
-            chapter_ids={row.chapter_id for row in inserted}
+            manga_ids=result.manga_ids,
+            chapter_ids={row.chapter_id for row in result.inserted}
         )
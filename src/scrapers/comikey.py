@@ -3,8 +3,7 @@ import re
 import time
 from typing import Dict, Optional, Set
 
-import requests
-
+from src.utils import sessions
 from .base_rss import BaseRSS
 
 
@@ -24,7 +23,7 @@ class Comikey(BaseRSS):
         if partial_id in self.id_cache:
             return self.id_cache[partial_id]
 
-        r = requests.head(self.URL + f'/comics/{partial_id}', allow_redirects=True)
+        r = sessions.head(self.URL + f'/comics/{partial_id}', allow_redirects=True)
         real_id = '/'.join(r.url.rstrip('/').split('/')[-2:])
         self.id_cache[partial_id] = real_id
         time.sleep(random.uniform(0.5, 1.5))
@@ -13,6 +13,7 @@ from lxml import etree
 from src.db.mappers.chapter_mapper import ChapterMapper
 from src.scrapers.base_scraper import BaseScraperWhole, BaseChapterSimple, \
     ScrapeServiceRetVal
+from src.utils import sessions
 from src.utils.dbutils import DbUtil
 from src.utils.utilities import random_timedelta, get_latest_chapters, utcnow
 
@@ -127,6 +128,10 @@ class ComiXology(BaseScraperWhole):
         super().__init__(conn, dbutil)
         self.service_id: Optional[int] = None
 
+    @classmethod
+    def group_names(cls) -> Collection[str]:
+        return cls.NAME,
+
     @staticmethod
     def get_chapter_elements(root: etree.ElementBase) -> List[etree.ElementBase]:
         return list(root.cssselect('li.content-item'))
@@ -313,7 +318,7 @@ class ComiXology(BaseScraperWhole):
 
     def get_chapter_release_date(self, url: str) -> Optional[datetime]:
         try:
-            r = requests.get(url)
+            r = sessions.get(url)
         except requests.RequestException:
             logger.exception(f'Failed to get chapter id for {url}')
             return None
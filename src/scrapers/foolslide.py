@@ -2,13 +2,13 @@ import logging
 import re
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Set, List, Pattern
+from typing import Optional, Set, List, Pattern, cast, Collection
 
-import requests
 from lxml import etree
 
 from src.scrapers.base_scraper import BaseScraperWhole, BaseChapterSimple, \
-    ScrapeServiceRetVal
+    ScrapeServiceRetVal, SeriesFetchResult
+from src.utils import sessions
 from src.utils.utilities import utctoday
 
 logger = logging.getLogger('debug')
@@ -104,42 +104,60 @@ class FoolSlide(BaseScraperWhole, ABC):
 
         return chapters
 
+    @classmethod
+    def group_names(cls) -> Collection[str]:
+        return cls.NAME,
+
     def get_group_id(self) -> int:
         return self.dbutil.get_or_create_group(self.NAME).group_id
 
     def scrape_series(self, title_id: str, service_id: int, manga_id: Optional[int], feed_url: Optional[str] = None) -> Optional[Set[int]]:
-        r = requests.get(self.MANGA_URL_FORMAT.format(title_id))
+        return self.scrape_series_staged(title_id, service_id, manga_id, feed_url)  # type: ignore[arg-type]
+
+    def fetch_series(self, title_id: str, service_id: int, manga_id: int, feed_url: Optional[str] = None) -> Optional[SeriesFetchResult]:
+        r = sessions.get(self.MANGA_URL_FORMAT.format(title_id))
         if not r.ok:
             logger.error(f'Failed to fetch {type(self).__name__} {feed_url}')
             return None
 
-        group_id = self.get_group_id()
-
         # Series specific parsing can be done in a more simple manner
         root: etree.ElementBase = etree.HTML(r.text)
         chapters = []
 
+        # Group id is set in the persist stage
         for chapter_elem in root.cssselect('div.list div.element'):
             chapters.append(
                 FoolSlideChapter(
                     chapter_elem,
                     manga_title=root.cssselect('h1.title')[0].text.strip(),
-                    title_id=title_id,
-                    group_id=group_id
+                    title_id=title_id
                 )
             )
 
-        retval = self.handle_adding_chapters(chapters, service_id)
+        return SeriesFetchResult(title_id, service_id, manga_id, chapters)
+
+    def persist_series(self, result: SeriesFetchResult) -> Optional[Set[int]]:
+        chapters = cast(List[FoolSlideChapter], result.chapters)
+        group_id = self.get_group_id()
+        for chapter in chapters:
+            chapter.group_id = group_id
+
+        retval = self.handle_adding_chapters(chapters, result.service_id)
         return retval if retval is None else retval.chapter_ids
 
     def scrape_service(self, service_id: int, feed_url: str, last_update: Optional[datetime],
                        title_id: Optional[str] = None) -> Optional[ScrapeServiceRetVal]:
-        r = requests.get(feed_url)
-        if not r.ok:
-            logger.error(f'Failed to fetch {type(self).__name__} {feed_url}')
+        fetched = self.fetch_feed(feed_url)
+        if fetched is None:
             return None
 
-        return self.handle_adding_chapters(
-            self.parse_feed(r.text, self.get_group_id()),
+        # Feed not changed since last fetch
+        if fetched.response is None:
+            return ScrapeServiceRetVal()
+
+        retval = self.handle_adding_chapters(
+            self.parse_feed(fetched.response.text, self.get_group_id()),
             service_id
         )
+        self.save_feed_cache(fetched)
+        return retval
@@ -1,28 +1,90 @@
 import logging
 from datetime import datetime, timedelta
+from itertools import islice
 from json.decoder import JSONDecodeError
-from typing import Dict, Optional, List, Tuple, Iterable, Set, cast, Sequence
+from typing import Dict, Optional, List, Tuple, Iterable, Set, cast, Sequence, \
+    ClassVar, FrozenSet, Collection, NamedTuple, Union
 
 from src.constants import NO_GROUP
 from src.db.models.authors import AuthorPartial, MangaAuthor, MangaArtist
 from src.db.models.groups import Group, GroupPartial
 from src.db.models.manga import MangaInfo
+from src.db.models.services import MetadataCache
 from src.scrapers.base_scraper import BaseScraperWhole, BaseChapterSimple, \
-    ScrapeServiceRetVal
+    ScrapeServiceRetVal, SeriesFetchResult
+from src.utils.cache import LRUCache, identity_cache, \
+    invalidate_identity_caches, invalidate_on_error
 from src.utils.dbutils import DbUtil
+from src.utils.utilities import utcnow
 from .mangadex_api import (ChapterResult, MangadexAPI, MangaResult,
-                           ChapterAttributes, ScanlationGroupResult,
-                           MangadexData,
-                           AuthorAttributes, ScanlationGroupAttributes)
+                           ScanlationGroupResult, MangadexData,
+                           AuthorAttributes, ChapterRecord, GroupRef)
 
 logger = logging.getLogger('debug')
 
+SYNC_LIMIT = 500
+"""Maximum amount of chapters fetched by a single incremental feed sync"""
+METADATA_TTL = timedelta(days=1)
+"""Manga metadata is not fetched again for this long after it was checked"""
+METADATA_REFRESH_INTERVAL = timedelta(days=7)
+"""Unchanged manga metadata is still written to the database after this long"""
+KNOWN_CHAPTERS_PER_TITLE = 300
+"""Maximum amount of chapter ids remembered for a single title. Same as the series fetch limit"""
+
+
+class SyncWatermark(NamedTuple):
+    """
+    Creation time and id of the newest chapter processed by the incremental feed sync.
+    Stored in service_whole.last_id
+    """
+    created_at: datetime
+    chapter_id: str
+
+    def serialize(self) -> str:
+        return f'{self.created_at.isoformat()}|{self.chapter_id}'
+
+    @classmethod
+    def parse(cls, value: Optional[str]) -> Optional['SyncWatermark']:
+        if not value:
+            return None
+
+        try:
+            created_at, chapter_id = value.split('|', 1)
+            return cls(datetime.fromisoformat(created_at), chapter_id)
+        except ValueError:
+            logger.warning(f'Invalid MangaDex sync watermark {value}')
+            return None
+
+    @classmethod
+    def from_results(cls, results: Iterable[ChapterRecord],
+                     dropped_titles: Collection[str] = ()) -> Optional['SyncWatermark']:
+        """
+        Returns the watermark of the newest result. Results of dropped titles
+        were not persisted, so the watermark is kept before the oldest of them.
+        """
+        created = []
+        dropped = []
+        for r in results:
+            if r.created_at is None:
+                continue
+
+            if r.manga_id in dropped_titles:
+                dropped.append(cls(r.created_at, r.id))
+            else:
+                created.append(cls(r.created_at, r.id))
+
+        if dropped:
+            oldest_dropped = min(dropped)
+            created = [w for w in created if w < oldest_dropped]
+
+        return max(created) if created else None
+
 
 class Chapter(BaseChapterSimple):
     def __init__(self, chapter_number: Optional[str], chapter_identifier: str,
                  manga_id: str, release_date: datetime, chapter_title: Optional[str],
                  volume: Optional[str] = None,
-                 group: Optional[MangadexData[ScanlationGroupAttributes]] = None,
+                 group: Optional[GroupRef] = None,
                  manga_title: Optional[str] = None,
                  group_id: Optional[int] = None):
         if not chapter_number:
@@ -63,10 +125,10 @@ class Chapter(BaseChapterSimple):
 
     @property
     def group(self) -> Optional[str]:
-        return self._mangadex_group.attributes.name if self._mangadex_group else None
+        return self._mangadex_group.name if self._mangadex_group else None
 
     @property
-    def mangadex_group(self) -> Optional[MangadexData[ScanlationGroupAttributes]]:
+    def mangadex_group(self) -> Optional[GroupRef]:
         return self._mangadex_group
 
     @property
@@ -83,6 +145,15 @@ class MangaDex(BaseScraperWhole):
     CHAPTER_URL_FORMAT = 'https://mangadex.org/chapter/{}'
     MANGA_URL_FORMAT = 'https://mangadex.org/title/{}'
     COVER_FORMAT: str = 'https://uploads.mangadex.org/covers/{title_id}/{file_name}'
+    known_chapters: ClassVar[LRUCache[str, FrozenSet[str]]] = identity_cache(10_000)
+    """Ids of the newest chapters of each title that were persisted by this process.
+    Used to stop fetching chapter pages early"""
+    group_ids: ClassVar[LRUCache[str, int]] = identity_cache(10_000)
+    """Group ids by the mangadex id of the group"""
+    author_ids: ClassVar[LRUCache[str, int]] = identity_cache(10_000)
+    """Author ids by the mangadex id of the author"""
+    manga_with_authors: ClassVar[LRUCache[int, bool]] = identity_cache(50_000)
+    manga_with_artists: ClassVar[LRUCache[int, bool]] = identity_cache(50_000)
 
     def __init__(self, conn, dbutil: Optional[DbUtil] = None):
         super().__init__(conn, dbutil)
@@ -90,20 +161,19 @@ class MangaDex(BaseScraperWhole):
         self.api = MangadexAPI()
 
     @staticmethod
-    def parse_feed(entries: Iterable[ChapterResult]) -> List[Chapter]:
+    def parse_feed(entries: Iterable[Union[ChapterRecord, ChapterResult]]) -> List[Chapter]:
         chapters = []
         for chapter in entries:
             try:
-                # Mypy thinks attrs is of type DataT which makes no sense as DataT is a TypeVar
-                attrs: ChapterAttributes = chapter.attributes  # type: ignore[assignment]
+                record = chapter if isinstance(chapter, ChapterRecord) else ChapterRecord.from_result(chapter)
                 chapters.append(Chapter(
-                    attrs.chapter,
-                    chapter.id,
-                    chapter.manga_id,
-                    attrs.readable_at,
-                    attrs.title,
-                    attrs.volume,
-                    chapter.group
+                    record.chapter,
+                    record.id,
+                    record.manga_id,
+                    record.readable_at,
+                    record.title,
+                    record.volume,
+                    record.group
                 ))
             except:
                 logger.exception(f'Failed to parse chapter {chapter}')
@@ -151,8 +221,12 @@ class MangaDex(BaseScraperWhole):
         add_authors: Dict[Optional[str], MangadexData[AuthorAttributes]] = {}
 
         manga_ids = set([t[1] for t in mangas])
-        without_author = self.dbutil.get_manga_ids_without_author(manga_ids)
-        without_artist = self.dbutil.get_manga_ids_without_artist(manga_ids)
+        without_author = self.dbutil.get_manga_ids_without_author(
+            manga_ids.difference(self.manga_with_authors.get_many(manga_ids))
+        )
+        without_artist = self.dbutil.get_manga_ids_without_artist(
+            manga_ids.difference(self.manga_with_artists.get_many(manga_ids))
+        )
 
         # Only process artists and authors for manga with none assigned
         for manga, manga_id in mangas:
@@ -165,7 +239,11 @@ class MangaDex(BaseScraperWhole):
                 add_authors.update({a.id: a for a in manga.artists})
 
         # Remove existing authors from the add list
-        for author in self.dbutil.find_existing_mangadex_authors(list(author_ids)):
+        for mangadex_id, author_id in self.author_ids.get_many(author_ids).items():
+            add_authors.pop(mangadex_id, None)
+            author_map[mangadex_id] = author_id
+
+        for author in self.dbutil.find_existing_mangadex_authors([a for a in author_ids if a not in author_map]):
             add_authors.pop(author.mangadex_id, None)
             author_map[author.mangadex_id] = author.author_id
 
@@ -196,16 +274,32 @@ class MangaDex(BaseScraperWhole):
         self.dbutil.add_manga_authors(manga_author)
         self.dbutil.add_manga_artists(manga_artist)
 
+        self.author_ids.update({k: v for k, v in author_map.items() if k is not None})
+        self.manga_with_authors.update(dict.fromkeys(
+            manga_ids.difference(without_author).union(a.manga_id for a in manga_author), True
+        ))
+        self.manga_with_artists.update(dict.fromkeys(
+            manga_ids.difference(without_artist).union(a.manga_id for a in manga_artist), True
+        ))
+
     def get_group_ids_by_mangadex_id(self, group_ids: Sequence[str]) -> Dict[str, int]:
-        if len(group_ids) == 0:
-            return {}
+        """
+        Returns the group ids of the given mangadex groups.
+        Only groups that are not cached are queried.
+        """
+        result = self.group_ids.get_many(group_ids)
+        missing = [g for g in group_ids if g not in result]
+        if len(missing) == 0:
+            return result
 
-        format_args = self.dbutil.get_format_args(group_ids)
+        format_args = self.dbutil.get_format_args(missing)
         sql = f'SELECT mangadex_id::text, group_id FROM groups WHERE mangadex_id IN ({format_args})'
-        result: Dict[str, int] = {}
-        for row in self.dbutil.execute(sql, group_ids, fetch=True):
-            result[row['mangadex_id']] = row['group_id']
+        found: Dict[str, int] = {}
+        for row in self.dbutil.execute(sql, missing, fetch=True):
+            found[row['mangadex_id']] = row['group_id']
 
+        self.group_ids.update(found)
+        result.update(found)
         return result
 
     def map_and_add_group_ids(self, entries: List[Chapter]) -> List[Chapter]:
@@ -269,13 +363,15 @@ class MangaDex(BaseScraperWhole):
         # Add new groups if they exist
         if missing_group:
             for group in self.dbutil.add_new_groups([
-                GroupPartial(name=c.mangadex_group.attributes.name, mangadex_id=c.mangadex_group.id)
+                GroupPartial(name=c.mangadex_group.name, mangadex_id=c.mangadex_group.id)
                 for c in missing_group if c.mangadex_group
             ]):
                 existing[cast(str, group.mangadex_id)] = group.group_id
 
             missing_group = map_chapters(missing_group)
 
+        self.group_ids.update(existing)
+
         # If no groups were found use No group
         if missing_group:
             logger.error('Failed to add group to some chapters. Using "No group". %s', missing_group)
@@ -290,10 +386,12 @@ class MangaDex(BaseScraperWhole):
 
         return valid_chapters
 
-    def fetch_chapters(self, api_url: str, title_id: str = None, limit: int = 100) -> Optional[List[Chapter]]:
+    def fetch_chapters(self, api_url: str, title_id: str = None, limit: int = 100,
+                       known_ids: Optional[Collection[str]] = None) -> Optional[List[Chapter]]:
         self.api.base_url = api_url
         try:
-            result = self.api.get_chapters({'readableAt': 'desc'}, manga_id=title_id, languages=['en'], limit=limit)
+            result = self.api.get_chapters({'readableAt': 'desc'}, manga_id=title_id, languages=['en'],
+                                           limit=limit, known_ids=known_ids)
             return list(self.parse_feed(result))
         except JSONDecodeError:
             logger.exception(f'Failed to parse mangadex response')
@@ -311,6 +409,18 @@ class MangaDex(BaseScraperWhole):
         if parsed is None:
             return None
 
+        return self.persist_chapters(service_id, parsed)
+
+    @invalidate_on_error()
+    def persist_chapters(self, service_id: int, parsed: List[Chapter],
+                         manga_infos: Optional[Dict[str, MangaResult]] = None,
+                         failed_titles: Optional[Set[str]] = None) -> ScrapeServiceRetVal:
+        """
+        Adds the fetched chapters and the related manga to the database.
+        Manga infos are fetched for new entries if they are not given.
+        New titles whose manga info could not be fetched are added to failed_titles.
+        Their chapters are not added.
+        """
         if not parsed:
             return ScrapeServiceRetVal()
 
@@ -326,11 +436,20 @@ class MangaDex(BaseScraperWhole):
         manga_ids: Set[int] = set()
         chapters = self.map_already_added_titles(service_id, titles, manga_ids)
 
+        # Metadata of existing manga is only fetched once its cached hash has expired
+        existing_titles = {e.title_id for e in entries}.difference(titles.keys())
+        metadata_cache = self.dbutil.get_metadata_cache(service_id, existing_titles)
+        expired = self.expired_metadata(existing_titles, metadata_cache)
+
         # Fetch manga title and other info and discard manga that were not found
         # manga title set to temp as it will be replaced later
         mangas = self.titles_dict_to_manga_service(titles, service_id, True, manga_title='temp')
-        # Fetch for all manga as this information is used later on
-        manga_infos = self.fetch_manga_infos(list({e.title_id for e in entries}))
+        if manga_infos is None:
+            failed: Set[str] = set()
+            manga_infos = self.fetch_manga_infos([*titles.keys(), *expired], failed=failed)
+            if failed_titles is not None:
+                # Only new titles lose their chapters. Existing titles just keep their old metadata
+                failed_titles.update(failed.intersection(titles.keys()))
         idx = len(mangas)
         for m in reversed(mangas):
             idx -= 1
@@ -365,14 +484,26 @@ class MangaDex(BaseScraperWhole):
             sql = f'SELECT manga_id, title_id FROM manga_service WHERE manga_id IN ({format_args})'
             mangadex2db = {row['title_id']: row['manga_id'] for row in
                            self.dbutil.execute(sql, list(manga_ids))}
-            db2result: Dict[int, MangaResult] = {}
-
-            for mangadex_id, manga_result in manga_infos.items():
-                db2result[mangadex2db[mangadex_id]] = manga_result
-
-            self.update_manga_info_and_title(db2result)
-            self.add_authors([(v, k) for k, v in db2result.items()])
+            hashes = {
+                mangadex_id: manga_result.content_hash()
+                for mangadex_id, manga_result in manga_infos.items()
+                if mangadex_id in mangadex2db
+            }
+            changed = self.changed_metadata(hashes, metadata_cache)
+            db2result: Dict[int, MangaResult] = {
+                mangadex2db[mangadex_id]: manga_infos[mangadex_id] for mangadex_id in changed
+            }
+
+            if db2result:
+                self.update_manga_info_and_title(db2result)
+                self.add_authors([(v, k) for k, v in db2result.items()])
+
+            self.dbutil.update_metadata_cache(service_id, [
+                (mangadex_id, content_hash, mangadex_id in changed)
+                for mangadex_id, content_hash in hashes.items()
+            ])
         except:
+            invalidate_identity_caches()
             logger.exception('Failed to add manga infos')
 
         return ScrapeServiceRetVal(
@@ -380,15 +511,119 @@ class MangaDex(BaseScraperWhole):
             chapter_ids=chapter_ids
         )
 
+    @staticmethod
+    def expired_metadata(title_ids: Iterable[str], metadata_cache: Dict[str, MetadataCache]) -> List[str]:
+        """
+        Returns the titles whose metadata in the metadata_cache table has expired
+        """
+        now = utcnow()
+        expired: List[str] = []
+        for title_id in title_ids:
+            cached = metadata_cache.get(title_id)
+            age = now - cached.last_check if cached else METADATA_TTL
+            if age >= METADATA_TTL:
+                expired.append(title_id)
+
+        return expired
+
+    @staticmethod
+    def changed_metadata(hashes: Dict[str, str], metadata_cache: Dict[str, MetadataCache]) -> Set[str]:
+        """
+        Returns the titles whose metadata has changed or has not been
+        written to the database within the refresh interval
+        """
+        now = utcnow()
+        changed: Set[str] = set()
+        for title_id, content_hash in hashes.items():
+            cached = metadata_cache.get(title_id)
+            if cached is None or cached.content_hash != content_hash or \
+                    now - cached.last_update >= METADATA_REFRESH_INTERVAL:
+                changed.add(title_id)
+
+        return changed
+
     def scrape_series(self, title_id: str, service_id: int, manga_id: int, feed_url: str) -> Optional[Set[int]]:
-        retval = self.do_update(service_id, feed_url, title_id, limit=300)
-        return retval if retval is None else retval.chapter_ids
+        return self.scrape_series_staged(title_id, service_id, manga_id, feed_url)
+
+    def fetch_series(self, title_id: str, service_id: int, manga_id: int, feed_url: str) -> Optional[SeriesFetchResult]:
+        parsed = self.fetch_chapters(feed_url or self.FEED_URL, title_id=title_id, limit=300,
+                                     known_ids=self.known_chapters.get(title_id))
+        if parsed is None:
+            return None
+
+        return SeriesFetchResult(title_id, service_id, manga_id, parsed)
+
+    def persist_series(self, result: SeriesFetchResult) -> Optional[Set[int]]:
+        return self.persist_series_batch([result]).chapter_ids
+
+    def persist_series_batch(self, results: Sequence[SeriesFetchResult]) -> ScrapeServiceRetVal:
+        """
+        Adds the chapters of all titles with a single deduplication query and insert
+        """
+        if not results:
+            return ScrapeServiceRetVal()
+
+        chapters: List[Chapter] = []
+        for result in results:
+            chapters.extend(cast(List[Chapter], result.chapters))
+
+        # Manga infos are only fetched for titles with new chapters or expired metadata
+        retval = self.persist_chapters(results[0].service_id, chapters)
+
+        for result in results:
+            # Fetched chapters are the newest ones so they are kept over the previously known ids
+            ids = dict.fromkeys(c.chapter_identifier for c in result.chapters)
+            ids.update(dict.fromkeys(self.known_chapters.get(result.title_id) or ()))
+            self.known_chapters.set(result.title_id, frozenset(islice(ids, KNOWN_CHAPTERS_PER_TITLE)))
+
+        return retval
 
     def scrape_service(self, service_id: int, feed_url: str,
                        last_update: Optional[datetime], title_id: Optional[str] = None) -> Optional[ScrapeServiceRetVal]:
-        return self.do_update(service_id, feed_url)
+        return self.sync_feed(service_id, feed_url)
 
-    def fetch_manga_infos(self, title_ids: List[str]) -> Dict[str, MangaResult]:
+    def sync_feed(self, service_id: int, feed_url: str) -> Optional[ScrapeServiceRetVal]:
+        """
+        Adds the chapters created since the previous sync in creation order.
+        The newest processed chapter is stored as the watermark of the next sync.
+        Without a watermark the latest chapters are fetched.
+        """
+        service_whole = self.dbutil.get_service_whole(service_id)
+        watermark = SyncWatermark.parse(service_whole.last_id if service_whole else None)
+
+        self.api.base_url = feed_url
+        try:
+            if watermark is None:
+                results = list(self.api.get_chapters({'readableAt': 'desc'}, languages=['en'], limit=100))
+            else:
+                results = [
+                    r for r in self.api.get_chapters({'createdAt': 'asc'}, languages=['en'], limit=SYNC_LIMIT,
+                                                     created_at_since=watermark.created_at)
+                    if r.id != watermark.chapter_id
+                ]
+        except JSONDecodeError:
+            logger.exception(f'Failed to parse mangadex response')
+            return None
+        except ValueError as e:
+            logger.exception(f'Failed to parse mangadex result {e}')
+            return None
+
+        logger.info(f'{len(results)} chapters fetched since {watermark}')
+        failed_titles: Set[str] = set()
+        retval = self.persist_chapters(service_id, self.parse_feed(results), failed_titles=failed_titles)
+
+        # Chapters of titles whose manga info failed to fetch are synced again next time
+        new_watermark = SyncWatermark.from_results(results, failed_titles)
+        if new_watermark is not None and (watermark is None or new_watermark > watermark):
+            self.dbutil.update_service_whole_last_id(service_id, new_watermark.serialize())
+
+        return retval
+
+    def fetch_manga_infos(self, title_ids: List[str], failed: Optional[Set[str]] = None) -> Dict[str, MangaResult]:
+        """
+        Fetches the manga infos of the given titles. Stops at the first failed request
+        and adds the titles that were not fetched because of it to failed if given.
+        """
         chunk = 100
         mangas: Dict[str, MangaResult] = {}
         for i in range(0, len(title_ids), chunk):
@@ -398,6 +633,8 @@ class MangaDex(BaseScraperWhole):
                 parsed = self.api.get_manga(ids)
             except Exception as e:
                 logger.exception(f'Failed to fetch manga {e}')
+                if failed is not None:
+                    failed.update(title_ids[i:])
                 return mangas
 
             for manga in parsed:
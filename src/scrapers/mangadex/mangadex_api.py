@@ -1,17 +1,31 @@
+import hashlib
+import json
 import logging
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timezone
 from enum import Enum
-from itertools import chain
+from functools import partial
 from typing import Optional, List, Union, Dict, Iterable, Literal, TypeVar, \
-    Type, TypedDict, Generic
+    Type, TypedDict, Generic, Collection, Iterator, NamedTuple, Deque, Any, \
+    Callable, cast
+from urllib.parse import urlsplit
 
 import requests
 from pydantic import BaseModel, Field, validator, ValidationError, \
     root_validator
 from pydantic.generics import GenericModel
-from ratelimit import rate_limited, sleep_and_retry
 
 from src.enums import Status as MangaStatus
+from src.utils import sessions, rate_limit
+from src.utils.rate_limit import RateLimit
+
+# orjson is optional. It only makes parsing large chapter pages faster
+try:
+    import orjson
+    json_loads: Callable[[bytes], Any] = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 logger = logging.getLogger('debug')
 
@@ -23,6 +37,7 @@ SortColumns = TypedDict('SortColumns', {
     'createdAt': SortDirection,
     'updatedAt': SortDirection,
     'publishAt': SortDirection,
+    'readableAt': SortDirection,
     'volume': SortDirection,
     'chapter': SortDirection,
 }, total=False)
@@ -81,6 +96,7 @@ class ChapterAttributes(BaseModel):
     title: Optional[str]
     publish_at: datetime = Field(..., alias='publishAt')
     readable_at: datetime = Field(..., alias='readableAt')
+    created_at: Optional[datetime] = Field(None, alias='createdAt')
 
 
 class ScanlationGroupAttributes(BaseModel):
@@ -130,6 +146,102 @@ class ChapterResult(MangadexData[ChapterAttributes]):
         raise ValueError(f'Scanlation group id not found for {self}')
 
 
+class GroupRef(NamedTuple):
+    id: str
+    name: str
+
+
+def parse_date(value: str) -> datetime:
+    # fromisoformat does not support the Z suffix before python 3.11
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
+
+
+def optional_str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+class ChapterRecord:
+    """
+    Slim chapter parsed directly from the decoded json. Only the fields that are
+    persisted are read and validated, which is much cheaper than validating a ChapterResult.
+    """
+    __slots__ = ('id', 'manga_id', 'chapter', 'title', 'volume', 'readable_at', 'created_at', 'group')
+
+    def __init__(self, id: str, manga_id: str, chapter: Optional[str], title: Optional[str],
+                 volume: Optional[str], readable_at: datetime, created_at: Optional[datetime] = None,
+                 group: Optional[GroupRef] = None):
+        self.id = id
+        self.manga_id = manga_id
+        self.chapter = chapter
+        self.title = title
+        self.volume = volume
+        self.readable_at = readable_at
+        self.created_at = created_at
+        self.group = group
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ChapterRecord':
+        """
+        Creates the record from a chapter of the api. Raises KeyError, TypeError or
+        ValueError if a required field is missing or invalid.
+        """
+        chapter_id = data['id']
+        if not isinstance(chapter_id, str):
+            raise TypeError(f'Invalid chapter id {chapter_id}')
+
+        attrs = data['attributes']
+        manga_id: Optional[str] = None
+        group: Optional[GroupRef] = None
+        for r in data.get('relationships') or ():
+            rtype = r['type']
+            if rtype == 'manga' and manga_id is None:
+                manga_id = str(r['id'])
+            # Support only a single group per chapter for now
+            elif rtype == 'scanlation_group' and group is None and 'attributes' in r:
+                group = GroupRef(str(r['id']), str(r['attributes']['name']))
+
+        if manga_id is None:
+            raise ValueError(f'Manga id not found for chapter {chapter_id}')
+
+        created_at = attrs.get('createdAt')
+        return cls(
+            chapter_id,
+            manga_id,
+            optional_str(attrs.get('chapter')),
+            optional_str(attrs.get('title')),
+            optional_str(attrs.get('volume')),
+            parse_date(attrs['readableAt']),
+            parse_date(created_at) if created_at else None,
+            group
+        )
+
+    @classmethod
+    def from_result(cls, result: ChapterResult) -> 'ChapterRecord':
+        attrs = cast(ChapterAttributes, result.attributes)
+        group = None
+        if result.group:
+            group = GroupRef(result.group.id, cast(ScanlationGroupAttributes, result.group.attributes).name)
+
+        return cls(result.id, result.manga_id, attrs.chapter, attrs.title, attrs.volume,
+                   attrs.readable_at, attrs.created_at, group)
+
+    def __repr__(self):
+        return f'{type(self).__name__}(id={self.id}, manga_id={self.manga_id}, chapter={self.chapter})'
+
+
+def parse_chapter_records(results: Iterable[Dict]) -> List[ChapterRecord]:
+    records = []
+    for result in results:
+        try:
+            records.append(ChapterRecord.from_dict(result))
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f'Failed to parse chapter {result}', exc_info=True)
+
+    return records
+
+
 class MangaAttributes(BaseModel):
     title: str
     links: Links
@@ -230,6 +342,22 @@ class MangaResult(MangadexData[MangaAttributes]):
 
         return None
 
+    def content_hash(self) -> str:
+        """
+        Hash of the metadata that is stored in the database.
+        Used to skip updates of manga whose metadata has not changed.
+        """
+        attributes = self.attributes
+        data = {
+            'title': attributes.title,
+            'status': attributes.status.value,
+            'links': attributes.links.dict(),
+            'cover': self.cover.attributes.file_name if self.cover else None,
+            'authors': sorted((a.id, a.attributes.name) for a in self.authors or []),
+            'artists': sorted((a.id, a.attributes.name) for a in self.artists or []),
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
 
 class AuthorResult(MangadexData[AuthorAttributes]):
     pass
@@ -243,6 +371,15 @@ class ScanlationGroupResult(MangadexData[ScanlationGroupAttributes]):
     pass
 
 
+def format_date(date: datetime) -> str:
+    """
+    Formats a date to the format used by date filters of the api. Aware dates are converted to UTC
+    """
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc)
+    return date.strftime('%Y-%m-%dT%H:%M:%S')
+
+
 def handle_response(r: requests.Response) -> Dict:
     if not r.ok:
         raise ValueError(f'Failed to fetch {r.url}', r)
@@ -251,7 +388,7 @@ def handle_response(r: requests.Response) -> Dict:
 
 
 def try_parse_result(r: requests.Response) -> Dict:
-    data = r.json()
+    data = json_loads(r.content)
 
     if 'data' not in data:
         raise ValueError('Data not found in response', data)
@@ -266,7 +403,12 @@ GenericMangadexResults = TypeVar('GenericMangadexResults', bound=MangadexData)
 
 # noinspection PyPep8Naming
 def request_to_model(r: requests.Response, Model: Type[GenericResults], continue_on_error: bool = False) -> Iterable[GenericResults]:
-    for result in handle_response(r)['data']:
+    return parse_models(handle_response(r)['data'], Model, continue_on_error)
+
+
+# noinspection PyPep8Naming
+def parse_models(results: Iterable[Dict], Model: Type[GenericResults], continue_on_error: bool = False) -> Iterable[GenericResults]:
+    for result in results:
         try:
             yield Model(**result)
         except ValidationError:
@@ -279,20 +421,28 @@ def request_to_model(r: requests.Response, Model: Type[GenericResults], continue
             raise e
 
 
-api_rate_limiter = rate_limited(5, 1)
+API_RATE_LIMIT = RateLimit(requests=5, per=1)
+MAX_CONCURRENT_PAGES = 4
+"""Maximum amount of chapter pages fetched at the same time. Requests are still rate limited"""
+page_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PAGES, thread_name_prefix='mangadex-pages')
+
+
+class ChapterPage(NamedTuple):
+    chapters: List[ChapterRecord]
+    total: int
+    """Total amount of chapters matching the query"""
 
 
 class MangadexAPI:
     def __init__(self, url='https://api.mangadex.org'):
         self.base_url = url
+        rate_limit.configure_rate_limit(urlsplit(url).hostname or url, API_RATE_LIMIT, replace=False)
 
     @staticmethod
     def join_array(ids: List[str], key: str):
         key = key + '[]'
         return f'{key}={f"&{key}=".join(ids)}'
 
-    @sleep_and_retry
-    @api_rate_limiter
     def get_manga(self, manga_ids: Union[str, List[str]], include_authors: bool = True,
                   include_artists: bool = True, include_cover: bool = True) -> Iterable[MangaResult]:
         if isinstance(manga_ids, str):
@@ -315,16 +465,15 @@ class MangadexAPI:
 
         params.append(f'limit={len(manga_ids)}')
 
-        r = requests.get(f'{self.base_url}/manga?{"&".join(params)}')
+        r = sessions.get(f'{self.base_url}/manga?{"&".join(params)}')
 
         return request_to_model(r, MangaResult, continue_on_error=True)
 
-    @sleep_and_retry
-    @api_rate_limiter
-    def get_chapters(self, sort_by: SortColumns, *, languages: List[str],
-                     manga_id: str = None, limit: int = MAX_LIMIT,
-                     include_groups: bool = True, offset: int = None,
-                     include_future_updates=True) -> Iterable[ChapterResult]:
+    def get_chapters_page(self, sort_by: SortColumns, *, languages: List[str],
+                          manga_id: Optional[str] = None, limit: int = MAX_LIMIT,
+                          include_groups: bool = True, offset: Optional[int] = None,
+                          include_future_updates=True,
+                          created_at_since: Optional[datetime] = None) -> ChapterPage:
         params = []
         order = []
         for k, v in sort_by.items():
@@ -347,27 +496,78 @@ class MangadexAPI:
         if offset:
             params.append(f'offset={offset}')
 
+        if created_at_since:
+            params.append(f'createdAtSince={format_date(created_at_since)}')
+
         params.append(f'includeFutureUpdates={"1" if include_future_updates else "0"}')
 
-        r = requests.get(f'{self.base_url}/chapter?{"&".join(params)}')
+        r = sessions.get(f'{self.base_url}/chapter?{"&".join(params)}')
+        data = handle_response(r)
 
-        if limit > MAX_LIMIT:
-            data = r.json()
-            its = [request_to_model(r, ChapterResult)]
+        return ChapterPage(
+            parse_chapter_records(data['data']),
+            total=data.get('total', 0)
+        )
 
-            if data['total'] > data['offset'] + data['limit']:
-                its.append(self.get_chapters(
-                    sort_by=sort_by,
-                    languages=languages,
-                    manga_id=manga_id,
-                    limit=limit - MAX_LIMIT,
-                    include_groups=include_groups,
-                    offset=(offset or 0) + MAX_LIMIT
-                ))
+    def get_chapters(self, sort_by: SortColumns, *, languages: List[str],
+                     manga_id: Optional[str] = None, limit: int = MAX_LIMIT,
+                     include_groups: bool = True, offset: Optional[int] = None,
+                     include_future_updates=True,
+                     created_at_since: Optional[datetime] = None,
+                     known_ids: Optional[Collection[str]] = None) -> Iterator[ChapterRecord]:
+        """
+        Yields up to limit chapters. When more than one page is needed the total
+        amount of chapters is read from the first page and the rest of the pages are
+        fetched concurrently. Chapters are yielded in order as the pages arrive.
+
+        Fetching stops after a page where all chapter ids are in known_ids. Pages after
+        a page with some known chapters are fetched one at a time since they are
+        likely to be known as well.
+        """
+        offset = offset or 0
+        get_page = partial(
+            self.get_chapters_page,
+            sort_by,
+            languages=languages,
+            manga_id=manga_id,
+            include_groups=include_groups,
+            include_future_updates=include_future_updates,
+            created_at_since=created_at_since
+        )
+
+        def count_known(page: ChapterPage) -> int:
+            if not known_ids:
+                return 0
+            return sum(c.id in known_ids for c in page.chapters)
+
+        page = get_page(limit=min(limit, MAX_LIMIT), offset=offset)
+        yield from page.chapters
+
+        end = min(offset + limit, page.total)
+        offsets = iter(range(offset + MAX_LIMIT, end, MAX_LIMIT))
+        pending: Deque['Future[ChapterPage]'] = deque()
 
-            return chain(*its)
-        else:
-            return request_to_model(r, ChapterResult)
+        try:
+            while True:
+                known = count_known(page)
+                if page.chapters and known == len(page.chapters):
+                    return
+
+                window = 1 if known else MAX_CONCURRENT_PAGES
+                while len(pending) < window:
+                    page_offset = next(offsets, None)
+                    if page_offset is None:
+                        break
+                    pending.append(page_executor.submit(get_page, limit=min(MAX_LIMIT, end - page_offset), offset=page_offset))
+
+                if not pending:
+                    return
+
+                page = pending.popleft().result()
+                yield from page.chapters
+        finally:
+            for fut in pending:
+                fut.cancel()
 
     # Commented out as it's not required after reference expansion was introduced
     # def fetch_chunked(self, api_path: str, ids: List[str], model: Type[GenericMangadexResults]) -> Dict[str, GenericMangadexResults]:
@@ -379,8 +579,6 @@ class MangadexAPI:
     #     results: Dict[str, GenericMangadexResults] = {}
     #
     #     # Inner function to get rate limits for each request
-    #     @sleep_and_retry
-    #     @api_rate_limiter
     #     def fetch_data(chunk):
     #         r = requests.get(f'{self.base_url}/{api_path}?limit={len(chunk)}&{self.join_array(chunk, "ids")}')
     #         for m in request_to_model(r, model):
@@ -2,7 +2,7 @@ import logging
 import re
 from datetime import datetime, timedelta, timezone
 from enum import Enum
-from typing import Optional, List, Tuple, Set
+from typing import Optional, List, Tuple, Set, Collection
 
 import psycopg
 import requests
@@ -12,7 +12,8 @@ from src.db.models.authors import AuthorPartial
 from src.db.models.manga import MangaService
 from src.enums import Status
 from src.scrapers.base_scraper import BaseChapter, BaseScraperWhole, \
-    BaseScraper, ScrapeServiceRetVal
+    BaseScraper, ScrapeServiceRetVal, SeriesFetchResult
+from src.utils import sessions
 from src.utils.utilities import random_timedelta, utcnow, utcfromtimestamp
 from .protobuf import mangaplus_pb2
 
@@ -301,6 +302,10 @@ class MangaPlus(BaseScraperWhole):
     MANGA_URL_FORMAT = 'https://mangaplus.shueisha.co.jp/titles/{}'
     GROUP = 'Shueisha'
 
+    @classmethod
+    def group_names(cls) -> Collection[str]:
+        return cls.GROUP,
+
     def min_update_interval(self) -> timedelta:
         return random_timedelta(timedelta(minutes=10), timedelta(minutes=20))
 
@@ -318,7 +323,7 @@ class MangaPlus(BaseScraperWhole):
     @staticmethod
     def parse_series(title_id: str) -> Optional[ResponseWrapper]:
         try:
-            r = requests.get(MangaPlus.API.format(title_id))
+            r = sessions.get(MangaPlus.API.format(title_id))
         except requests.RequestException:
             logger.exception('Failed to fetch series')
             return None
@@ -331,7 +336,7 @@ class MangaPlus(BaseScraperWhole):
     @staticmethod
     def get_all_titles(api_url: str) -> Optional[AllTitlesViewWrapper]:
         try:
-            r = requests.get(api_url)
+            r = sessions.get(api_url)
         except requests.RequestException:
             logger.exception('Failed to fetch all mangaplus titles')
             return None
@@ -339,7 +344,11 @@ class MangaPlus(BaseScraperWhole):
         if r.status_code != 200:
             return None
 
-        resp = ResponseWrapper(r.content)
+        return MangaPlus.parse_all_titles(r.content)
+
+    @staticmethod
+    def parse_all_titles(content: bytes) -> Optional[AllTitlesViewWrapper]:
+        resp = ResponseWrapper(content)
         all_titles = resp.all_titles_view
 
         return all_titles
@@ -379,7 +388,15 @@ class MangaPlus(BaseScraperWhole):
     def scrape_service(self, service_id: int, feed_url: str,
                        last_update: Optional[datetime], title_id: Optional[str] = None) -> Optional[ScrapeServiceRetVal]:
         self.dbutil.update_service_whole(service_id, timedelta(days=1) + self.min_update_interval())
-        all_titles = self.get_all_titles(feed_url)
+        fetched = self.fetch_feed(feed_url)
+        if fetched is None:
+            return None
+
+        # Title list not changed since last fetch
+        if fetched.response is None:
+            return ScrapeServiceRetVal()
+
+        all_titles = self.parse_all_titles(fetched.response.content)
         if not all_titles:
             return None
 
@@ -391,6 +408,7 @@ class MangaPlus(BaseScraperWhole):
         existing_title_ids = {int(t.title_id) for t in existing_titles}
         new_titles = set(titles).difference(existing_title_ids)
         if not new_titles:
+            self.save_feed_cache(fetched)
             return None
 
         logger.info(f'{len(new_titles)} new manga to be added to mangaplus')
@@ -404,16 +422,32 @@ class MangaPlus(BaseScraperWhole):
             )
             for t in new_titles
         ])
+        self.save_feed_cache(fetched)
 
         # Does not add chapters. Only adds new manga
         return None
 
     def scrape_series(self, title_id: str, service_id: int, manga_id: int,
                       feed_url=None) -> Optional[Set[int]]:
+        return self.scrape_series_staged(title_id, service_id, manga_id, feed_url)
+
+    def fetch_series(self, title_id: str, service_id: int, manga_id: int,
+                     feed_url=None) -> Optional[SeriesFetchResult]:
         parsed = self.parse_series(title_id)
         if parsed is None:
             return None
 
+        chapters: List[ChapterWrapper] = []
+        if isinstance(parsed.title_detail_view, TitleDetailViewWrapper):
+            chapters = [*parsed.title_detail_view.first_chapter_list, *parsed.title_detail_view.last_chapter_list]
+
+        return SeriesFetchResult(title_id, service_id, manga_id, chapters, data=parsed)
+
+    def persist_series(self, result: SeriesFetchResult) -> Optional[Set[int]]:
+        parsed: ResponseWrapper = result.data
+        title_id = result.title_id
+        service_id = result.service_id
+
         # If manga has been removed and returns not found disabled it.
         if parsed.error_result and parsed.error_result.english_popup.subject.lower() == 'not found':
             logger.info(f'MANGA Plus API returned not found for {title_id}. Disabling it.')
@@ -424,7 +458,7 @@ class MangaPlus(BaseScraperWhole):
         if not isinstance(series, TitleDetailViewWrapper):
             return series
 
-        return self.add_chapters(series, service_id, manga_id)
+        return self.add_chapters(series, service_id, result.manga_id)
 
     def add_chapters(self, series: TitleDetailViewWrapper, service_id: int, manga_id: int) -> Optional[Set[int]]:
         group = self.dbutil.get_or_create_group(self.GROUP)
@@ -489,8 +523,7 @@ class MangaPlus(BaseScraperWhole):
             with self.conn.cursor() as cursor:
                 inserted = self.dbutil.add_chapters(new_chapters, fetch=True)
 
-                sql = 'UPDATE manga_service SET last_check=%s, next_update=%s, disabled=%s WHERE manga_id=%s AND service_id=%s'
-                cursor.execute(sql, [now, next_update, disabled, manga_id, service_id])
+                self.dbutil.update_manga_service_check(service_id, manga_id, now, next_update, disabled, cur=cursor)
                 if newest_chapter:
                     self.dbutil.update_latest_chapter(((manga_id, newest_chapter.chapter_number, newest_chapter.release_date),), cur=cursor)
 
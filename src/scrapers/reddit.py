@@ -4,13 +4,14 @@ import time
 import typing
 from calendar import timegm
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Any, Set
+from typing import Dict, Optional, List, Any, Set, cast
 
 import feedparser
 from lxml import etree
 
 from src.errors import FeedHttpError, InvalidFeedError
-from src.scrapers.base_scraper import BaseScraper, BaseChapterSimple
+from src.scrapers.base_scraper import BaseScraper, BaseChapterSimple, \
+    SeriesFetchResult
 from src.utils.utilities import match_title, is_valid_feed, get_latest_chapters, \
     utcnow, utcfromtimestamp
 
@@ -117,6 +118,9 @@ class Reddit(BaseScraper):
         return chapters
 
     def scrape_series(self, title_id: str, service_id: int, manga_id: int, feed_url: str) -> Optional[Set[int]]:
+        return self.scrape_series_staged(title_id, service_id, manga_id, feed_url)
+
+    def fetch_series(self, title_id: str, service_id: int, manga_id: int, feed_url: str) -> Optional[SeriesFetchResult]:
         feed = feedparser.parse(feed_url)
         try:
             is_valid_feed(feed)
@@ -124,13 +128,29 @@ class Reddit(BaseScraper):
             logger.exception(f'Failed to fetch feed {feed_url}')
             return None
 
+        group_name = '/'.join(feed_url.split('reddit.com/')[1].split('/')[:2])
+
+        # Group id is set in the persist stage
+        return SeriesFetchResult(
+            title_id, service_id, manga_id,
+            self.parse_feed(feed.entries),
+            data=(feed_url, group_name)
+        )
+
+    def persist_series(self, result: SeriesFetchResult) -> Optional[Set[int]]:
+        service_id = result.service_id
+        manga_id = result.manga_id
+        feed_url, group_name = result.data
+
+        # Next update is scheduled around the predicted release by the scheduler
         self.dbutil.set_manga_last_checked(service_id, manga_id, utcnow())
-        self.dbutil.update_manga_next_update(service_id, manga_id, self.next_update())
 
-        group_name = '/'.join(feed_url.split('reddit.com/')[1].split('/')[:2])
         group_id = self.dbutil.get_or_create_group(group_name).group_id
+        parsed = cast(List[Chapter], result.chapters)
+        for c in parsed:
+            c.group_id = group_id
 
-        chapters = self.dbutil.get_only_latest_entries(service_id, self.parse_feed(feed.entries, group_id=group_id))
+        chapters = self.dbutil.get_only_latest_entries(service_id, parsed)
         if not chapters:
             logger.debug(f'Nothing to update in {feed_url}')
             return set()
@@ -0,0 +1,113 @@
+from typing import Any, Dict, Optional, Set
+
+import pytest
+from psycopg import Connection
+
+from src.constants import NO_GROUP
+from src.scheduler import UpdateScheduler
+from src.tests.scrapers.testing_scraper import DummyScraper, DummyScraper2
+from src.tests.testing_utils import BaseTestClasses
+from src.utils.dbutils import DbUtil
+
+
+class TestSchedulerIndexes(BaseTestClasses.DatabaseTestCase):
+    """
+    Checks that the hot scheduler queries use the indexes made for them
+    when the database contains about a million chapters
+    """
+    MANGA_COUNT = 10_000
+    CHAPTERS_PER_MANGA = 100
+    manga_id: int = NotImplemented
+    """Seeded manga used in the queries"""
+
+    @pytest.fixture(autouse=True, scope='class')
+    def _seed_chapters(self, request: pytest.FixtureRequest, conn: Connection):
+        prefix = f'{request.cls.__name__}_seed'
+        sql = f'''
+        WITH m AS (
+            INSERT INTO manga (title)
+            SELECT %(prefix)s || g FROM generate_series(1, {self.MANGA_COUNT}) g
+            RETURNING manga_id, title
+        ), ms AS (
+            INSERT INTO manga_service (manga_id, service_id, title_id, disabled, next_update)
+            SELECT manga_id,
+                   CASE WHEN manga_id %% 2 = 0 THEN %(service_id)s ELSE %(service_id2)s END,
+                   title,
+                   manga_id %% 10 = 0,
+                   NOW() + (manga_id %% 100 - 2) * INTERVAL '1 hour'
+            FROM m
+            RETURNING manga_id, service_id, title_id
+        )
+        INSERT INTO chapters (manga_id, service_id, title, chapter_number, chapter_decimal, chapter_identifier, release_date, group_id)
+        SELECT ms.manga_id, ms.service_id, 'Chapter ' || n, n / 2,
+               CASE WHEN n %% 10 = 0 THEN 5 END,
+               ms.title_id || '_' || n,
+               NOW() - n * INTERVAL '1 day',
+               %(group_id)s
+        FROM ms CROSS JOIN generate_series(1, {self.CHAPTERS_PER_MANGA}) n
+        '''
+
+        # Seeded rows are only visible to the tests of this class
+        with conn.transaction(force_rollback=True):
+            with conn.cursor() as cur:
+                cur.execute(sql, {
+                    'prefix': prefix,
+                    'service_id': DummyScraper.ID,
+                    'service_id2': DummyScraper2.ID,
+                    'group_id': NO_GROUP
+                })
+                # Every seeded title is followed by one user
+                cur.execute('INSERT INTO users (username, email, pwhash) VALUES (%s, %s, %s) RETURNING user_id',
+                            (prefix, f'{prefix}@example.com', 'hash'))
+                cur.execute('INSERT INTO user_follows (manga_id, user_id) '
+                            'SELECT manga_id, %s FROM manga_service WHERE title_id LIKE %s',
+                            (cur.fetchone()['user_id'], f'{prefix}%'))
+                cur.execute('ANALYZE manga_service')
+                cur.execute('ANALYZE chapters')
+                cur.execute('ANALYZE user_follows')
+                cur.execute('SELECT manga_id FROM manga_service WHERE title_id=%s', (f'{prefix}1',))
+                request.cls.manga_id = cur.fetchone()['manga_id']
+
+            yield
+
+    def get_used_indexes(self, sql: str, params: Optional[Dict[str, Any]] = None) -> Set[str]:
+        with self.conn.cursor() as cur:
+            cur.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plans = [cur.fetchone()['QUERY PLAN'][0]['Plan']]
+
+        indexes = set()
+        while plans:
+            plan = plans.pop()
+            if 'Index Name' in plan:
+                indexes.add(plan['Index Name'])
+            plans.extend(plan.get('Plans', []))
+
+        return indexes
+
+    def test_due_titles(self):
+        indexes = self.get_used_indexes(DbUtil.DUE_MANGA_SERVICES_SQL, {
+            'service_ids': [DummyScraper.ID, DummyScraper2.ID],
+            'amounts': [100, 100],
+            'max_overdue': DbUtil.DUE_MAX_OVERDUE_HOURS,
+            'release_bonus': DbUtil.DUE_RELEASE_BONUS_HOURS,
+            'follower_weight': DbUtil.DUE_FOLLOWER_WEIGHT_HOURS
+        })
+        self.assertIn('manga_service_due_index', indexes)
+        self.assertIn('user_follows_manga_id_index', indexes)
+
+    def test_next_service_update(self):
+        self.assertIn('manga_service_due_index', self.get_used_indexes(UpdateScheduler.NEXT_UPDATE_SQL))
+
+    def test_whole_chapters(self):
+        sql = f'SELECT chapter_number, MIN(release_date) FROM chapters ' \
+              f'WHERE manga_id={int(self.manga_id)} AND chapter_decimal IS NULL ' \
+              f'GROUP BY chapter_number ORDER BY chapter_number DESC'
+        self.assertIn('chapters_whole_chapters_index', self.get_used_indexes(sql))
+
+    def test_chapters_of_service(self):
+        sql = f'SELECT * FROM chapters WHERE manga_id={int(self.manga_id)} AND service_id={int(DummyScraper2.ID)}'
+        self.assertIn('chapters_manga_id_service_id_index', self.get_used_indexes(sql))
+
+    def test_newest_chapter(self):
+        sql = f'SELECT * FROM chapters WHERE manga_id={int(self.manga_id)} ORDER BY release_date DESC LIMIT 1'
+        self.assertIn('chapters_manga_id_release_date_index', self.get_used_indexes(sql))
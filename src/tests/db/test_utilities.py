@@ -0,0 +1,52 @@
+import unittest
+from datetime import timedelta
+
+from src.db.utilities import execute_unnest, unnest_template
+from src.tests.testing_utils import BaseTestClasses, spy_on
+from src.utils.utilities import utcnow
+
+
+class TestExecuteUnnest(BaseTestClasses.DatabaseTestCase):
+    def test_unnest_template(self):
+        self.assertEqual(unnest_template(['int', 'text']), 'unnest(%s::int[], %s::text[])')
+
+    def test_empty_values(self):
+        with self.conn.cursor() as cur:
+            cur = spy_on(cur)
+            self.assertEqual(execute_unnest(cur, 'SELECT * FROM %s', [], ['int'], fetch=True), [])
+            self.assertIsNone(execute_unnest(cur, 'SELECT * FROM %s', [], ['int']))
+            cur.execute.assert_not_called()
+
+    def test_returns_rows_in_order(self):
+        now = utcnow()
+        values = [
+            (1, 'a', now, timedelta(hours=1), None),
+            (2, None, None, None, None),
+            (3, 'c', now, None, None)
+        ]
+        sql = 'SELECT * FROM %s AS t(id, text, date, interval, empty)'
+
+        with self.conn.cursor() as cur:
+            rows = execute_unnest(cur, sql, values, ['int', 'text', 'timestamptz', 'interval', 'int'], fetch=True)
+
+        self.assertListEqual(
+            [(r['id'], r['text'], r['date'], r['interval'], r['empty']) for r in rows],
+            values
+        )
+
+    def test_statement_does_not_depend_on_value_count(self):
+        with self.conn.cursor() as cur:
+            cur = spy_on(cur)
+            execute_unnest(cur, 'SELECT * FROM %s', [(1, 'a')], ['int', 'text'])
+            execute_unnest(cur, 'SELECT * FROM %s', [(i, str(i)) for i in range(100)], ['int', 'text'])
+
+            first, second = cur.execute.call_args_list
+            self.assertEqual(first[0][0], second[0][0])
+
+    def test_column_count_mismatch(self):
+        with self.conn.cursor() as cur:
+            self.assertRaises(ValueError, execute_unnest, cur, 'SELECT * FROM %s', [(1, 2)], ['int'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,6 +13,7 @@ from lxml import etree
 from src.constants import NO_GROUP
 from src.scrapers.comixology import ComiXology
 from src.tests.testing_utils import BaseTestClasses, load_chapters_snapshot
+from src.utils.cache import invalidate_identity_caches
 from src.utils.utilities import utcnow
 
 pytest.skip('ComiXology not in use anymore as it moved to amazon.', allow_module_level=True)
@@ -91,6 +92,8 @@ class TestComiXologyScraper(BaseTestClasses.DatabaseTestCase, BaseTestClasses.Mo
             with self.conn.cursor() as cur:
                 cur.execute('DELETE FROM chapters WHERE service_id=%s', (ComiXology.ID,))
 
+        invalidate_identity_caches()
+
     @responses.activate
     def test_scrape_service_works(self):
         self.set_up_responses()
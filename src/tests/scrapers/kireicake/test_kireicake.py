@@ -5,8 +5,9 @@ from datetime import datetime, timedelta, timezone
 import pytest
 import responses
 
-from src.scrapers.base_scraper import BaseChapterSimple
+from src.scrapers.base_scraper import BaseChapterSimple, ScrapeServiceRetVal
 from src.scrapers.kireicake import KireiCake
+from src.tests.testing_utils import spy_on
 from src.tests.utils.test_dbutil import BaseTestClasses
 from src.utils.dbutils import DbUtil
 from src.utils.utilities import utctoday
@@ -106,6 +107,32 @@ class KireiCakeTest(BaseTestClasses.DatabaseTestCase, BaseTestClasses.ModelAsser
         self.assertFalse(kc.scrape_service(kc.ID, KireiCake.FEED_URL, None))
         self.assertMangaWithTitleFound('Helck: Völundio ~Surreal Sword Saga~')
 
+    @responses.activate
+    def test_scrape_service_skips_unmodified_feed(self):
+        feed_url = KireiCake.FEED_URL + '/conditional'
+        etag = '"feed-etag"'
+        responses.add(responses.GET, feed_url, body=self.test_data, headers={'ETag': etag})
+        responses.add(responses.GET, feed_url, status=304)
+        responses.add(responses.GET, feed_url, body=self.test_data)
+
+        kc = self.get_scraper()
+        dbutil = spy_on(kc.dbutil)
+        kc._dbutil = dbutil
+
+        self.assertIsNotNone(kc.scrape_service(kc.ID, feed_url, None))
+        self.assertEqual(self.dbutil.get_feed_cache(feed_url).etag, etag)
+
+        dbutil.reset_mock()
+        self.assertEqual(kc.scrape_service(kc.ID, feed_url, None), ScrapeServiceRetVal())
+        self.assertEqual(responses.calls[1].request.headers['If-None-Match'], etag)
+        dbutil.get_only_latest_entries.assert_not_called()
+
+        # Same content without validators is detected using the content hash
+        self.assertEqual(kc.scrape_service(kc.ID, feed_url, None), ScrapeServiceRetVal())
+        dbutil.get_only_latest_entries.assert_not_called()
+
+        self.assertEqual(len(responses.calls), 3)
+
     @responses.activate
     def test_scrape_service_returns_nothing_on_error_status(self):
         responses.add(responses.GET, KireiCake.FEED_URL, status=500)
@@ -2,7 +2,8 @@ import json
 import logging
 import os
 import unittest
-from typing import Dict, List
+from typing import Dict, List, Set
+from urllib.parse import parse_qs, urlsplit
 from unittest.mock import patch, Mock
 
 import pytest
@@ -16,9 +17,13 @@ from src.db.models.authors import AuthorPartial
 from src.db.models.chapter import Chapter
 from src.db.models.groups import Group, GroupPartial
 from src.db.models.manga import MangaService
+from src.scrapers.base_scraper import SeriesInfo, SeriesFetchResult
 from src.scrapers.mangadex import MangaDex, ChapterResult, \
     Chapter as MangaDexChapter
+from src.scrapers.mangadex.mangadex import SyncWatermark
+from src.scrapers.mangadex.mangadex_api import format_date, parse_chapter_records
 from src.tests.testing_utils import BaseTestClasses, ChapterTestModel
+from src.utils.cache import invalidate_identity_caches
 from src.utils.utilities import utcnow
 
 correct_parsed_chapters = list(sorted([
@@ -119,6 +124,8 @@ class MangadexTests(BaseTestClasses.DatabaseTestCase, BaseTestClasses.ModelAsser
     def setUp(self) -> None:
         super().setUp()
         self.mangadex = MangaDex(self.conn, self.dbutil)
+        invalidate_identity_caches()
+        self.conn.execute('DELETE FROM metadata_cache WHERE service_id=%s', (MangaDex.ID,))
 
     def delete_chapters(self, service_id: int = MangaDex.ID):
         super().delete_chapters(service_id)
@@ -167,6 +174,7 @@ class MangadexTests(BaseTestClasses.DatabaseTestCase, BaseTestClasses.ModelAsser
     @responses.activate
     def test_scrape_service(self):
         self.delete_chapters()
+        self.dbutil.update_service_whole_last_id(MangaDex.ID, None)
         self.set_up_api()
         service_id = self.mangadex.ID
         chapter_count = 5
@@ -230,6 +238,154 @@ class MangadexTests(BaseTestClasses.DatabaseTestCase, BaseTestClasses.ModelAsser
         self.assertEqual(len(retval.chapter_ids), 0)
         self.assertEqual(len(retval.manga_ids), 0)
 
+    @responses.activate
+    def test_sync_feed_watermark(self):
+        self.delete_chapters()
+        self.dbutil.update_service_whole_last_id(MangaDex.ID, None)
+        self.set_up_api()
+
+        self.mangadex.scrape_service(MangaDex.ID, self.mangadex.FEED_URL, None)
+        newest = max(self.chapters_data['data'], key=lambda c: (c['attributes']['createdAt'], c['id']))
+        watermark = SyncWatermark.parse(self.dbutil.get_service_whole(MangaDex.ID).last_id)  # type: ignore[union-attr]
+        self.assertIsNotNone(watermark)
+        self.assertEqual(watermark.chapter_id, newest['id'])  # type: ignore[union-attr]
+
+        responses.calls.reset()
+        retval = self.mangadex.scrape_service(MangaDex.ID, self.mangadex.FEED_URL, None)
+        self.assertEqual(len(retval.chapter_ids), 0)  # type: ignore[union-attr]
+
+        query = parse_qs(urlsplit(responses.calls[0].request.url).query)
+        self.assertEqual(query['createdAtSince'], [format_date(watermark.created_at)])  # type: ignore[union-attr]
+        self.assertEqual(query['order[createdAt]'], ['asc'])
+
+    @responses.activate
+    def test_sync_feed_watermark_keeps_failed_titles(self):
+        self.delete_chapters()
+        self.dbutil.update_service_whole_last_id(MangaDex.ID, None)
+        responses.add(responses.GET, f'{self.API_URL}/chapter', json=self.chapters_data)
+
+        with patch.object(self.mangadex.api, 'get_manga', side_effect=ValueError('Failed to fetch')):
+            self.mangadex.scrape_service(MangaDex.ID, self.mangadex.FEED_URL, None)
+
+        added = {
+            row['chapter_identifier'] for row in
+            self.dbutil.execute('SELECT chapter_identifier FROM chapters WHERE service_id=%s', (MangaDex.ID,))
+        }
+        records = parse_chapter_records(self.chapters_data['data'])
+        dropped = [SyncWatermark(r.created_at, r.id) for r in records if r.id not in added]
+        self.assertTrue(dropped)
+
+        # The next sync starts before every chapter that was not added
+        watermark = SyncWatermark.parse(self.dbutil.get_service_whole(MangaDex.ID).last_id)  # type: ignore[union-attr]
+        if watermark is not None:
+            self.assertLess(watermark, min(dropped))
+
+    def test_known_chapters_capped(self):
+        MangaDex.known_chapters.clear()
+        known_per_title = src.scrapers.mangadex.mangadex.KNOWN_CHAPTERS_PER_TITLE
+
+        def result(start: int, count: int) -> SeriesFetchResult:
+            chapters = [
+                MangaDexChapter(str(i), f'chapter-{i}', 'title', utcnow(), '', '')
+                for i in range(start, start + count)
+            ]
+            return SeriesFetchResult('title', MangaDex.ID, 1, chapters, data={})
+
+        with patch.object(self.mangadex, 'persist_chapters'):
+            self.mangadex.persist_series_batch([result(0, 10)])
+            self.assertSetEqual(MangaDex.known_chapters.get('title'), {f'chapter-{i}' for i in range(10)})  # type: ignore[arg-type]
+
+            # Newest fetched chapters are kept over the previously known ones
+            self.mangadex.persist_series_batch([result(10, known_per_title)])
+            self.assertSetEqual(
+                MangaDex.known_chapters.get('title'),  # type: ignore[arg-type]
+                {f'chapter-{i}' for i in range(10, 10 + known_per_title)}
+            )
+
+    @responses.activate
+    def test_metadata_cache(self):
+        self.delete_chapters()
+        self.dbutil.update_service_whole_last_id(MangaDex.ID, None)
+        self.set_up_api()
+        manga_url = f'{self.API_URL}/manga'
+        cached_ids = {m['id'] for m in self.manga_data['data']}
+
+        def fetched_ids() -> Set[str]:
+            return {
+                title_id
+                for c in responses.calls if c.request.url.startswith(manga_url)
+                for title_id in parse_qs(urlsplit(c.request.url).query)['ids[]']
+            }
+
+        def rescrape():
+            self.delete_chapters()
+            self.dbutil.update_service_whole_last_id(MangaDex.ID, None)
+            responses.calls.reset()
+            return self.mangadex.scrape_service(MangaDex.ID, self.mangadex.FEED_URL, None)
+
+        self.mangadex.scrape_service(MangaDex.ID, self.mangadex.FEED_URL, None)
+        self.assertTrue(cached_ids.issubset(fetched_ids()))
+        cache = self.dbutil.get_metadata_cache(MangaDex.ID, cached_ids)
+        self.assertSetEqual(set(cache.keys()), cached_ids)
+
+        # Fresh metadata is not fetched again
+        retval = rescrape()
+        self.assertEqual(len(retval.chapter_ids), len(correct_parsed_chapters))  # type: ignore[union-attr]
+        self.assertFalse(cached_ids.intersection(fetched_ids()))
+
+        # Expired but unchanged metadata is fetched but not written
+        self.conn.execute("UPDATE metadata_cache SET last_check=NOW() - INTERVAL '2 days' WHERE service_id=%s", (MangaDex.ID,))
+        with patch.object(self.mangadex, 'update_manga_info_and_title') as update_info:
+            rescrape()
+            self.assertTrue(cached_ids.issubset(fetched_ids()))
+            update_info.assert_not_called()
+
+        # Metadata is written again after the refresh interval
+        self.conn.execute("UPDATE metadata_cache SET last_check=NOW() - INTERVAL '2 days', "
+                          "last_update=NOW() - INTERVAL '8 days' WHERE service_id=%s", (MangaDex.ID,))
+        with patch.object(self.mangadex, 'update_manga_info_and_title') as update_info:
+            rescrape()
+            update_info.assert_called_once()
+
+    @responses.activate
+    def test_scrape_series_batch(self):
+        self.delete_chapters()
+
+        def chapters_callback(request):
+            manga_id = parse_qs(urlsplit(request.url).query)['manga'][0]
+            data = dict(self.chapters_data)
+            data['data'] = [
+                c for c in self.chapters_data['data']
+                if any(r['type'] == 'manga' and r['id'] == manga_id for r in c['relationships'])
+            ]
+            data['total'] = len(data['data'])
+            return 200, {}, json.dumps(data)
+
+        responses.add_callback(responses.GET, f'{self.API_URL}/chapter', chapters_callback)
+        manga_resp = responses.add(responses.GET, f'{self.API_URL}/manga', json=self.manga_data)
+
+        series = []
+        for title_id in ('6fe9349a-8eeb-42cf-bead-e6f40b2653de', 'b145fa37-e63a-4c1c-a1b8-dc2d3e2ef351'):
+            ms = self.dbutil.get_manga_service(MangaDex.ID, title_id) or self.dbutil.add_manga_service(
+                MangaService(service_id=MangaDex.ID, title_id=title_id, title=title_id),
+                add_manga=True
+            )
+            series.append(SeriesInfo(title_id, ms.manga_id, None))
+
+        retval = self.mangadex.scrape_series_batch(MangaDex.ID, series)
+
+        self.assertIsNotNone(retval)
+        self.assertSetEqual(retval.manga_ids, {s.manga_id for s in series})
+        self.assertEqual(len(retval.chapter_ids), 3)
+        # Manga infos of every title are fetched with a single request
+        self.assertEqual(manga_resp.call_count, 1)
+
+        # A new process without in-process caches does not fetch manga infos without new chapters
+        MangaDex.known_chapters.clear()
+        retval = self.mangadex.scrape_series_batch(MangaDex.ID, series)
+        self.assertFalse(retval.chapter_ids)
+        self.assertEqual(manga_resp.call_count, 1)
+
     @responses.activate
     def test_duplicate_group(self):
         self.delete_chapters()
@@ -255,6 +411,29 @@ class MangadexTests(BaseTestClasses.DatabaseTestCase, BaseTestClasses.ModelAsser
         self.assertGreater(len(retval.chapter_ids), 0, msg='Nothing updated')
         self.assertFalse([r for r in self.caplog.records if r.levelno >= logging.WARNING], msg='Warnings found')
 
+    @responses.activate
+    def test_group_ids_cached(self):
+        self.delete_chapters()
+        self.set_up_api()
+        service_id = self.mangadex.ID
+
+        self.mangadex.scrape_service(service_id, self.mangadex.FEED_URL, None)
+        chapters = self.mangadex.parse_feed(parse_chapter_records(self.chapters_data['data']))
+        group_ids = {c.mangadex_group.id for c in chapters if c.mangadex_group}
+        self.assertSetEqual(set(MangaDex.group_ids.get_many(group_ids).keys()), group_ids)
+
+        with patch.object(self.mangadex.dbutil, 'execute') as execute, \
+                patch.object(self.mangadex.dbutil, 'find_existing_groups') as find_existing_groups:
+            mapped = self.mangadex.map_and_add_group_ids(chapters)
+            execute.assert_not_called()
+            find_existing_groups.assert_not_called()
+
+        self.assertNotIn(None, [c.group_id for c in mapped])
+
+        # Cached ids are not trusted after a rollback
+        invalidate_identity_caches()
+        self.assertFalse(MangaDex.group_ids.get_many(group_ids))
+
     @responses.activate
     def test_existing_group(self):
         self.delete_chapters()
@@ -310,5 +489,6 @@ def test_special_chapter_parsing_invalid_string(caplog):
     assert [r for r in caplog.records if r.levelno == logging.WARNING]
 
 
+
 if __name__ == '__main__':
     unittest.main()
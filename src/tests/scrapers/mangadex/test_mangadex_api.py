@@ -0,0 +1,156 @@
+import copy
+import json
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+import responses
+
+from src.scrapers.mangadex.mangadex import SyncWatermark
+from src.scrapers.mangadex.mangadex_api import MangadexAPI, MAX_LIMIT, ChapterResult, \
+    format_date, ChapterRecord, parse_chapter_records, MangaResult
+
+
+class MangadexAPITest(unittest.TestCase):
+    API_URL = 'https://api.mangadex.org'
+
+    def setUp(self) -> None:
+        with open(os.path.join(os.path.dirname(__file__), 'api_data', 'chapters.json'), 'r', encoding='utf-8') as f:
+            self.chapter = json.load(f)['data'][0]
+
+        self.api = MangadexAPI(self.API_URL)
+
+    def create_chapters(self, total: int) -> List[Dict]:
+        chapters = []
+        for i in range(total):
+            chapter = copy.deepcopy(self.chapter)
+            chapter['id'] = f'chapter-{i}'
+            chapters.append(chapter)
+        return chapters
+
+    def set_up_api(self, chapters: List[Dict]) -> List[int]:
+        """
+        Serves the given chapters in pages. Returns the list of requested offsets
+        """
+        offsets: List[int] = []
+
+        def callback(request):
+            query = parse_qs(urlsplit(request.url).query)
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query['limit'][0])
+            offsets.append(offset)
+            return 200, {}, json.dumps({
+                'data': chapters[offset:offset + limit],
+                'limit': limit,
+                'offset': offset,
+                'total': len(chapters)
+            })
+
+        responses.add_callback(responses.GET, f'{self.API_URL}/chapter', callback=callback)
+        return offsets
+
+    @responses.activate
+    def test_get_chapters_fetches_all_pages(self):
+        chapters = self.create_chapters(250)
+        offsets = self.set_up_api(chapters)
+
+        result = list(self.api.get_chapters({'readableAt': 'desc'}, languages=['en'], limit=300))
+        self.assertListEqual([c.id for c in result], [c['id'] for c in chapters])
+        self.assertListEqual(sorted(offsets), [0, MAX_LIMIT, 2 * MAX_LIMIT])
+
+    @responses.activate
+    def test_get_chapters_respects_limit(self):
+        offsets = self.set_up_api(self.create_chapters(1000))
+
+        result = list(self.api.get_chapters({'readableAt': 'desc'}, languages=['en'], limit=150))
+        self.assertEqual(len(result), 150)
+        self.assertListEqual(sorted(offsets), [0, MAX_LIMIT])
+
+    @responses.activate
+    def test_get_chapters_stops_at_known_page(self):
+        chapters = self.create_chapters(300)
+        offsets = self.set_up_api(chapters)
+
+        known = {c['id'] for c in chapters}
+        result = list(self.api.get_chapters({'readableAt': 'desc'}, languages=['en'], limit=300, known_ids=known))
+        self.assertEqual(len(result), MAX_LIMIT)
+        self.assertListEqual(offsets, [0])
+
+        # Partially known page is followed by a single fully known page
+        offsets.clear()
+        known = {c['id'] for c in chapters[10:]}
+        result = list(self.api.get_chapters({'readableAt': 'desc'}, languages=['en'], limit=300, known_ids=known))
+        self.assertEqual(len(result), 2 * MAX_LIMIT)
+        self.assertListEqual(offsets, [0, MAX_LIMIT])
+
+    def test_sync_watermark(self):
+        watermark = SyncWatermark(datetime(2022, 10, 1, 12, tzinfo=timezone.utc), 'chapter-1')
+        self.assertEqual(SyncWatermark.parse(watermark.serialize()), watermark)
+        self.assertIsNone(SyncWatermark.parse(None))
+        self.assertIsNone(SyncWatermark.parse('invalid'))
+
+        results = parse_chapter_records(self.create_chapters(3))
+        results[1].created_at = watermark.created_at
+        self.assertEqual(SyncWatermark.from_results(results), SyncWatermark(watermark.created_at, 'chapter-1'))
+        self.assertEqual(format_date(watermark.created_at.astimezone(timezone(timedelta(hours=2)))), '2022-10-01T12:00:00')
+
+    def test_sync_watermark_before_dropped_titles(self):
+        results = parse_chapter_records(self.create_chapters(4))
+        start = datetime(2022, 10, 1, 12, tzinfo=timezone.utc)
+        for i, r in enumerate(results):
+            r.created_at = start + timedelta(minutes=i)
+        results[2].manga_id = 'dropped'
+
+        self.assertEqual(SyncWatermark.from_results(results, {'dropped'}), SyncWatermark(start + timedelta(minutes=1), 'chapter-1'))
+        self.assertEqual(SyncWatermark.from_results(results, {'missing'}), SyncWatermark(start + timedelta(minutes=3), 'chapter-3'))
+
+        results[0].manga_id = 'dropped'
+        self.assertIsNone(SyncWatermark.from_results(results, {'dropped'}))
+
+    def test_chapter_record_matches_model(self):
+        with open(os.path.join(os.path.dirname(__file__), 'api_data', 'chapters.json'), 'r', encoding='utf-8') as f:
+            data = json.load(f)['data']
+
+        def fields(record: ChapterRecord):
+            return {k: getattr(record, k) for k in ChapterRecord.__slots__}
+
+        records = parse_chapter_records(data)
+        self.assertEqual(len(records), len(data))
+        for record, result in zip(records, data):
+            self.assertDictEqual(fields(record), fields(ChapterRecord.from_result(ChapterResult(**result))))
+
+    def test_invalid_chapter_records_skipped(self):
+        chapters = self.create_chapters(4)
+        chapters[0]['relationships'] = []
+        del chapters[1]['attributes']['readableAt']
+        chapters[2]['attributes']['readableAt'] = 'invalid'
+
+        with self.assertLogs('debug', 'WARNING'):
+            records = parse_chapter_records(chapters)
+
+        self.assertListEqual([r.id for r in records], ['chapter-3'])
+
+    def test_manga_content_hash(self):
+        with open(os.path.join(os.path.dirname(__file__), 'api_data', 'manga.json'), 'r', encoding='utf-8') as f:
+            data = json.load(f)['data'][0]
+
+        content_hash = MangaResult(**data).content_hash()
+        self.assertEqual(MangaResult(**copy.deepcopy(data)).content_hash(), content_hash)
+
+        # Fields that are not stored do not change the hash
+        data['attributes']['updatedAt'] = '2030-01-01T00:00:00+00:00'
+        self.assertEqual(MangaResult(**data).content_hash(), content_hash)
+
+        data['attributes']['status'] = 'completed' if data['attributes']['status'] != 'completed' else 'ongoing'
+        self.assertNotEqual(MangaResult(**data).content_hash(), content_hash)
+
+    @responses.activate
+    def test_get_chapters_error(self):
+        responses.add(responses.GET, f'{self.API_URL}/chapter', status=500)
+        self.assertRaises(ValueError, list, self.api.get_chapters({'readableAt': 'desc'}, languages=['en'], limit=300))
+
+
+if __name__ == '__main__':
+    unittest.main()
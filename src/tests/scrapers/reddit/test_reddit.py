@@ -52,6 +52,8 @@ class TestRedditScraper(BaseTestClasses.ModelAssertions, BaseTestClasses.Databas
         parse.assert_called_with(feed_url)
         self.assertIsNotNone(did_update)
         self.assertTrue(did_update)
+        # Left for the predicted next update of the scheduler
+        self.assertIsNone(self.dbutil.get_manga_service(Reddit.ID, 'RedditTest').next_update)  # type: ignore[union-attr]
 
         with self._conn.transaction():
             # Parse feed again to make sure it works with duplicate inputs
@@ -0,0 +1,92 @@
+import unittest
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.daemon import UpdateDaemon
+from src.db.models.scheduled_run import ScheduledRun
+from src.scheduler import UpdateScheduler
+from src.scrapers import MangaPlus
+from src.tests.testing_utils import BaseTestClasses, set_db_environ
+from src.utils.utilities import utcnow
+
+
+class UpdateDaemonTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.scheduler = MagicMock()
+        self.scheduler.get_next_scheduled_run.return_value = None
+        self.daemon = UpdateDaemon(self.scheduler)
+
+    def test_get_sleep_time(self):
+        self.assertEqual(self.daemon.get_sleep_time(None), UpdateDaemon.MAX_SLEEP)
+        self.assertEqual(self.daemon.get_sleep_time(utcnow() - timedelta(minutes=1)), UpdateDaemon.MIN_SLEEP)
+        self.assertEqual(self.daemon.get_sleep_time(utcnow() + timedelta(days=1)), UpdateDaemon.MAX_SLEEP)
+        self.assertAlmostEqual(self.daemon.get_sleep_time(utcnow() + timedelta(minutes=2)), 120, delta=1)
+
+    def test_run_stops_after_current_run(self):
+        self.daemon.listen = MagicMock()  # type: ignore[assignment]
+        self.scheduler.run_once.side_effect = lambda: self.daemon.stop()
+
+        self.daemon.run()
+        self.scheduler.run_once.assert_called_once()
+
+    def test_run_continues_after_failure(self):
+        self.daemon.listen = MagicMock()  # type: ignore[assignment]
+        self.daemon.wait = MagicMock(side_effect=lambda _: self.daemon.stop())  # type: ignore[assignment]
+        self.scheduler.run_once.side_effect = ValueError('failed')
+
+        self.daemon.run()
+        self.scheduler.run_once.assert_called_once()
+        self.assertAlmostEqual(self.daemon.wait.call_args[0][0], UpdateDaemon.MAX_SLEEP, delta=1)
+
+    def test_notification_does_scheduled_runs(self):
+        self.daemon.listen = MagicMock()  # type: ignore[assignment]
+        self.daemon.wait = MagicMock(side_effect=[True, False])  # type: ignore[assignment]
+        self.scheduler.run_once.return_value = utcnow() + timedelta(minutes=5)
+        self.scheduler.run_scheduled_runs.side_effect = lambda: self.daemon.stop()
+
+        self.daemon.run()
+        self.scheduler.run_once.assert_called_once()
+        self.scheduler.run_scheduled_runs.assert_called_once()
+
+    def test_wakes_when_scheduled_run_cooldown_ends(self):
+        self.daemon.listen = MagicMock()  # type: ignore[assignment]
+        self.daemon.wait = MagicMock(side_effect=lambda _: self.daemon.stop())  # type: ignore[assignment]
+        self.scheduler.run_once.return_value = utcnow() + timedelta(minutes=5)
+        self.scheduler.get_next_scheduled_run.return_value = utcnow() + timedelta(minutes=1)
+
+        self.daemon.run()
+        self.assertAlmostEqual(self.daemon.wait.call_args[0][0], 60, delta=1)
+
+    def test_wait_returns_when_stopped(self):
+        self.daemon.stop()
+        self.assertFalse(self.daemon.wait(60))
+
+
+class UpdateDaemonListenTest(BaseTestClasses.DatabaseTestCase):
+    scheduler: UpdateScheduler = NotImplemented
+
+    @pytest.fixture(autouse=True, scope='class')
+    def _set_up_scheduler(self, request: pytest.FixtureRequest) -> None:
+        set_db_environ()
+        request.cls.scheduler = UpdateScheduler()
+
+    def test_wakes_on_scheduled_run(self):
+        daemon = UpdateDaemon(self.scheduler)
+        daemon.listen()
+        try:
+            self.assertFalse(daemon.wait(0.1))
+
+            manga = self.create_manga_service(MangaPlus)
+            self.dbutil.add_scheduled_runs([ScheduledRun(manga_id=manga.manga_id, service_id=MangaPlus.ID)])
+            self.conn.commit()
+
+            self.assertTrue(daemon.wait(5))
+        finally:
+            daemon.close()
+            self.dbutil.execute('TRUNCATE TABLE scheduled_runs')
+
+
+if __name__ == '__main__':
+    unittest.main()
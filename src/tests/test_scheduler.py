@@ -1,4 +1,6 @@
+import asyncio
 import unittest
+from datetime import datetime, timedelta
 from typing import Optional, cast
 from unittest import mock
 from unittest.mock import patch, MagicMock
@@ -12,10 +14,12 @@ from src.db.models.scheduled_run import ScheduledRun, ScheduledRunResult
 from src.notifier import DiscordEmbedWebhookNotifier
 from src.scheduler import UpdateScheduler
 from src.scrapers import SCRAPERS, MangaPlus, MangaDex
+from src.scrapers.base_scraper import ScrapeServiceRetVal, SeriesFetchResult, SeriesBatchFetchResult
 from src.tests.scrapers.testing_scraper import DummyScraper
 from src.tests.testing_utils import (
     BaseTestClasses, spy_on, set_db_environ, EMPTY_SCRAPE_SERVICE, TEST_USER_ID
 )
+from src.utils.utilities import utcnow
 
 
 class SchedulerRunTest(BaseTestClasses.DatabaseTestCase):
@@ -101,6 +105,22 @@ class SchedulerRunTest(BaseTestClasses.DatabaseTestCase):
             [ScheduledRunResult(manga_id=ms2.manga_id, service_id=ms2.service_id, title_id=ms2.title_id)]
         )
 
+    def test_get_next_scheduled_run(self):
+        self.dbutil.execute('TRUNCATE TABLE scheduled_runs')
+        self.assertIsNone(self.scheduler.get_next_scheduled_run())
+
+        ms = self.create_manga_service(DummyScraper)
+        self.dbutil.add_scheduled_runs([
+            ScheduledRun(manga_id=ms.manga_id, service_id=DummyScraper.ID)
+        ])
+        self.dbutil.execute('UPDATE services SET scheduled_runs_disabled_until=NULL WHERE service_id=%s', [DummyScraper.ID])
+        self.conn.commit()
+
+        try:
+            self.assertDatesAlmostEqual(cast(datetime, self.scheduler.get_next_scheduled_run()), utcnow(), delta=timedelta(seconds=5))
+        finally:
+            self.dbutil.execute('TRUNCATE TABLE scheduled_runs')
+
     def test_force_run_with_invalid_service(self):
         self.assertIsNone(self.scheduler.force_run(-1, 1))
         self.assertLogs('debug', 'warning')
@@ -124,6 +144,46 @@ class SchedulerRunTest(BaseTestClasses.DatabaseTestCase):
             self.dbutil.execute(sql, [DummyScraper.ID])
             self.dbutil.execute('TRUNCATE TABLE scheduled_runs')
 
+    def test_run_once_async(self):
+        ms1 = self.create_manga_service(DummyScraper)
+        ms2 = self.create_manga_service(DummyScraper)
+        manga_info = [
+            {'title_id': ms.title_id, 'manga_id': ms.manga_id, 'feed_url': ms.feed_url}
+            for ms in (ms1, ms2)
+        ]
+        Scraper = MagicMock(return_value=self.scraper1)
+        Scraper.supports_batch.return_value = False
+        Scraper.supports_pipeline.return_value = False
+        Scraper.title_delay.return_value = 1
+        due_manga = [(DummyScraper.ID, Scraper, manga_info)]
+
+        with patch.object(self.scheduler, 'get_due_manga', return_value=due_manga), \
+                patch.object(self.scheduler, 'get_due_services', return_value=[]), \
+                patch.object(self.scheduler, 'do_scheduled_runs', return_value=EMPTY_SCRAPE_SERVICE), \
+                patch.object(self.scheduler, 'finish_run') as finish_mock, \
+                patch('src.scheduler.asyncio.sleep', new_callable=mock.AsyncMock) as sleep_mock:
+            asyncio.run(self.scheduler.run_once_async())
+
+        self.scraper1.scrape_series.assert_any_call(ms1.title_id, DummyScraper.ID, ms1.manga_id, ms1.feed_url)
+        self.scraper1.scrape_series.assert_any_call(ms2.title_id, DummyScraper.ID, ms2.manga_id, ms2.feed_url)
+        self.scraper1.set_checked.assert_called_once_with(DummyScraper.ID)
+        sleep_mock.assert_awaited_once()
+        finish_mock.assert_called_once_with(mock.ANY, set(), [])
+
+    def test_persist_batch_schedules_fetched_titles(self):
+        fetched = [SeriesFetchResult('1', DummyScraper.ID, 1, [])]
+        scraper = MagicMock()
+        scraper.persist_series_batch.return_value = ScrapeServiceRetVal(manga_ids={1}, chapter_ids={3})
+
+        batch = SeriesBatchFetchResult(fetched, failed=[2, 3], errors=[3])
+        with patch.object(self.scheduler, 'schedule_next_updates') as schedule_mock:
+            retval = self.scheduler.persist_batch(scraper, DummyScraper.ID, batch)
+
+        self.assertEqual(retval, ({1}, [3]))
+        # Titles that failed to be fetched stay due unless fetching raised an error
+        schedule_mock.assert_called_once_with(scraper, DummyScraper.ID, [1])
+        scraper.dbutil.update_manga_next_update.assert_called_once_with(DummyScraper.ID, 3, scraper.next_update())
+
     @patch.object(DiscordEmbedWebhookNotifier, 'send_notification')
     def test_send_notifications(self, notify_mock: MagicMock):
         ms1 = self.create_manga_service()
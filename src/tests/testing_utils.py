@@ -23,6 +23,7 @@ from src.scheduler import LoggingCursor
 from src.scrapers.base_scraper import BaseChapter, BaseScraper, \
     BaseChapterSimple
 from src.tests.scrapers.testing_scraper import DummyScraper
+from src.utils.cache import invalidate_identity_caches
 from src.utils.utilities import utcnow
 
 originalParse = feedparser.parse
@@ -204,6 +205,8 @@ class BaseTestClasses:
         def delete_chapters(self, service_id: int):
             self.dbutil.execute('DELETE FROM chapters WHERE service_id=%s',
                                 (service_id,))
+            # Deleted chapters are still in the recent chapter identifiers
+            invalidate_identity_caches()
 
         def assertChapterEqualsRow(self, chapter: 'Chapter', row: DictRow) -> None:
             pairs: list[tuple[str, str] | tuple[str, str, Any]] = [
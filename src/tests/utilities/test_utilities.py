@@ -1,12 +1,14 @@
 import json
 import os
 import unittest
+from datetime import datetime, timedelta
 
 import pytest
 
 from src.utils.utilities import (universal_chapter_regex, match_title,
                                  parse_chapter_number, round_seconds,
-                                 remove_chapter_prefix)
+                                 remove_chapter_prefix, get_latest_chapters,
+                                 LatestChapters)
 
 
 class TestUtilities(unittest.TestCase):
@@ -78,5 +80,33 @@ def test_remove_chapter_prefix(title, correct):
     assert remove_chapter_prefix(title) == correct
 
 
+def test_get_latest_chapters():
+    now = datetime.utcnow()
+    rows = [
+        {'manga_id': 1, 'chapter_number': 2, 'chapter_decimal': None, 'release_date': now},
+        {'manga_id': 1, 'chapter_number': 3, 'chapter_decimal': None, 'release_date': now - timedelta(days=1)},
+        {'manga_id': 1, 'chapter_number': 4, 'chapter_decimal': 5, 'release_date': now},
+        {'manga_id': 2, 'chapter_number': 1, 'chapter_decimal': None, 'release_date': now},
+        {'manga_id': 2, 'chapter_number': 1, 'chapter_decimal': None, 'release_date': now - timedelta(hours=1)},
+    ]
+
+    assert get_latest_chapters(rows) == {
+        1: (1, 3, now - timedelta(days=1)),
+        2: (2, 1, now - timedelta(hours=1)),
+    }
+
+
+def test_latest_chapters_pop_all():
+    now = datetime.utcnow()
+    latest = LatestChapters()
+    latest.update([(1, 5, now), (2, 1, now)])
+    latest.add(1, 4, now)
+    latest.add(2, 2, now)
+
+    assert latest.pop_all([1]) == [(1, 5, now)]
+    assert len(latest) == 0
+    assert latest.pop_all() == []
+
+
 if __name__ == '__main__':
     pytest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+from src.utils.cache import TTLCache, LRUCache, identity_cache, \
+    invalidate_on_error
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self) -> float:
+        return self.time
+
+
+class TTLCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+
+    def test_entries_expire(self):
+        cache: TTLCache[str, int] = TTLCache(10, 5, clock=self.clock)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=10)
+        self.assertEqual(cache.get('a'), 1)
+
+        self.clock.time = 5
+        self.assertIsNone(cache.get('a'))
+        self.assertNotIn('a', cache)
+        self.assertIn('b', cache)
+
+        self.clock.time = 10
+        self.assertIsNone(cache.get('b'))
+
+    def test_least_recently_used_evicted(self):
+        cache: TTLCache[str, int] = TTLCache(2, 5, clock=self.clock)
+        cache.update({'a': 1, 'b': 2})
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_pop_and_clear(self):
+        cache: TTLCache[str, int] = TTLCache(2, 5, clock=self.clock)
+        cache.update({'a': 1, 'b': 2})
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a'))
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_invalid_size(self):
+        self.assertRaises(ValueError, TTLCache, 0, 5)
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_least_recently_used_evicted(self):
+        cache: LRUCache[str, int] = LRUCache(2)
+        cache.update({'a': 1, 'b': 2})
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertDictEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+
+    def test_get_many_refreshes_entries(self):
+        cache: LRUCache[str, int] = LRUCache(2)
+        cache.update({'a': 1, 'b': 2})
+        cache.get_many(['a'])
+        cache.set('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+
+    def test_identity_caches_invalidated_on_error(self):
+        cache = identity_cache(10)
+        cache.set('a', 1)
+
+        with invalidate_on_error():
+            pass
+        self.assertEqual(cache.get('a'), 1)
+
+        @invalidate_on_error()
+        def fail():
+            raise ValueError()
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
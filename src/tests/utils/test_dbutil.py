@@ -8,10 +8,11 @@ import psycopg
 from src.constants import NO_GROUP
 from src.db.models.chapter import Chapter as ChapterModel
 from src.db.models.manga import MangaService, Manga, MangaServicePartial
-from src.db.models.services import Service
+from src.db.models.services import Service, FeedCache
 from src.tests.scrapers.testing_scraper import DummyScraper, DummyScraper2
 from src.tests.testing_utils import Chapter, BaseTestClasses, spy_on
-from src.utils.utilities import utcnow
+from src.utils.dbutils import DbUtil, DeferredWrites, NotificationStats
+from src.utils.utilities import utcnow, LatestChapters
 
 if TYPE_CHECKING:
     # noinspection PyUnresolvedReferences
@@ -487,6 +488,28 @@ class TestDbUtil(BaseDbutilTest):
         self.assertEqual(update_multiple['latest_chapter'], manga_ids[2][1])
         self.assertDatesEqual(update_multiple['estimated_release'], manga_ids[2][2] + update_multiple['release_interval'])
 
+    def test_flush_latest_chapters(self):
+        manga = self.create_manga_service()
+        other = self.create_manga_service()
+        now = utcnow()
+        dbutil = DbUtil(self.conn, None, LatestChapters())
+
+        with self.conn.cursor() as cur:
+            cur = spy_on(cur)
+            dbutil.update_latest_chapter([(manga.manga_id, 3, now), (other.manga_id, 3, now)], cur=cur)
+            dbutil.update_latest_chapter([(manga.manga_id, 5, now), (manga.manga_id, 4, now)], cur=cur)
+            cur.execute.assert_not_called()
+
+            dbutil.flush_latest_chapters({manga.manga_id}, cur=cur)
+            cur.execute.assert_called_once()
+
+        self.assertEqual(self.dbutil.get_manga(manga.manga_id).latest_chapter, 5)
+        self.assertIsNone(self.dbutil.get_manga(other.manga_id).latest_chapter)
+
+        # Older chapters do not replace newer ones
+        self.dbutil.update_latest_chapter([(manga.manga_id, 4, now)])
+        self.assertEqual(self.dbutil.get_manga(manga.manga_id).latest_chapter, 5)
+
     def test_update_estimated_release(self):
         with self._conn.transaction():
             with self._conn.cursor() as cur:
@@ -542,6 +565,215 @@ class TestDbUtil(BaseDbutilTest):
                 self.assertDatesAlmostEqual(service_whole.last_check, now)
                 self.assertDatesAlmostEqual(service_whole.next_update, now + update_interval)
 
+    def test_flush_writes(self):
+        manga = self.create_manga_service()
+        disabled = self.create_manga_service()
+        now = utcnow()
+        dbutil = DbUtil(self.conn, None, deferred_writes=DeferredWrites())
+
+        with self.conn.cursor() as cur:
+            cur = spy_on(cur)
+            dbutil.set_manga_last_checked(manga.service_id, manga.manga_id, now, cur=cur)
+            dbutil.update_manga_next_update(manga.service_id, manga.manga_id, now - timedelta(hours=1), cur=cur)
+            dbutil.update_manga_next_update(manga.service_id, manga.manga_id, now + timedelta(hours=1), cur=cur)
+            dbutil.disable_manga_service(disabled.service_id, disabled.title_id, cur=cur)
+            dbutil.update_service_whole(DummyScraper.ID, timedelta(hours=2), cur=cur)
+            # Pending next updates in the future are kept
+            dbutil.update_predicted_next_updates(manga.service_id, [(manga.manga_id, now + timedelta(days=1))], cur=cur)
+            cur.execute.assert_not_called()
+
+            dbutil.flush_writes(cur=cur)
+            self.assertEqual(cur.execute.call_count, 4)
+
+        ms = self.dbutil.get_manga_service(manga.service_id, manga.title_id)
+        self.assertDatesAlmostEqual(ms.last_check, now)
+        self.assertDatesAlmostEqual(ms.next_update, now + timedelta(hours=1))
+        self.assertTrue(self.dbutil.get_manga_service(disabled.service_id, disabled.title_id).disabled)
+        self.assertDatesAlmostEqual(self.dbutil.get_service_whole(DummyScraper.ID).next_update, now + timedelta(hours=2))
+
+    def test_notification_stats_merge(self):
+        writes = DeferredWrites()
+        writes.update_notification_stats(1, 1, 1)
+        writes.update_notification_stats(1, 2, 0)
+        writes.update_notification_stats(1, 1, 1)
+        self.assertEqual(writes.notification_stats[1], NotificationStats(4, 2, True, 1))
+
+        writes.update_notification_stats(2, 1, 1)
+        writes.update_notification_stats(2, 1, 1)
+        self.assertEqual(writes.notification_stats[2], NotificationStats(2, 2, False, 2))
+
+    def test_update_feed_cache(self):
+        feed_url = f'https://example.com/{self.get_str_id()}'
+        self.assertIsNone(self.dbutil.get_feed_cache(feed_url))
+
+        cache = FeedCache(feed_url=feed_url, etag='"abc"', content_hash='hash')
+        self.dbutil.update_feed_cache(cache)
+        self.assertEqual(self.dbutil.get_feed_cache(feed_url), cache)
+
+        cache = FeedCache(feed_url=feed_url, last_modified='Wed, 21 Oct 2015 07:28:00 GMT', content_hash='hash2')
+        self.dbutil.update_feed_cache(cache)
+        self.assertEqual(self.dbutil.get_feed_cache(feed_url), cache)
+
+    def test_get_or_create_groups(self):
+        self.dbutil.group_registry.clear()
+        existing = self.dbutil.get_or_create_group(self.get_str_id())
+        new_name = self.get_str_id()
+
+        with self.conn.cursor() as cur:
+            cur = spy_on(cur)
+            groups = self.dbutil.get_or_create_groups([existing.name, new_name], cur=cur)
+            self.assertEqual(groups[existing.name], existing)
+            self.assertEqual(groups[new_name].name, new_name)
+
+            # Registered groups are resolved without queries
+            cur.execute.reset_mock()
+            self.assertEqual(self.dbutil.get_or_create_group(new_name, cur=cur), groups[new_name])
+            self.assertDictEqual(self.dbutil.get_or_create_groups([existing.name, new_name], cur=cur), groups)
+            cur.execute.assert_not_called()
+
+    def test_get_only_latest_entries(self):
+        manga = self.create_manga_service()
+        existing = self.create_chapters(manga, 2)
+        self.dbutil.recent_chapter_ids.clear()
+
+        new_chapter = Chapter(
+            chapter_title='new', chapter_number=10, release_date=utcnow(),
+            chapter_identifier=self.get_str_id(), title_id=manga.title_id
+        )
+        entries = [
+            Chapter(chapter_title=c.title, chapter_number=c.chapter_number, release_date=c.release_date,
+                    chapter_identifier=c.chapter_identifier, title_id=manga.title_id)
+            for c in existing
+        ]
+        entries.append(new_chapter)
+
+        self.assertSetEqual(set(self.dbutil.get_only_latest_entries(manga.service_id, entries)), {new_chapter})
+
+        # Known chapters are not queried and inserted chapters become known
+        self.dbutil.add_chapters([new_chapter], manga.manga_id, manga.service_id)
+        with self.conn.cursor() as cur:
+            cur = spy_on(cur)
+            self.assertFalse(self.dbutil.get_only_latest_entries(manga.service_id, entries, cur=cur))
+            cur.execute.assert_not_called()
+
+    def test_ingest_chapters(self):
+        manga = self.create_manga_service()
+        new_title_id = self.get_str_id()
+        chapters = [
+            Chapter(chapter_title='existing', chapter_number=5, release_date=utcnow(),
+                    chapter_identifier=self.get_str_id(), title_id=manga.title_id,
+                    manga_title=manga.title),
+            Chapter(chapter_title='new', chapter_number=1, release_date=utcnow(),
+                    chapter_identifier=self.get_str_id(), title_id=new_title_id,
+                    manga_title=self.get_str_id()),
+        ]
+
+        result = self.dbutil.ingest_chapters(manga.service_id, chapters)
+        self.assertIn(manga.manga_id, result.manga_ids)
+        self.assertEqual(len(result.manga_ids), 2)
+        self.assertCountEqual([c.chapter_identifier for c in result.inserted],
+                              [c.chapter_identifier for c in chapters])
+
+        new_manga_id = next(iter(result.new_manga))
+        self.assertEqual(result.new_manga[new_manga_id], chapters[1].manga_title)
+        ms = self.dbutil.get_manga_service(manga.service_id, new_title_id)
+        self.assertIsNotNone(ms)
+        self.assertEqual(ms.manga_id, new_manga_id)
+        self.assertEqual(self.dbutil.get_manga(manga.manga_id).latest_chapter, 5)
+
+        # Ingesting the same chapters again does not insert anything
+        result = self.dbutil.ingest_chapters(manga.service_id, chapters)
+        self.assertFalse(result.inserted)
+        self.assertFalse(result.new_manga)
+
+    def test_ingest_chapters_collects_latest_chapters(self):
+        manga = self.create_manga_service()
+        latest = LatestChapters()
+        chapter = Chapter(chapter_title='latest', chapter_number=3, release_date=utcnow(),
+                          chapter_identifier=self.get_str_id(), title_id=manga.title_id,
+                          manga_title=manga.title)
+
+        DbUtil(self.conn, None, latest).ingest_chapters(manga.service_id, [chapter])
+        self.assertIsNone(self.dbutil.get_manga(manga.manga_id).latest_chapter)
+        self.assertEqual(latest.as_dict()[manga.manga_id][1], 3)
+
+    def test_ingest_chapters_skipped_titles_not_known(self):
+        manga = self.create_manga_service()
+        # Warm the recent chapter ids so added chapters are cached
+        self.dbutil.get_recent_chapter_ids(manga.service_id)
+        duplicate_title = self.get_str_id()
+        skipped = [
+            Chapter(chapter_title='dupe', chapter_number=1, release_date=utcnow(),
+                    chapter_identifier=self.get_str_id(), title_id=self.get_str_id(),
+                    manga_title=duplicate_title)
+            for _ in range(2)
+        ]
+
+        result = self.dbutil.ingest_chapters(manga.service_id, skipped)
+        self.assertFalse(result.inserted)
+        self.assertFalse(result.manga_ids)
+
+        # Chapters of skipped titles are still treated as new
+        self.assertCountEqual(self.dbutil.get_only_latest_entries(manga.service_id, skipped), skipped)
+
+    def test_add_chapters_with_copy(self):
+        manga = self.create_manga_service()
+        existing = self.create_chapters(manga, 1)[0]
+        chapters = [existing, *self.create_db_chapter_objects(manga, self.dbutil.COPY_CHAPTERS_MIN_ROWS)]
+
+        with self.conn.transaction():
+            with self.conn.cursor() as cur:
+                cur = spy_on(cur)
+                inserted = self.dbutil.add_chapters(chapters, cur=cur)
+                cur.copy.assert_called_once()
+
+            # Second batch in the same transaction must not see rows of the first one
+            more = self.create_db_chapter_objects(manga, self.dbutil.COPY_CHAPTERS_MIN_ROWS)
+            inserted_more = self.dbutil.add_chapters(more)
+
+        self.assertCountEqual([c.chapter_identifier for c in inserted], [c.chapter_identifier for c in chapters[1:]])
+        self.assertCountEqual([c.chapter_identifier for c in inserted_more], [c.chapter_identifier for c in more])
+        self.assertTrue(all(c.manga_id == manga.manga_id for c in inserted))
+
+    def test_get_due_manga_services(self):
+        now = utcnow()
+        overdue = self.create_manga_service()
+        late = self.create_manga_service()
+        released = self.create_manga_service()
+        not_due = self.create_manga_service()
+
+        self.dbutil.update_manga_next_update(DummyScraper.ID, overdue.manga_id, now - timedelta(hours=10))
+        self.dbutil.update_manga_next_update(DummyScraper.ID, late.manga_id, now - timedelta(hours=1))
+        self.dbutil.update_manga_next_update(DummyScraper.ID, released.manga_id, now - timedelta(minutes=1))
+        self.dbutil.update_manga_next_update(DummyScraper.ID, not_due.manga_id, now + timedelta(hours=1))
+        with self.conn.cursor() as cur:
+            cur.execute('UPDATE manga SET estimated_release=%s WHERE manga_id=%s', [now - timedelta(minutes=30), released.manga_id])
+            cur.execute('UPDATE manga_service SET last_check=%s WHERE manga_id=%s', [now - timedelta(hours=1), released.manga_id])
+
+        manga_ids = {overdue.manga_id, late.manga_id, released.manga_id, not_due.manga_id}
+        due = [ms.manga_id for ms in self.dbutil.get_due_manga_services({DummyScraper.ID: 10000}) if ms.manga_id in manga_ids]
+        self.assertListEqual(due, [released.manga_id, overdue.manga_id, late.manga_id])
+
+        self.assertEqual(len(self.dbutil.get_due_manga_services({DummyScraper.ID: 1})), 1)
+        self.assertListEqual(self.dbutil.get_due_manga_services({DummyScraper.ID: 0}), [])
+
+    def test_update_predicted_next_updates(self):
+        now = utcnow()
+        due = self.create_manga_service()
+        scheduled = self.create_manga_service()
+        self.dbutil.update_manga_next_update(DummyScraper.ID, due.manga_id, now - timedelta(hours=1))
+        self.dbutil.update_manga_next_update(DummyScraper.ID, scheduled.manga_id, now + timedelta(hours=1))
+
+        predicted = now + timedelta(days=2)
+        self.dbutil.update_predicted_next_updates(DummyScraper.ID, [(due.manga_id, predicted), (scheduled.manga_id, predicted)])
+
+        # Next updates already in the future are kept
+        self.assertEqual(self.dbutil.get_manga_service(DummyScraper.ID, due.title_id).next_update, predicted)  # type: ignore[union-attr]
+        self.assertDatesAlmostEqual(
+            self.dbutil.get_manga_service(DummyScraper.ID, scheduled.title_id).next_update,  # type: ignore[union-attr, arg-type]
+            now + timedelta(hours=1)
+        )
+
 
 class TestGetService(BaseDbutilTest):
     @staticmethod
@@ -819,6 +1051,70 @@ class TestUpdateInterval(BaseDbutilTest):
             interval
         )
 
+    def test_update_multiple_intervals(self):
+        m1 = self.setup_manga()
+        m2 = self.setup_manga()
+        m3 = self.setup_manga()
+
+        t = utcnow()
+        self.dbutil.add_chapters([
+            *[self.get_chapter(m1, i, t + timedelta(days=7) * i) for i in range(1, 6)],
+            *[self.get_chapter(m2, i, t + timedelta(days=14) * i) for i in range(1, 40)],
+            self.get_chapter(m3, 1, t)
+        ])
+
+        manga_ids = [m1.manga_id, m2.manga_id, m3.manga_id]
+        intervals = self.dbutil.update_chapter_intervals(manga_ids)  # type: ignore[arg-type]
+        self.assertDictEqual(intervals, {m1.manga_id: timedelta(days=7), m2.manga_id: timedelta(days=14)})
+
+        self.assertEqual(self.dbutil.get_manga(manga_id=m1.manga_id).release_interval, timedelta(days=7))
+        self.assertEqual(self.dbutil.get_manga(manga_id=m2.manga_id).release_interval, timedelta(days=14))
+        self.assertIsNone(self.dbutil.get_manga(manga_id=m3.manga_id).release_interval)
+
+    def test_get_release_histories(self):
+        m1 = self.setup_manga()
+        m2 = self.setup_manga()
+
+        t = utcnow()
+        self.dbutil.add_chapters([self.get_chapter(m1, i, t + timedelta(days=7) * i) for i in range(1, 40)])
+
+        histories = self.dbutil.get_release_histories([m1.manga_id, m2.manga_id])  # type: ignore[list-item]
+        self.assertListEqual(list(histories.keys()), [m1.manga_id])
+        self.assertEqual(histories[m1.manga_id].interval, timedelta(days=7))  # type: ignore[index]
+        self.assertEqual(len(histories[m1.manga_id].releases), 30)  # type: ignore[index]
+
+    def test_release_window_out_of_order_insert(self):
+        m = self.setup_manga()
+        t = utcnow()
+        week = timedelta(days=7)
+
+        self.dbutil.add_chapters([self.get_chapter(m, i, t + week * i) for i in (1, 2, 3, 6, 7, 8)])
+        window = self.dbutil.get_release_windows([m.manga_id])[0]  # type: ignore[list-item]
+        self.assertListEqual(window.chapter_numbers, [8, 7, 6])
+
+        # Backfilled chapters, an earlier release of a known chapter and a chapter
+        # that connects the window to older chapters
+        self.dbutil.add_chapters([self.get_chapter(m, 9, t + week * 9), self.get_chapter(m, 7, t + week * 6)])
+        self.dbutil.add_chapters([self.get_chapter(m, 4, t + week * 4)])
+
+        window = self.dbutil.get_release_windows([m.manga_id])[0]  # type: ignore[list-item]
+        self.assertListEqual(window.chapter_numbers, [9, 8, 7, 6, 4, 3, 2, 1])
+        self.assertListEqual(self.dbutil.rebuild_release_windows([m.manga_id]), [window])  # type: ignore[list-item]
+
+    def test_release_window_updated_on_insert(self):
+        m = self.setup_manga()
+        t = utcnow()
+        week = timedelta(days=7)
+
+        self.dbutil.add_chapters([self.get_chapter(m, i, t + week * i) for i in range(1, 4)])
+        self.dbutil.add_chapters([self.get_chapter(m, i, t + week * i) for i in range(4, 6)], fetch=False)
+
+        window = self.dbutil.get_release_windows([m.manga_id])[0]  # type: ignore[list-item]
+        self.assertEqual(window.latest_chapter, 5)
+        self.assertListEqual(window.intervals, [int(week.total_seconds())] * 4)
+
+        self.assertListEqual(self.dbutil.rebuild_release_windows([m.manga_id]), [window])  # type: ignore[list-item]
+
 
 class TestUpdateMangaTitle(BaseDbutilTest):
     def gen_title(self) -> str:
@@ -0,0 +1,77 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from src.scrapers import MangaDex, MangaPlus, Reddit, KireiCake
+from src.scrapers.base_scraper import BaseScraper, SeriesFetchResult, SeriesInfo
+from src.tests.scrapers.testing_scraper import DummyScraper
+from src.utils.pipeline import PersistPipeline
+
+
+class PersistPipelineTest(unittest.TestCase):
+    def test_submit_returns_results(self):
+        with PersistPipeline(workers=2, max_queued=2) as pipeline:
+            futures = [pipeline.submit(pow, i, 2) for i in range(10)]
+            self.assertListEqual([f.result() for f in futures], [i**2 for i in range(10)])
+
+    def test_submit_blocks_when_full(self):
+        release = threading.Event()
+        pipeline = PersistPipeline(workers=1, max_queued=1)
+
+        # One job running and one queued fills the pipeline
+        pipeline.submit(release.wait)
+        pipeline.submit(release.wait)
+
+        submitted = threading.Event()
+
+        def submit():
+            pipeline.submit(lambda: None)
+            submitted.set()
+
+        t = threading.Thread(target=submit)
+        t.start()
+        self.assertFalse(submitted.wait(0.2))
+
+        release.set()
+        self.assertTrue(submitted.wait(5))
+        t.join()
+        pipeline.shutdown()
+
+    def test_failed_job_releases_slot(self):
+        def fail():
+            raise ValueError('failed')
+
+        with PersistPipeline(workers=1, max_queued=0) as pipeline:
+            fut = pipeline.submit(fail)
+            self.assertRaises(ValueError, fut.result)
+            self.assertEqual(pipeline.submit(lambda: 1).result(timeout=5), 1)
+
+    def test_supports_pipeline(self):
+        for Scraper in (MangaDex, MangaPlus, Reddit, KireiCake):
+            self.assertTrue(Scraper.supports_pipeline(), Scraper.__name__)
+
+        self.assertFalse(DummyScraper.supports_pipeline())
+
+    def test_supports_batch(self):
+        self.assertTrue(MangaDex.supports_batch())
+        self.assertFalse(MangaPlus.supports_batch())
+        self.assertFalse(DummyScraper.supports_batch())
+
+
+    def test_fetch_series_batch_failures(self):
+        scraper = MagicMock()
+        fetched = SeriesFetchResult('1', 1, 1, [])
+        scraper.fetch_series.side_effect = [fetched, None, ValueError('failed'), fetched]
+        series = [SeriesInfo(str(i), i) for i in range(1, 5)]
+
+        with self.assertLogs('debug', 'ERROR'):
+            batch = BaseScraper.fetch_series_batch(scraper, 1, series, max_errors=1)
+
+        self.assertListEqual(batch.results, [fetched])
+        self.assertListEqual(batch.failed, [2, 3])
+        self.assertListEqual(batch.errors, [3])
+        # Fetching stops once the error limit is exceeded
+        self.assertEqual(scraper.fetch_series.call_count, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import time
+import unittest
+from email.utils import formatdate
+from unittest.mock import patch, MagicMock
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from src.scrapers import MangaDex, MangaPlus
+from src.scrapers.mangadex.mangadex_api import MangadexAPI
+from src.tests.utils.test_token_bucket import FakeClock
+from src.utils import rate_limit, sessions
+from src.utils.rate_limit import RateLimit, RateLimiter, get_retry_after
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.limiter = RateLimiter('example.com', RateLimit(requests=2, per=1), clock=self.clock)
+
+    def test_reserve(self):
+        self.assertEqual(self.limiter.reserve(), 0)
+        self.assertEqual(self.limiter.reserve(), 0)
+        self.assertAlmostEqual(self.limiter.reserve(), 0.5)
+        self.assertAlmostEqual(self.limiter.reserve(), 1)
+
+    def test_backs_off_on_429(self):
+        self.limiter.update(429, {'Retry-After': '10'})
+        self.assertAlmostEqual(self.limiter.rate, 1)
+        self.assertAlmostEqual(self.limiter.reserve(), 10)
+
+        self.clock.time = 20
+        self.assertEqual(self.limiter.reserve(), 0)
+
+        # Rate never goes below the minimum
+        for _ in range(10):
+            self.limiter.update(429, {})
+        self.assertAlmostEqual(self.limiter.rate, 0.2)
+
+    def test_recovers_after_success(self):
+        self.limiter.update(429, {})
+        for _ in range(5):
+            self.limiter.update(200, {})
+        self.assertAlmostEqual(self.limiter.rate, 1.5)
+
+        for _ in range(100):
+            self.limiter.update(200, {})
+        self.assertAlmostEqual(self.limiter.rate, 2)
+
+    def test_blocks_when_no_requests_remaining(self):
+        self.limiter.update(200, CaseInsensitiveDict({'x-ratelimit-remaining': '1', 'x-ratelimit-retry-after': '30'}))
+        self.assertEqual(self.limiter.reserve(), 0)
+
+        self.limiter.update(200, CaseInsensitiveDict({'x-ratelimit-remaining': '0', 'x-ratelimit-retry-after': '30'}))
+        self.assertAlmostEqual(self.limiter.reserve(), 30)
+
+
+class RetryAfterTest(unittest.TestCase):
+    def test_get_retry_after(self):
+        self.assertIsNone(get_retry_after({}))
+        self.assertEqual(get_retry_after({'Retry-After': '5'}), 5)
+        self.assertAlmostEqual(get_retry_after({'Retry-After': formatdate(time.time() + 60, usegmt=True)}), 60, delta=2)  # type: ignore[arg-type]
+        self.assertAlmostEqual(get_retry_after({'X-RateLimit-Retry-After': str(int(time.time()) + 60)}), 60, delta=2)  # type: ignore[arg-type]
+        self.assertEqual(get_retry_after({'X-RateLimit-Retry-After': str(int(time.time()) - 60)}), 0)
+        self.assertIsNone(get_retry_after({'X-RateLimit-Retry-After': 'invalid'}))
+
+
+class RateLimitRegistryTest(unittest.TestCase):
+    host = 'rate-limit.example.com'
+
+    def tearDown(self) -> None:
+        rate_limit.configure_rate_limit(self.host, None)
+        rate_limit.share_rate_limits(None)
+
+    def test_configure_rate_limit(self):
+        self.assertIsNone(rate_limit.get_limiter(self.host))
+
+        rate_limit.configure_rate_limit(self.host, RateLimit(requests=1))
+        limiter = rate_limit.get_limiter(self.host)
+        self.assertIsInstance(limiter, RateLimiter)
+
+        rate_limit.configure_rate_limit(self.host, RateLimit(requests=2), replace=False)
+        self.assertIs(rate_limit.get_limiter(self.host), limiter)
+
+        rate_limit.share_rate_limits(MagicMock())
+        self.assertIsInstance(rate_limit.get_limiter(self.host), rate_limit.SharedRateLimiter)
+
+        rate_limit.configure_rate_limit(self.host, None)
+        self.assertIsNone(rate_limit.get_limiter(self.host))
+
+    def test_session_uses_limiter(self):
+        limiter = MagicMock()
+        response = requests.Response()
+        response.status_code = 429
+        response.headers['Retry-After'] = '1'
+        response.raw = MagicMock()
+        with patch.object(rate_limit, 'get_limiter', return_value=limiter), \
+                patch('requests.adapters.HTTPAdapter.send', return_value=response):
+            r = sessions.create_session(sessions.HttpConfig(retries=2)).get(f'https://{self.host}/test')
+
+        self.assertEqual(r.status_code, 429)
+        # Every retry waits for the limiter
+        self.assertEqual(limiter.acquire.call_count, 3)
+        limiter.update.assert_called_with(429, response.headers)
+        self.assertEqual(limiter.update.call_count, 3)
+
+    def test_session_retries_rate_limited(self):
+        limiter = MagicMock()
+        limited = requests.Response()
+        limited.status_code = 429
+        limited.raw = MagicMock()
+        ok = requests.Response()
+        ok.status_code = 200
+        with patch.object(rate_limit, 'get_limiter', return_value=limiter), \
+                patch('requests.adapters.HTTPAdapter.send', side_effect=[limited, ok]) as send, \
+                patch('time.sleep') as sleep:
+            r = sessions.create_session().get(f'https://{self.host}/test')
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(limiter.acquire.call_count, 2)
+        self.assertEqual([c.args[0] for c in limiter.update.call_args_list], [429, 200])
+        # The limiter handles waiting on 429
+        sleep.assert_not_called()
+
+    def test_session_retries_rate_limited_post(self):
+        limiter = MagicMock()
+        limited = requests.Response()
+        limited.status_code = 429
+        limited.raw = MagicMock()
+        ok = requests.Response()
+        ok.status_code = 200
+        session = sessions.create_session()
+
+        # Retried only when the server says when to retry
+        with patch.object(rate_limit, 'get_limiter', return_value=limiter), \
+                patch('requests.adapters.HTTPAdapter.send', side_effect=[limited, ok]):
+            self.assertEqual(session.post(f'https://{self.host}/test').status_code, 429)
+
+        limited.headers['Retry-After'] = '1'
+        with patch.object(rate_limit, 'get_limiter', return_value=limiter), \
+                patch('requests.adapters.HTTPAdapter.send', side_effect=[limited, ok]):
+            self.assertEqual(session.post(f'https://{self.host}/test').status_code, 200)
+
+    def test_title_delay(self):
+        MangadexAPI()
+        self.assertEqual(MangaDex.title_delay(MagicMock()), 0)
+
+        rng = MagicMock()
+        rng.randint.return_value = 500
+        self.assertEqual(MangaPlus.title_delay(rng), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from datetime import timedelta
+
+from src.utils.release_interval import (
+    calculate_release_interval, get_consecutive_chapters, INTERVAL_ACCURACY,
+    window_from_chapters, add_releases, interval_from_window, MAX_CHAPTERS
+)
+from src.utils.utilities import utcnow
+
+
+class ReleaseIntervalTest(unittest.TestCase):
+    def test_consecutive_chapters_stop_at_gap(self):
+        t = utcnow()
+        chapters = [(10, t), (9, t), (7, t), (4, t), (3, t)]
+        self.assertListEqual(get_consecutive_chapters(chapters), chapters[:3])
+
+    def test_not_enough_data(self):
+        t = utcnow()
+        self.assertIsNone(calculate_release_interval([]))
+        self.assertIsNone(calculate_release_interval([(1, t)]))
+        # Releases too close to each other are ignored
+        self.assertIsNone(calculate_release_interval([(2, t + timedelta(hours=1)), (1, t)]))
+
+    def test_mode_used(self):
+        t = utcnow()
+        week = timedelta(days=7)
+        chapters = [(n, t + week * n) for n in range(10, 0, -1)]
+        chapters.append((0, t - timedelta(days=1)))
+        self.assertEqual(calculate_release_interval(chapters), week)
+
+    def test_median_used_without_single_mode(self):
+        t = utcnow()
+        chapters = [(3, t + timedelta(days=3)), (2, t + timedelta(days=1)), (1, t)]
+        self.assertEqual(calculate_release_interval(chapters), timedelta(days=1.5))
+
+    def test_intervals_rounded(self):
+        t = utcnow()
+        chapters = [(2, t + timedelta(days=7, hours=1)), (1, t)]
+        self.assertEqual(calculate_release_interval(chapters), timedelta(days=7))
+        self.assertEqual(INTERVAL_ACCURACY, 60*60*4)
+
+    def test_add_releases_matches_window_from_chapters(self):
+        t = utcnow()
+        chapters = [(n, t + timedelta(days=n + n % 3)) for n in range(1, 50)]
+
+        window = window_from_chapters(1, chapters[:5][::-1])
+        add_releases(window, chapters[5:])
+        expected = window_from_chapters(1, chapters[::-1])
+
+        self.assertEqual(window, expected)
+        self.assertEqual(len(window.intervals), MAX_CHAPTERS - 1)
+        self.assertEqual(interval_from_window(window.intervals), calculate_release_interval(chapters[::-1]))
+
+    def test_add_releases_resets_on_gap(self):
+        t = utcnow()
+        window = window_from_chapters(1, [(2, t + timedelta(days=7)), (1, t)])
+        add_releases(window, [(2, t), (6, t + timedelta(days=14)), (7, t + timedelta(days=21))])
+
+        self.assertEqual(window.latest_chapter, 7)
+        self.assertListEqual(window.intervals, [int(timedelta(days=7).total_seconds())])
+
+    def test_add_releases_out_of_order(self):
+        t = utcnow()
+        existing = [(n, t + timedelta(days=7 * n + n % 2)) for n in range(35, 5, -1)]
+        window = window_from_chapters(1, existing)
+
+        # New chapters in any order, earlier release dates of known chapters
+        # and an old chapter that does not fit in the full window
+        added = [(38, t + timedelta(days=270)), (30, t), (36, t + timedelta(days=252)),
+                 (21, t + timedelta(days=1)), (37, t + timedelta(days=260)), (3, t)]
+        self.assertTrue(add_releases(window, added))
+
+        releases = dict(existing)
+        for n, release_date in added:
+            releases[n] = min(releases.get(n, release_date), release_date)
+        self.assertEqual(window, window_from_chapters(1, sorted(releases.items(), reverse=True)))
+        self.assertEqual(window.chapter_numbers[0], 38)
+        self.assertEqual(len(window.chapter_numbers), MAX_CHAPTERS)
+
+    def test_add_releases_older_than_window(self):
+        t = utcnow()
+        window = window_from_chapters(1, [(10, t + timedelta(days=14)), (9, t + timedelta(days=7))])
+        expected = window.copy(deep=True)
+
+        # Older chapters can connect the window to chapters that are not in it
+        self.assertFalse(add_releases(window, [(11, t + timedelta(days=21)), (7, t)]))
+        self.assertEqual(window, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from src.utils.release_prediction import (
+    predict_release, next_poll, ReleasePrediction, backtest, predict_next_poll,
+    history_from_chapters, MAX_POLL_INTERVAL, MIN_SPREAD
+)
+
+# Monday
+START = datetime(2022, 10, 3, 15, tzinfo=timezone.utc)
+HOUR = timedelta(hours=1)
+WEEK = timedelta(days=7)
+
+
+class ReleasePredictionTest(unittest.TestCase):
+    def test_not_enough_data(self):
+        self.assertIsNone(predict_release([], WEEK))
+        self.assertIsNone(predict_release([START], WEEK))
+        self.assertIsNone(predict_release([START + WEEK, START], None))
+
+    def test_weekly_release_snaps_to_weekday_and_hour(self):
+        releases = [START + WEEK * i for i in range(5, -1, -1)]
+        # Late release that should not move the prediction
+        releases[0] += timedelta(days=1, hours=3)
+
+        prediction = predict_release(releases, WEEK)
+        self.assertEqual(prediction, ReleasePrediction(START + WEEK * 6, MIN_SPREAD))
+
+    def test_irregular_release_uses_interval(self):
+        releases = [START + timedelta(days=10 * i, hours=5 * i) for i in range(4, -1, -1)]
+        interval = timedelta(days=10)
+
+        prediction = predict_release(releases, interval)
+        self.assertIsNotNone(prediction)
+        self.assertEqual(prediction.expected, releases[0] + interval)
+        self.assertGreater(prediction.spread, MIN_SPREAD)
+
+    def test_next_poll(self):
+        prediction = ReleasePrediction(START, 2 * HOUR)
+
+        self.assertEqual(next_poll(None, START, HOUR), START + HOUR)
+        # Sleeps until the release window
+        self.assertEqual(next_poll(prediction, START - 10 * HOUR, HOUR), START - 2 * HOUR)
+        self.assertEqual(next_poll(prediction, START - WEEK, HOUR), START - WEEK + MAX_POLL_INTERVAL)
+        # Polls every check interval inside the window
+        self.assertEqual(next_poll(prediction, START - HOUR, HOUR), START)
+        self.assertEqual(next_poll(prediction, START - 2.5 * HOUR, HOUR), START - 1.5 * HOUR)
+        # Backs off when the release is late
+        self.assertEqual(next_poll(prediction, START + 3 * HOUR, HOUR), START + 4 * HOUR)
+        self.assertEqual(next_poll(prediction, START + 12 * HOUR, HOUR), START + 17 * HOUR)
+
+    def test_backtest(self):
+        chapters = [(i, START + WEEK * i) for i in range(20)]
+        fixed = backtest(chapters, lambda history, now: now + HOUR)
+        predicted = backtest(chapters, lambda history, now: predict_next_poll(history, now, HOUR))
+
+        self.assertEqual(fixed.chapters, 15)
+        self.assertEqual(fixed.polls_per_chapter, WEEK / HOUR)
+        self.assertEqual(predicted.chapters, 15)
+        self.assertLess(predicted.polls_per_chapter, 10)
+        self.assertEqual(max(predicted.latencies), timedelta(0))
+
+    def test_history_from_chapters(self):
+        chapters = [(i, START + WEEK * i) for i in range(40, 0, -1)]
+        history = history_from_chapters(chapters)
+        self.assertEqual(history.interval, WEEK)
+        self.assertEqual(len(history.releases), 30)
+        self.assertEqual(history.releases[0], chapters[0][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
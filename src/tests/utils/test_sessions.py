@@ -0,0 +1,109 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import responses
+
+from src.utils import sessions
+from src.utils.sessions import HttpConfig
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fail_count = 0
+
+    def do_GET(self):
+        status = 200
+        if self.path == '/flaky' and RequestHandler.fail_count > 0:
+            RequestHandler.fail_count -= 1
+            status = 503
+
+        body = b'ok'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+class SessionsTest(unittest.TestCase):
+    server: ThreadingHTTPServer
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), RequestHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        sessions.close_sessions()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def tearDown(self) -> None:
+        sessions.close_sessions()
+        for host in ('127.0.0.1', 'example.com'):
+            sessions.configure_host(host, sessions.DEFAULT_CONFIG)
+
+    def test_session_shared_per_host(self):
+        self.assertIs(sessions.get_session('https://example.com/a'), sessions.get_session('https://example.com/b?c=1'))
+        self.assertIsNot(sessions.get_session('https://example.com'), sessions.get_session('https://example.org'))
+        self.assertRaises(ValueError, sessions.get_session, 'invalid url')
+
+    def test_connections_reused(self):
+        before = sessions.get_host_stats('127.0.0.1')['127.0.0.1']
+
+        for _ in range(5):
+            self.assertTrue(sessions.get(self.url + '/test').ok)
+
+        stats = sessions.get_host_stats('127.0.0.1')['127.0.0.1']
+        self.assertEqual(stats.requests - before.requests, 5)
+        self.assertEqual(stats.connections_created - before.connections_created, 1)
+
+    def test_retries_failed_status(self):
+        sessions.configure_host('127.0.0.1', HttpConfig(backoff_factor=0))
+        RequestHandler.fail_count = 2
+
+        r = sessions.get(self.url + '/flaky')
+        self.assertTrue(r.ok)
+        self.assertEqual(RequestHandler.fail_count, 0)
+
+    def test_returns_response_when_retries_exhausted(self):
+        sessions.configure_host('127.0.0.1', HttpConfig(backoff_factor=0, retries=1))
+        RequestHandler.fail_count = 5
+
+        r = sessions.get(self.url + '/flaky')
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(RequestHandler.fail_count, 3)
+
+    def test_post_not_retried(self):
+        sessions.configure_host('127.0.0.1', HttpConfig(backoff_factor=0))
+        RequestHandler.fail_count = 2
+
+        r = sessions.post(self.url + '/flaky', json={})
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(RequestHandler.fail_count, 1)
+
+    @responses.activate
+    def test_default_timeout_used(self):
+        sessions.configure_host('example.com', HttpConfig(timeout=5))
+        responses.add(responses.GET, 'https://example.com/test')
+
+        sessions.get('https://example.com/test')
+        sessions.get('https://example.com/test', timeout=1)
+
+        self.assertEqual(responses.calls[0].request.req_kwargs['timeout'], 5)
+        self.assertEqual(responses.calls[1].request.req_kwargs['timeout'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from src.utils.token_bucket import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self) -> float:
+        return self.time
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+
+    def test_starts_full(self):
+        bucket = TokenBucket(5, 10, clock=self.clock)
+        self.assertEqual(bucket.tokens, 5)
+        self.assertTrue(bucket.try_consume(5))
+        self.assertFalse(bucket.try_consume())
+
+    def test_refills_over_time(self):
+        bucket = TokenBucket(5, 10, tokens=0, clock=self.clock)
+        self.clock.time = 4
+        self.assertAlmostEqual(bucket.tokens, 2)
+        self.assertAlmostEqual(bucket.time_until(3), 2)
+
+        self.clock.time = 100
+        self.assertEqual(bucket.tokens, 5)
+        self.assertEqual(bucket.time_until(3), 0)
+
+    def test_consume_goes_into_debt(self):
+        bucket = TokenBucket(2, 2, clock=self.clock)
+        bucket.consume(4)
+        self.assertAlmostEqual(bucket.tokens, -2)
+        self.assertFalse(bucket.try_consume())
+
+        self.clock.time = 3
+        self.assertTrue(bucket.try_consume())
+
+    def test_reserve(self):
+        bucket = TokenBucket(2, 2, clock=self.clock)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 1)
+        self.assertAlmostEqual(bucket.reserve(), 2)
+
+        self.clock.time = 2
+        self.assertAlmostEqual(bucket.reserve(), 1)
+
+    def test_set_rate(self):
+        bucket = TokenBucket(10, 10, tokens=0, clock=self.clock)
+        self.clock.time = 2
+        bucket.set_rate(2)
+        self.clock.time = 3
+        self.assertAlmostEqual(bucket.tokens, 4)
+        self.assertRaises(ValueError, bucket.set_rate, 0)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, TokenBucket, 0, 1)
+        self.assertRaises(ValueError, TokenBucket, 1, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+"""
+In-process caches shared between scraper runs of the same process.
+
+Identity caches map external ids to database ids. Their entries may refer to
+rows inserted in a transaction that is later rolled back, so all of them are
+cleared with invalidate_identity_caches whenever a transaction fails.
+"""
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar, \
+    OrderedDict, Iterable, Iterator
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Thread safe LRU cache whose entries expire after a time to live.
+    The least recently used entry is evicted when the cache is full.
+    """
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        if maxsize <= 0:
+            raise ValueError('maxsize must be positive')
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Value and the time it expires at
+        self._data: OrderedDict[K, Tuple[V, float]] = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            value, expires_at = item
+            if expires_at <= self._clock():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        """
+        Sets the value of the key. The time to live of the cache is used
+        if it is not given.
+        """
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def update(self, values: Dict[K, V]) -> None:
+        for key, value in values.items():
+            self.set(key, value)
+
+    def pop(self, key: K) -> Optional[V]:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[0] if item else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Thread safe cache that evicts the least recently used entry when it is full
+    """
+    def __init__(self, maxsize: int):
+        if maxsize <= 0:
+            raise ValueError('maxsize must be positive')
+
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys: Iterable[K]) -> Dict[K, V]:
+        """
+        Returns the cached values of the given keys. Keys that are not cached are left out.
+        """
+        found: Dict[K, V] = {}
+        with self._lock:
+            for key in keys:
+                value = self._data.get(key)
+                if value is not None:
+                    self._data.move_to_end(key)
+                    found[key] = value
+
+        return found
+
+    def set(self, key: K, value: V) -> None:
+        with self._lock:
+            self._set(key, value)
+
+    def update(self, values: Dict[K, V]) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._set(key, value)
+
+    def _set(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> Optional[V]:
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_identity_caches: 'weakref.WeakSet[LRUCache]' = weakref.WeakSet()
+
+
+def identity_cache(maxsize: int) -> LRUCache:
+    """
+    Creates a cache of database ids that is cleared by invalidate_identity_caches
+    """
+    cache: LRUCache = LRUCache(maxsize)
+    _identity_caches.add(cache)
+    return cache
+
+
+def invalidate_identity_caches() -> None:
+    """
+    Clears every identity cache. Called when a transaction is rolled back
+    as the cached ids might refer to rows that no longer exist.
+    """
+    for cache in list(_identity_caches):
+        cache.clear()
+
+
+@contextmanager
+def invalidate_on_error() -> Iterator[None]:
+    """
+    Invalidates the identity caches if the block raises an error.
+    Can also be used as a decorator.
+    """
+    try:
+        yield
+    except BaseException:
+        invalidate_identity_caches()
+        raise
@@ -1,11 +1,11 @@
 import logging
-import statistics
+import threading
 from datetime import datetime, timedelta
 from itertools import groupby
 from typing import (
     Union, Any, Optional, List, Dict, Generator, Tuple, Collection,
     Iterable, TypeVar, Callable, TYPE_CHECKING, cast, Set, Sequence,
-    overload, Iterator
+    overload, Iterator, ClassVar, NamedTuple
 )
 
 from psycopg import Connection, Cursor
@@ -19,14 +19,19 @@ from src.db.models.groups import Group, GroupPartial
 from src.db.models.manga import (MangaService, Manga, MangaServicePartial,
                                  MangaServiceWithId, MangaInfo,
                                  MangaForNotifications,
-                                 MangaServicePartialWithId)
+                                 MangaServicePartialWithId,
+                                 MangaReleaseWindow)
 from src.db.models.notifications import PartialNotificationInfo, \
     UserNotification, InputField
 from src.db.models.scheduled_run import ScheduledRun, ScheduledRunResult
-from src.db.models.services import Service, ServiceWhole, ServiceConfig
-from src.db.utilities import execute_values
+from src.db.models.services import Service, ServiceWhole, ServiceConfig, \
+    FeedCache, MetadataCache
+from src.db.utilities import execute_values, execute_unnest
 from src.elasticsearch.methods import ElasticMethods
-from src.utils.utilities import round_seconds, utcnow
+from src.utils import release_interval, release_prediction
+from src.utils.cache import LRUCache, identity_cache
+from src.utils.release_prediction import ReleaseHistory
+from src.utils.utilities import utcnow, LatestChapters, LatestChapter
 
 if TYPE_CHECKING:
     # noinspection PyUnresolvedReferences
@@ -63,6 +68,24 @@ def optional_generator_transaction(f: F) -> F:
     return cast(F, wrapper)
 
 
+def write_behind(defer: Callable[..., None]):
+    def _write_behind(f: F) -> F:
+        """
+        Decorator for bookkeeping updates that can be written later. If the DbUtil
+        has deferred writes the arguments are recorded with defer instead of calling the function.
+        """
+        def wrapper(self: 'DbUtil', *args, **kwargs):
+            if self._deferred_writes is None:
+                return f(self, *args, **kwargs)
+
+            kwargs.pop('cur', None)
+            defer(self._deferred_writes, *args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return _write_behind
+
+
 def optional_transaction(row_factory: RowFactory[T] = None):
     def _transaction(f: F) -> F:
         """
@@ -90,10 +113,175 @@ def optional_transaction(row_factory: RowFactory[T] = None):
     return _transaction
 
 
+class IngestResult(NamedTuple):
+    manga_ids: Set[int]
+    """Manga of every title in the batch"""
+    inserted: List[InsertedChapter]
+    new_manga: Dict[int, str]
+    """Titles of the manga that were created"""
+
+
+class NotificationStats(NamedTuple):
+    runs: int
+    failed: int
+    reset: bool
+    """Whether the failed in row counter is reset before failed_in_row is added to it"""
+    failed_in_row: int
+
+    def merge(self, newer: 'NotificationStats') -> 'NotificationStats':
+        if newer.reset:
+            return NotificationStats(self.runs + newer.runs, self.failed + newer.failed, True, newer.failed_in_row)
+        return NotificationStats(self.runs + newer.runs, self.failed + newer.failed,
+                                 self.reset, self.failed_in_row + newer.failed_in_row)
+
+
+class DeferredWrites:
+    """
+    Thread safe buffer of bookkeeping updates written later by DbUtil.flush_writes.
+    Updates of the same row are coalesced and later values replace earlier ones.
+    """
+    COLUMNS: ClassVar[Dict[str, Tuple[Tuple[str, ...], Dict[str, str]]]] = {
+        'manga_service': (('service_id', 'manga_id'), {'last_check': 'timestamptz', 'next_update': 'timestamptz', 'disabled': 'bool'}),
+        'services': (('service_id',), {'last_check': 'timestamptz', 'disabled_until': 'timestamptz'}),
+        'service_whole': (('service_id',), {'last_check': 'timestamptz', 'next_update': 'timestamptz'}),
+    }
+    """Key columns and updatable columns with their types of each table"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rows: Dict[str, Dict[Tuple[int, ...], Dict[str, Any]]] = {table: {} for table in self.COLUMNS}
+        self.disabled_titles: Set[Tuple[int, str]] = set()
+        self.notification_stats: Dict[int, NotificationStats] = {}
+
+    def _set(self, table: str, key: Tuple[int, ...], **values: Any) -> None:
+        with self._lock:
+            self.rows[table].setdefault(key, {}).update(values)
+
+    def set_manga_last_checked(self, service_id: int, manga_id: int, last_checked: Optional[datetime]) -> None:
+        self._set('manga_service', (service_id, manga_id), last_check=last_checked)
+
+    def update_manga_next_update(self, service_id: int, manga_id: int, next_update: datetime) -> None:
+        self._set('manga_service', (service_id, manga_id), next_update=next_update)
+
+    def update_manga_service_check(self, service_id: int, manga_id: int, last_check: datetime,
+                                   next_update: datetime, disabled: bool) -> None:
+        self._set('manga_service', (service_id, manga_id), last_check=last_check,
+                  next_update=next_update, disabled=disabled)
+
+    def update_service_checked(self, service_id: int, last_check: datetime, disabled_until: datetime) -> None:
+        self._set('services', (service_id,), last_check=last_check, disabled_until=disabled_until)
+
+    def update_service_whole(self, service_id: int, update_interval: timedelta) -> None:
+        now = utcnow()
+        self._set('services', (service_id,), last_check=now)
+        self._set('service_whole', (service_id,), last_check=now, next_update=now + update_interval)
+
+    def disable_manga_service(self, service_id: int, title_id: str) -> None:
+        with self._lock:
+            self.disabled_titles.add((service_id, title_id))
+
+    def update_notification_stats(self, notification_id: int, runs: int, failed: int) -> None:
+        stats = NotificationStats(runs, failed, failed == 0, failed)
+        with self._lock:
+            old = self.notification_stats.get(notification_id)
+            self.notification_stats[notification_id] = stats if old is None else old.merge(stats)
+
+    def keep_pending_next_updates(self, service_id: int, next_updates: Sequence[Tuple[int, datetime]],
+                                  now: datetime) -> List[Tuple[int, datetime]]:
+        """
+        Returns the next updates of titles without a pending next update.
+        Pending next updates that are not in the future are replaced with the given ones.
+        """
+        rows = self.rows['manga_service']
+        retval = []
+        with self._lock:
+            for manga_id, next_update in next_updates:
+                pending = rows.get((service_id, manga_id), {}).get('next_update')
+                if pending is None:
+                    retval.append((manga_id, next_update))
+                elif pending <= now:
+                    rows[(service_id, manga_id)]['next_update'] = next_update
+
+        return retval
+
+    def pop_all(self) -> 'DeferredWrites':
+        """
+        Moves every buffered update to a new instance and returns it
+        """
+        popped = DeferredWrites()
+        with self._lock:
+            popped.rows, self.rows = self.rows, popped.rows
+            popped.disabled_titles, self.disabled_titles = self.disabled_titles, popped.disabled_titles
+            popped.notification_stats, self.notification_stats = self.notification_stats, popped.notification_stats
+
+        return popped
+
+    def __len__(self) -> int:
+        return sum(map(len, self.rows.values())) + len(self.disabled_titles) + len(self.notification_stats)
+
+
 class DbUtil:
-    def __init__(self, conn: Connection, es: Optional[ElasticMethods]):
+    # Weights of the title update priority in get_due_manga_services, in hours overdue
+    DUE_MAX_OVERDUE_HOURS = 168
+    DUE_RELEASE_BONUS_HOURS = 48
+    DUE_FOLLOWER_WEIGHT_HOURS = 12
+
+    DUE_MANGA_SERVICES_SQL = """
+        WITH budget(service_id, amount) AS (
+            SELECT * FROM unnest(%(service_ids)s::int[], %(amounts)s::int[])
+        ), due AS (
+            SELECT ms.*, ROW_NUMBER() OVER (
+                PARTITION BY ms.service_id
+                ORDER BY
+                    LEAST(COALESCE(EXTRACT(EPOCH FROM NOW() - ms.next_update) / 3600, %(max_overdue)s), %(max_overdue)s)
+                    + CASE WHEN m.estimated_release <= NOW() AND (ms.last_check IS NULL OR ms.last_check < m.estimated_release)
+                           THEN %(release_bonus)s ELSE 0 END
+                    + %(follower_weight)s * LN(1 + (SELECT COUNT(*) FROM user_follows uf WHERE uf.manga_id=ms.manga_id))
+                    DESC,
+                    ms.next_update ASC NULLS FIRST
+            ) AS rank
+            FROM manga_service ms
+            INNER JOIN budget b ON b.service_id=ms.service_id
+            INNER JOIN services s ON s.service_id=ms.service_id
+            INNER JOIN manga m ON m.manga_id=ms.manga_id
+            WHERE NOT s.disabled AND NOT ms.disabled AND (s.disabled_until IS NULL OR s.disabled_until < NOW()) AND (ms.next_update IS NULL OR ms.next_update < NOW())
+        )
+        SELECT due.* FROM due
+        INNER JOIN budget b ON b.service_id=due.service_id
+        WHERE due.rank <= b.amount
+        ORDER BY due.service_id, due.rank
+    """
+    """Due titles ranked by update priority. Used by get_due_manga_services"""
+
+    COPY_CHAPTERS_MIN_ROWS = 200
+    """Chapter batches at least this large are added with COPY instead of an INSERT statement"""
+    CHAPTER_INSERT_COLUMNS = 'manga_id, service_id, title, chapter_number, chapter_decimal, chapter_identifier, release_date, group_id'
+    CHAPTER_INSERT_TYPES = ('int', 'smallint', 'text', 'int', 'smallint', 'text', 'timestamptz', 'int')
+    INSERTED_CHAPTER_COLUMNS = 'chapter_id, manga_id, chapter_number, chapter_decimal, release_date, chapter_identifier'
+
+    group_registry: ClassVar[LRUCache[str, Group]] = identity_cache(1_000)
+    """Groups resolved by get_or_create_group by their name. Shared by every instance"""
+    RECENT_CHAPTER_IDS = 5_000
+    """Amount of chapter identifiers of each service kept in memory for deduplication"""
+    recent_chapter_ids: ClassVar[Dict[int, LRUCache[str, bool]]] = {}
+    """Chapter identifiers known to exist on each service. Shared by every instance"""
+
+    def __init__(self, conn: Connection, es: Optional[ElasticMethods],
+                 latest_chapters: Optional[LatestChapters] = None,
+                 deferred_writes: Optional[DeferredWrites] = None):
+        """
+        Args:
+            conn: Database connection
+            es: Elasticsearch methods used when manga are added
+            latest_chapters: If given, update_latest_chapter collects the latest chapters here
+                and they are written later with flush_latest_chapters
+            deferred_writes: If given, bookkeeping updates of titles, services and notifications
+                are buffered here and written later with flush_writes
+        """
         self._conn = conn
         self._es = es
+        self._latest_chapters = latest_chapters
+        self._deferred_writes = deferred_writes
 
     @property
     def conn(self) -> Connection:
@@ -139,12 +327,43 @@ class DbUtil:
 
         return []
 
+    @write_behind(DeferredWrites.update_manga_next_update)
     @optional_transaction()
     def update_manga_next_update(self, service_id: int, manga_id: int,
                                  next_update: datetime, *, cur: Cursor = NotImplemented) -> None:
         sql = 'UPDATE manga_service SET next_update=%s WHERE manga_id=%s AND service_id=%s'
         cur.execute(sql, (next_update, manga_id, service_id))
 
+    @write_behind(DeferredWrites.update_manga_service_check)
+    @optional_transaction()
+    def update_manga_service_check(self, service_id: int, manga_id: int, last_check: datetime,
+                                   next_update: datetime, disabled: bool, *, cur: Cursor = NotImplemented) -> None:
+        sql = 'UPDATE manga_service SET last_check=%s, next_update=%s, disabled=%s WHERE manga_id=%s AND service_id=%s'
+        cur.execute(sql, [last_check, next_update, disabled, manga_id, service_id])
+
+    @optional_transaction()
+    def update_predicted_next_updates(self, service_id: int, next_updates: Sequence[Tuple[int, datetime]],
+                                      *, cur: Cursor = NotImplemented) -> None:
+        """
+        Sets the next updates of the given titles on a service. Next updates
+        that are already in the future, such as known release times set by the scraper, are kept.
+        """
+        if self._deferred_writes is not None:
+            next_updates = self._deferred_writes.keep_pending_next_updates(service_id, next_updates, utcnow())
+
+        if not next_updates:
+            return
+
+        sql = '''
+        UPDATE manga_service ms
+        SET next_update=c.next_update
+        FROM %s AS c(service_id, manga_id, next_update)
+        WHERE ms.service_id=c.service_id AND ms.manga_id=c.manga_id
+            AND (ms.next_update IS NULL OR ms.next_update <= NOW())
+        '''
+        execute_unnest(cur, sql, [(service_id, manga_id, next_update) for manga_id, next_update in next_updates],
+                       ('int', 'int', 'timestamptz'))
+
     @optional_transaction()
     def get_service_manga(self, service_id: int, include_only: Collection[int] = None,
                           *, cur: Cursor = NotImplemented) -> List[MangaServicePartial]:
@@ -214,6 +433,18 @@ class DbUtil:
         cur.execute(sql)
         return list(map(ScheduledRunResult.parse_obj, cur))
 
+    @optional_transaction()
+    def get_next_scheduled_run(self, *, cur: Cursor = NotImplemented) -> Optional[datetime]:
+        """
+        Returns the time the first scheduled run comes off cooldown or None if there are no scheduled runs
+        """
+        sql = 'SELECT MIN(GREATEST(s.scheduled_runs_disabled_until::timestamptz, NOW())) AS next_run FROM scheduled_runs sr ' \
+              'INNER JOIN manga_service ms ON sr.manga_id = ms.manga_id AND sr.service_id = ms.service_id ' \
+              'INNER JOIN services s ON s.service_id = ms.service_id'
+
+        cur.execute(sql)
+        return self.fetchone_or_throw(cur)['next_run']
+
     @optional_transaction()
     def update_scheduled_run_disabled(self, service_ids: List[int], *, cur: Cursor = NotImplemented):
         """
@@ -246,10 +477,10 @@ class DbUtil:
 
         sql = '''
             DELETE FROM scheduled_runs sr
-                USING (VALUES %s) as c(manga_id, service_id)
+                USING %s as c(manga_id, service_id)
             WHERE sr.manga_id=c.manga_id AND sr.service_id=c.service_id
         '''
-        execute_values(cur, sql, to_delete, page_size=len(to_delete))
+        execute_unnest(cur, sql, to_delete, ('int', 'smallint'))
         return cur.rowcount
 
     @optional_transaction()
@@ -259,62 +490,149 @@ class DbUtil:
 
     @optional_transaction()
     def update_chapter_interval(self, manga_id: int, *, cur: Cursor = NotImplemented) -> bool:
+        return manga_id in self.update_chapter_intervals([manga_id], cur=cur)
+
+    @optional_transaction()
+    def update_chapter_intervals(self, manga_ids: Collection[int], *, cur: Cursor = NotImplemented) -> Dict[int, timedelta]:
+        """
+        Calculates the release intervals of the given manga from their release windows
+        and updates them. Returns the updated intervals of the manga that had enough data.
+        """
+        if not manga_ids:
+            return {}
+
+        windows = self.get_release_windows(manga_ids, cur=cur)
+        missing = set(manga_ids).difference(w.manga_id for w in windows)
+        if missing:
+            windows.extend(self.rebuild_release_windows(missing, cur=cur))
+
+        intervals: Dict[int, timedelta] = {}
+        for window in windows:
+            interval = release_interval.interval_from_window(window.intervals)
+            if interval is not None:
+                intervals[window.manga_id] = interval
+
+        for manga_id in manga_ids:
+            if manga_id not in intervals:
+                maintenance.info(f'Not enough chapters to calculate release interval for {manga_id}')
+            else:
+                # TODO add warning when interval differs too much from mean
+                logger.info(f'Interval for {manga_id} set to {intervals[manga_id]}')
+
+        if intervals:
+            sql = 'UPDATE manga m SET release_interval=c.release_interval FROM %s AS c(manga_id, release_interval) ' \
+                  'WHERE m.manga_id=c.manga_id'
+            execute_unnest(cur, sql, list(intervals.items()), ('int', 'interval'))
+
+        return intervals
+
+    @optional_transaction()
+    def get_release_windows(self, manga_ids: Collection[int], *, cur: Cursor = NotImplemented) -> List[MangaReleaseWindow]:
+        sql = 'SELECT * FROM manga_release_intervals WHERE manga_id=ANY(%s)'
+        cur.execute(sql, (list(manga_ids),))
+        return list(map(MangaReleaseWindow.parse_obj, cur))
+
+    @optional_transaction()
+    def save_release_windows(self, windows: Collection[MangaReleaseWindow], *, cur: Cursor = NotImplemented) -> None:
+        if not windows:
+            return
+
         sql = '''
-            SELECT MIN(release_date) as release_date, chapter_number
-            FROM chapters
-            WHERE manga_id=%s AND chapter_decimal IS NULL
-            GROUP BY chapter_number
-            ORDER BY chapter_number DESC LIMIT 30'''
-        cur.execute(sql, (manga_id,))
-        chapters = []
-        last = None
-        for c in cur:
-            if not last:
-                last = c
-                chapters.append(c)
-                continue
+            INSERT INTO manga_release_intervals (manga_id, chapter_numbers, release_dates, intervals)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (manga_id) DO UPDATE SET
+                chapter_numbers=EXCLUDED.chapter_numbers,
+                release_dates=EXCLUDED.release_dates,
+                intervals=EXCLUDED.intervals
+        '''
+        cur.executemany(sql, [(w.manga_id, w.chapter_numbers, w.release_dates, w.intervals) for w in windows])
 
-            if last['chapter_number']-c['chapter_number'] > 2:
-                break
-            last = c
-            chapters.append(c)
-
-        if len(chapters) < 2:
-            maintenance.info(f'Not enough chapters to calculate release interval for {manga_id}')
-            return False
-
-        intervals = []
-        accuracy = 60*60*4  # 4h
-        for a, b in zip(chapters[:-1], chapters[1:]):
-            t = round_seconds(
-                (a['release_date']-b['release_date']).total_seconds(),
-                accuracy
-            )
-            # Ignore updates within 4 hours of each other
-            if t < accuracy:
+    @optional_transaction()
+    def rebuild_release_windows(self, manga_ids: Collection[int], *, cur: Cursor = NotImplemented) -> List[MangaReleaseWindow]:
+        """
+        Rebuilds the release windows of the given manga from their latest chapters.
+        Manga without whole chapters do not get a window.
+        """
+        if not manga_ids:
+            return []
+
+        windows = [
+            release_interval.window_from_chapters(manga_id, chapters)
+            for manga_id, chapters in self.get_latest_whole_chapters(manga_ids, cur=cur).items()
+        ]
+        self.save_release_windows(windows, cur=cur)
+        return windows
+
+    @optional_transaction()
+    def get_latest_whole_chapters(self, manga_ids: Collection[int], *,
+                                  cur: Cursor = NotImplemented) -> Dict[int, List[release_interval.ChapterRelease]]:
+        """
+        Returns the chapter numbers and release dates of the latest whole chapters
+        of the given manga ordered by chapter number descending.
+        Manga without whole chapters are not included.
+        """
+        sql = f'''
+            SELECT manga_id, chapter_number, release_date FROM (
+                SELECT manga_id, chapter_number, MIN(release_date) as release_date,
+                       ROW_NUMBER() OVER (PARTITION BY manga_id ORDER BY chapter_number DESC) as rank
+                FROM chapters
+                WHERE manga_id=ANY(%s) AND chapter_decimal IS NULL
+                GROUP BY manga_id, chapter_number
+            ) c
+            WHERE rank <= {release_interval.MAX_CHAPTERS}
+            ORDER BY manga_id, chapter_number DESC'''
+        cur.execute(sql, (list(manga_ids),))
+
+        return {
+            manga_id: [(r['chapter_number'], r['release_date']) for r in rows]
+            for manga_id, rows in groupby(cur.fetchall(), key=lambda r: r['manga_id'])
+        }
+
+    @optional_transaction()
+    def get_release_histories(self, manga_ids: Collection[int], *,
+                              cur: Cursor = NotImplemented) -> Dict[int, ReleaseHistory]:
+        """
+        Returns the release histories used for release prediction of the given manga.
+        Manga without whole chapters are not included.
+        """
+        if not manga_ids:
+            return {}
+
+        return {
+            manga_id: release_prediction.history_from_chapters(chapters)
+            for manga_id, chapters in self.get_latest_whole_chapters(manga_ids, cur=cur).items()
+        }
+
+    @optional_transaction()
+    def update_release_windows(self, chapters: Collection[InsertedChapter], *, cur: Cursor = NotImplemented) -> None:
+        """
+        Adds newly inserted whole chapters to the release windows of their manga.
+        Manga without a window or with chapters the window cannot be updated with
+        get theirs rebuilt from the chapters table.
+        """
+        whole = sorted(
+            (c for c in chapters if c.chapter_decimal is None),
+            key=lambda c: (c.manga_id, c.chapter_number, c.release_date)
+        )
+        if not whole:
+            return
+
+        windows = {w.manga_id: w for w in self.get_release_windows({c.manga_id for c in whole}, cur=cur)}
+        updated = []
+        missing = []
+        for manga_id, chs in groupby(whole, key=lambda c: c.manga_id):
+            window = windows.get(manga_id)
+            if window is None:
+                missing.append(manga_id)
                 continue
-            intervals.append(t)
-
-        if not intervals:
-            maintenance.info(f'Not enough valid intervals to calculate release interval for {manga_id}')
-            return False
-
-        # mode does not raise error since 3.8
-        # https://docs.python.org/3/library/statistics.html#statistics.mode
-        # Try to find a single most commonly occurring value.
-        # If multiple values found fall back to median
-        modes = statistics.multimode(intervals)
-        if len(modes) > 1:
-            interval_seconds = statistics.median(intervals)
-        else:
-            interval_seconds = modes[0]
 
-        # TODO add warning when interval differs too much from mean
-        interval = timedelta(seconds=interval_seconds)
-        sql = 'UPDATE manga SET release_interval=%s WHERE manga_id=%s'
-        logger.info(f'Interval for {manga_id} set to {interval}')
-        cur.execute(sql, (interval, manga_id))
-        return True
+            if release_interval.add_releases(window, [(c.chapter_number, c.release_date) for c in chs]):
+                updated.append(window)
+            else:
+                missing.append(manga_id)
+
+        self.save_release_windows(updated, cur=cur)
+        self.rebuild_release_windows(missing, cur=cur)
 
     @optional_transaction()
     def get_chapters_by_id(self, chapter_ids: List[int], manga_ids: List[int], cur: Cursor = NotImplemented) -> List[Chapter]:
@@ -521,34 +839,43 @@ class DbUtil:
         # Assume that RETURNING returns records in order
         sql = 'INSERT INTO manga ' \
               '(title, release_interval, latest_release, estimated_release, latest_chapter, views) ' \
-              'VALUES %s RETURNING title, manga_id'
-        rows = execute_values(cur, sql, args, page_size=len(args),
+              'SELECT * FROM %s RETURNING title, manga_id'
+        rows = execute_unnest(cur, sql, args, ('text', 'interval', 'timestamptz', 'timestamptz', 'int', 'int'),
                               fetch=True)
 
-        try:
-            elastic_data = []
-            for row, manga in zip(rows, mangas):
-                if row['title'] != manga.title:
-                    logger.warning(f'Inserted manga mismatch with {manga}')
-                    continue
+        added: Dict[int, str] = {}
+        for row, manga in zip(rows, mangas):
+            if row['title'] != manga.title:
+                logger.warning(f'Inserted manga mismatch with {manga}')
+                continue
 
-                manga.manga_id = row['manga_id']
-                elastic_data.append({
-                    '_id': row['manga_id'],
-                    'manga_id': row['manga_id'],
-                    'title': row['title'],
-                    'views': 0,
-                    'aliases': [],
-                    'services': [],
-                })
+            manga.manga_id = row['manga_id']
+            added[row['manga_id']] = row['title']
+
+        self.index_new_mangas(added)
+        return list(mangas)
+
+    def index_new_mangas(self, mangas: Dict[int, str]) -> None:
+        """
+        Adds newly created manga to elasticsearch
+        Args:
+            mangas: Dict of manga id to manga title
+        """
+        try:
+            elastic_data = [{
+                '_id': manga_id,
+                'manga_id': manga_id,
+                'title': title,
+                'views': 0,
+                'aliases': [],
+                'services': [],
+            } for manga_id, title in mangas.items()]
 
             logger.debug('Inserting new manga to elasticsearch. %s', elastic_data)
             self.es.bulk_upsert(elastic_data, 'create')
         except:
             logger.exception('Failed to add new manga to elasticsearch')
 
-        return list(mangas)
-
     @optional_transaction()
     def add_manga_service(self, manga: MangaServiceBound, *, add_manga: bool = False,
                           cur: Cursor = NotImplemented) -> MangaServiceBound:
@@ -585,9 +912,10 @@ class DbUtil:
         ]
         sql = 'INSERT INTO manga_service ' \
               '(manga_id, service_id, disabled, last_check, title_id, next_update, latest_chapter, latest_decimal, feed_url)  ' \
-              'VALUES %s RETURNING manga_id, title_id'
+              'SELECT * FROM %s RETURNING manga_id, title_id'
 
-        rows = execute_values(cur, sql, args, page_size=len(args),
+        rows = execute_unnest(cur, sql, args,
+                              ('int', 'smallint', 'bool', 'timestamptz', 'text', 'timestamptz', 'int', 'int', 'text'),
                               fetch=True)
 
         for row, manga in zip(rows, mangas):
@@ -597,10 +925,16 @@ class DbUtil:
 
             manga.manga_id = row['manga_id']
 
-        try:
-            manga_ids = list({r['manga_id'] for r in rows})
+        self.index_manga_services({r['manga_id'] for r in rows}, cur=cur)
+        return list(mangas)
 
-            manga_services = self.get_manga_services(manga_ids)
+    @optional_transaction()
+    def index_manga_services(self, manga_ids: Collection[int], *, cur: Cursor = NotImplemented) -> None:
+        """
+        Updates the services of the given manga in elasticsearch
+        """
+        try:
+            manga_services = self.get_manga_services(list(manga_ids), cur=cur)
             elastic_data = []
             m_it: Iterator[MangaServicePartialWithId]
             services: Dict[int, Service] = {s.service_id: s for s in self.get_services()}
@@ -619,8 +953,6 @@ class DbUtil:
         except:
             logger.exception('Failed to add manga services to elasticsearch')
 
-        return list(mangas)
-
     @optional_transaction()
     def get_service_whole(self, service_id: int, *, cur: Cursor = NotImplemented) -> Optional[ServiceWhole]:
         sql = 'SELECT * FROM service_whole WHERE service_id=%s'
@@ -643,6 +975,19 @@ class DbUtil:
 
         return list(map(Service.parse_obj, cur))
 
+    @optional_transaction()
+    def update_service_whole_last_id(self, service_id: int, last_id: Optional[str], *, cur: Cursor = NotImplemented) -> None:
+        sql = 'UPDATE service_whole SET last_id=%s WHERE service_id=%s'
+        cur.execute(sql, [last_id, service_id])
+
+    @write_behind(DeferredWrites.update_service_checked)
+    @optional_transaction()
+    def update_service_checked(self, service_id: int, last_check: datetime, disabled_until: datetime,
+                               *, cur: Cursor = NotImplemented) -> None:
+        sql = 'UPDATE services SET last_check=%s, disabled_until=%s WHERE service_id=%s'
+        cur.execute(sql, (last_check, disabled_until, service_id))
+
+    @write_behind(DeferredWrites.update_service_whole)
     @optional_transaction()
     def update_service_whole(self, service_id: int, update_interval: timedelta, *, cur: Cursor = NotImplemented) -> None:
         sql = 'UPDATE services SET last_check=%s WHERE service_id=%s'
@@ -652,6 +997,88 @@ class DbUtil:
         sql = 'UPDATE service_whole SET last_check=%s, next_update=%s WHERE service_id=%s'
         cur.execute(sql, [now, now + update_interval, service_id])
 
+    @optional_transaction()
+    def get_due_manga_services(self, budgets: Dict[int, int], *, cur: Cursor = NotImplemented) -> List[MangaServicePartialWithId]:
+        """
+        Returns the due manga_service rows with the highest update priority.
+        At most budgets[service_id] rows are returned for each service and services
+        not in budgets are ignored. Rows are ordered by service and priority.
+
+        The priority of a title is the amount of hours it is overdue (capped to a week,
+        unchecked titles count as a week), plus a bonus when the estimated release
+        has passed since the last check, plus a bonus scaling logarithmically with the
+        amount of followers.
+        """
+        budgets = {service_id: amount for service_id, amount in budgets.items() if amount > 0}
+        if not budgets:
+            return []
+
+        cur.execute(self.DUE_MANGA_SERVICES_SQL, {
+            'service_ids': list(budgets.keys()),
+            'amounts': list(budgets.values()),
+            'max_overdue': self.DUE_MAX_OVERDUE_HOURS,
+            'release_bonus': self.DUE_RELEASE_BONUS_HOURS,
+            'follower_weight': self.DUE_FOLLOWER_WEIGHT_HOURS
+        })
+
+        return list(map(MangaServicePartialWithId.parse_obj, cur))
+
+    @optional_transaction()
+    def get_feed_cache(self, feed_url: str, *, cur: Cursor = NotImplemented) -> Optional[FeedCache]:
+        sql = 'SELECT feed_url, etag, last_modified, content_hash FROM feed_cache WHERE feed_url=%s'
+        cur.execute(sql, [feed_url])
+        row = cur.fetchone()
+
+        return FeedCache.parse_obj(row) if row else None
+
+    @optional_transaction()
+    def update_feed_cache(self, feed: FeedCache, *, cur: Cursor = NotImplemented) -> None:
+        sql = '''
+            INSERT INTO feed_cache (feed_url, etag, last_modified, content_hash, last_check)
+            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (feed_url) DO UPDATE SET
+                etag=EXCLUDED.etag,
+                last_modified=EXCLUDED.last_modified,
+                content_hash=EXCLUDED.content_hash,
+                last_check=EXCLUDED.last_check
+        '''
+        cur.execute(sql, [feed.feed_url, feed.etag, feed.last_modified, feed.content_hash])
+
+    @optional_transaction()
+    def get_metadata_cache(self, service_id: int, title_ids: Collection[str], *,
+                           cur: Cursor = NotImplemented) -> Dict[str, MetadataCache]:
+        if not title_ids:
+            return {}
+
+        sql = 'SELECT * FROM metadata_cache WHERE service_id=%s AND title_id=ANY(%s)'
+        cur.execute(sql, [service_id, list(title_ids)])
+        return {row['title_id']: MetadataCache.parse_obj(row) for row in cur}
+
+    @optional_transaction()
+    def update_metadata_cache(self, service_id: int, hashes: Sequence[Tuple[str, str, bool]], *,
+                              cur: Cursor = NotImplemented) -> None:
+        """
+        Sets the metadata content hashes of the given titles and marks them as checked.
+        Args:
+            service_id: id of the service
+            hashes: title id, content hash and whether the metadata was written to the database
+        """
+        if not hashes:
+            return
+
+        service_id = int(service_id)
+        sql = f'''
+            INSERT INTO metadata_cache AS mc (service_id, title_id, content_hash, last_check, last_update)
+            SELECT {service_id}, c.title_id, c.content_hash, NOW(),
+                   CASE WHEN c.updated THEN NOW() ELSE to_timestamp(0) END
+            FROM %s AS c(title_id, content_hash, updated)
+            ON CONFLICT (service_id, title_id) DO UPDATE SET
+                content_hash=EXCLUDED.content_hash,
+                last_check=EXCLUDED.last_check,
+                last_update=GREATEST(mc.last_update, EXCLUDED.last_update)
+        '''
+        execute_unnest(cur, sql, hashes, ('text', 'text', 'bool'))
+
     @optional_generator_transaction
     def find_added_titles(self, service_id: int, title_ids: Collection[str], *, cur: Cursor = NotImplemented) -> Generator[MangaServicePartial, None, None]:
         """Find manga_service rows with an existing title_id"""
@@ -722,6 +1149,26 @@ class DbUtil:
               'WHERE m.manga_id=c.manga_id'
         cur.execute(sql, data)
 
+    def _copy_chapters(self, data: List[Tuple], *, cur: Cursor) -> List[DictRow]:
+        """
+        Streams the chapter rows into a temporary staging table with COPY
+        and moves them to the chapters table from there
+        """
+        cur.execute(f'CREATE TEMP TABLE IF NOT EXISTS chapters_staging ON COMMIT DELETE ROWS AS '
+                    f'SELECT {self.CHAPTER_INSERT_COLUMNS} FROM chapters WITH NO DATA')
+        # Rows are only deleted on commit so clear rows left by earlier calls in the same transaction
+        cur.execute('TRUNCATE chapters_staging')
+
+        with cur.copy(f'COPY chapters_staging ({self.CHAPTER_INSERT_COLUMNS}) FROM STDIN') as copy:
+            for row in data:
+                copy.write_row(row)
+
+        sql = f'INSERT INTO chapters ({self.CHAPTER_INSERT_COLUMNS}) ' \
+              f'SELECT {self.CHAPTER_INSERT_COLUMNS} FROM chapters_staging ON CONFLICT DO NOTHING ' \
+              f'RETURNING {self.INSERTED_CHAPTER_COLUMNS}'
+        cur.execute(sql)
+        return cur.fetchall()
+
     @overload
     @optional_transaction()
     def add_chapters(self, chapters: Sequence[BaseChapter], manga_id: int,
@@ -759,21 +1206,79 @@ class DbUtil:
                 ) for chapter in chapters
             ]
 
-        sql = 'INSERT INTO chapters (manga_id, service_id, title, chapter_number, chapter_decimal, chapter_identifier, release_date, group_id) VALUES ' \
-              '%s ON CONFLICT DO NOTHING'
-        if fetch:
-            sql += ' RETURNING chapter_id, manga_id, chapter_number, chapter_decimal, release_date, chapter_identifier'
+        # Inserted rows are always returned as they are needed for the release windows
+        if len(data) >= self.COPY_CHAPTERS_MIN_ROWS:
+            retval = self._copy_chapters(data, cur=cur)
+        else:
+            sql = f'INSERT INTO chapters ({self.CHAPTER_INSERT_COLUMNS}) SELECT * FROM %s ' \
+                  f'ON CONFLICT DO NOTHING RETURNING {self.INSERTED_CHAPTER_COLUMNS}'
+            retval = execute_unnest(cur, sql, data, self.CHAPTER_INSERT_TYPES, fetch=True)
 
-        retval = execute_values(cur, sql, data, page_size=max(len(data), 300), fetch=fetch)
-        if not retval:
-            return []
+        inserted = list(map(InsertedChapter.parse_obj, retval))
+        self.update_release_windows(inserted, cur=cur)
+        # Chapters that were not inserted already existed so all of them are known now
+        self.add_recent_chapter_ids((d[1], d[5]) for d in data)
+
+        return inserted if fetch else []
+
+    @optional_transaction()
+    def ingest_chapters(self, service_id: int, chapters: Sequence[BaseChapter], *,
+                        cur: Cursor = NotImplemented) -> IngestResult:
+        """
+        Adds chapters of a single service and the manga of their new titles with
+        the ingest_chapters database function. New titles are matched to existing manga
+        like in add_new_manga_and_check_duplicate_titles. Latest chapters of the manga
+        are updated with update_latest_chapter.
+        """
+        if not chapters:
+            return IngestResult(set(), [], {})
+
+        columns = [list(col) for col in zip(*(
+            (
+                c.title_id, c.manga_title, c.title,
+                c.chapter_number, c.decimal, c.chapter_identifier,
+                c.release_date, c.group_id
+            ) for c in chapters
+        ))]
+        sql = 'SELECT * FROM ingest_chapters(%s, %s::text[], %s::text[], %s::text[], %s::int[], ' \
+              '%s::smallint[], %s::text[], %s::timestamptz[], %s::int[])'
+        cur.execute(sql, [service_id, *columns])
+
+        result = IngestResult(set(), [], {})
+        services_added: Set[int] = set()
+        title_ids: Set[str] = set()
+        for row in cur.fetchall():
+            if row['chapter_id'] is not None:
+                result.inserted.append(InsertedChapter.parse_obj(row))
+                continue
 
-        return list(map(InsertedChapter.parse_obj, retval))
+            title_ids.add(row['title_id'])
+            result.manga_ids.add(row['manga_id'])
+            if row['service_added']:
+                services_added.add(row['manga_id'])
+            if row['new_manga_title'] is not None:
+                result.new_manga[row['manga_id']] = row['new_manga_title']
+
+        self.update_release_windows(result.inserted, cur=cur)
+        self.update_latest_chapter(
+            [(c.manga_id, c.chapter_number, c.release_date) for c in result.inserted if c.chapter_decimal is None],
+            cur=cur
+        )
+        # Chapters of titles that were skipped are not added and must not be treated as known
+        self.add_recent_chapter_ids((service_id, c.chapter_identifier) for c in chapters if c.title_id in title_ids)
+
+        if result.new_manga:
+            self.index_new_mangas(result.new_manga)
+        if services_added:
+            self.index_manga_services(services_added, cur=cur)
+
+        return result
 
     @optional_transaction()
-    def update_latest_chapter(self, data: Collection[Tuple[int, int, datetime]], *, cur: Cursor = NotImplemented) -> None:
+    def update_latest_chapter(self, data: Iterable[LatestChapter], *, cur: Cursor = NotImplemented) -> None:
         """
-        Updates the latest chapter and next chapter estimates for the given manga that contain new chapters
+        Updates the latest chapter and next chapter estimates for the given manga that contain new chapters.
+        If the DbUtil collects latest chapters they are only written by flush_latest_chapters.
         Args:
             cur: Optional database cursor
             data: iterable of tuples or lists [manga_id, latest_chapter, release_date]
@@ -781,26 +1286,35 @@ class DbUtil:
         Returns:
             None
         """
-        if not data:
+        if self._latest_chapters is not None:
+            self._latest_chapters.update(data)
             return
 
-        format_ids = ','.join(['%s'] * len(data))
-        sql = f'SELECT latest_chapter, manga_id FROM manga WHERE manga_id IN ({format_ids})'
-        cur.execute(sql, [d[0] for d in data])
-        rows = cur.fetchall()
-        if not rows:
+        # The update must only see a single row of each manga
+        latest = LatestChapters()
+        latest.update(data)
+        self._write_latest_chapters(latest.pop_all(), cur)
+
+    @optional_transaction()
+    def flush_latest_chapters(self, manga_ids: Optional[Collection[int]] = None, *, cur: Cursor = NotImplemented) -> None:
+        """
+        Writes the latest chapters collected by update_latest_chapter with a single update.
+        If manga ids are given chapters of other manga are discarded.
+        """
+        if self._latest_chapters is None:
             return
 
-        # Filter latest chapters
-        rows = {r['manga_id']: r['latest_chapter'] for r in rows}
-        data = [d for d in data if rows[d[0]] is None or rows[d[0]] < d[1]]
+        self._write_latest_chapters(self._latest_chapters.pop_all(manga_ids), cur)
+
+    @staticmethod
+    def _write_latest_chapters(data: Sequence[LatestChapter], cur: Cursor) -> None:
         if not data:
             return
 
         sql = 'UPDATE manga m SET latest_chapter=c.latest_chapter, estimated_release=c.release_date + release_interval FROM ' \
-              ' (VALUES %s) as c(manga_id, latest_chapter, release_date) ' \
-              'WHERE c.manga_id=m.manga_id'
-        execute_values(cur, sql, data)
+              ' %s as c(manga_id, latest_chapter, release_date) ' \
+              'WHERE c.manga_id=m.manga_id AND (m.latest_chapter IS NULL OR m.latest_chapter < c.latest_chapter)'
+        execute_unnest(cur, sql, data, ('int', 'int', 'timestamptz'))
 
     @optional_transaction()
     def update_estimated_release(self, manga_id: int, *, cur: Cursor = NotImplemented) -> None:
@@ -831,11 +1345,11 @@ class DbUtil:
         sql = f'''
         UPDATE chapters
         SET title=c.title
-        FROM (VALUES %s) AS c(title, id)
+        FROM %s AS c(title, id)
         WHERE service_id={service_id} AND chapter_identifier=c.id
         '''
 
-        execute_values(cur, sql, [(c.title, c.chapter_identifier) for c in chapters], page_size=200)
+        execute_unnest(cur, sql, [(c.title, c.chapter_identifier) for c in chapters], ('text', 'text'))
 
     @optional_transaction()
     def get_only_latest_entries(self,
@@ -844,33 +1358,62 @@ class DbUtil:
                                 manga_id: int = None,
                                 limit: int = 400,
                                 *, cur: Cursor = NotImplemented) -> Collection[BaseChapter]:
+        """
+        Returns the entries that have not been added to the service yet.
+        Entries found from the recent chapter identifiers of the service are not queried.
+        """
         if not entries:
             return []
 
-        if len(entries) > 200:
-            logger.warning('Over 200 entries passed to get_only_latest_entries')
-
-        args: Tuple = tuple(c.chapter_identifier for c in entries)
-        format_args = ','.join(('%s',) * len(args))
+        known = self.get_recent_chapter_ids(service_id, cur=cur)
+        cached = known.get_many(c.chapter_identifier for c in entries)
+        candidates = [c for c in entries if c.chapter_identifier not in cached]
+        if not candidates:
+            return []
 
+        identifiers = [c.chapter_identifier for c in candidates]
         if manga_id:
             sql = 'SELECT chapter_identifier FROM chapters ' \
-                  f'WHERE service_id=%s AND manga_id=%s AND chapter_identifier IN ({format_args})'
-            args = (service_id, manga_id, *args)
+                  'WHERE service_id=%s AND manga_id=%s AND chapter_identifier=ANY(%s)'
+            cur.execute(sql, (service_id, manga_id, identifiers))
         else:
             sql = 'SELECT chapter_identifier FROM chapters ' \
-                  f'WHERE service_id=%s AND chapter_identifier IN ({format_args})'
-            args = (service_id, *args)
+                  'WHERE service_id=%s AND chapter_identifier=ANY(%s)'
+            cur.execute(sql, (service_id, identifiers))
 
-        try:
-            cur.execute(sql, args)
+        existing = {r['chapter_identifier'] for r in cur}
+        known.update(dict.fromkeys(existing, True))
+        return set(candidates).difference(existing)
 
-            return set(entries).difference(set(r['chapter_identifier'] for r in cur))
+    @optional_transaction()
+    def get_recent_chapter_ids(self, service_id: int, *, cur: Cursor = NotImplemented) -> LRUCache[str, bool]:
+        """
+        Returns the cache of chapter identifiers known to exist on the service.
+        An empty cache is filled with the latest chapters of the service.
+        """
+        known = self.recent_chapter_ids.get(service_id)
+        if known is None:
+            known = self.recent_chapter_ids.setdefault(service_id, identity_cache(self.RECENT_CHAPTER_IDS))
 
-        except:
-            logger.exception('Failed to get old chapters')
-            return list(entries)
+        if len(known) == 0:
+            sql = 'SELECT chapter_identifier FROM chapters WHERE service_id=%s ORDER BY chapter_id DESC LIMIT %s'
+            cur.execute(sql, (service_id, self.RECENT_CHAPTER_IDS))
+            # Oldest first so the latest chapters are evicted last
+            known.update(dict.fromkeys(reversed([r['chapter_identifier'] for r in cur]), True))
+
+        return known
+
+    def add_recent_chapter_ids(self, chapters: Iterable[Tuple[int, str]]) -> None:
+        """
+        Adds (service id, chapter identifier) pairs to the recent chapter identifiers
+        of services that have them loaded
+        """
+        for service_id, identifiers in groupby(sorted(chapters), key=lambda c: c[0]):
+            known = self.recent_chapter_ids.get(service_id)
+            if known is not None and len(known) > 0:
+                known.update(dict.fromkeys((c[1] for c in identifiers), True))
 
+    @write_behind(DeferredWrites.set_manga_last_checked)
     @optional_transaction()
     def set_manga_last_checked(self, service_id: int, manga_id: int,
                                last_checked: Optional[datetime], *, cur: Cursor = NotImplemented):
@@ -906,12 +1449,37 @@ class DbUtil:
 
     @optional_transaction()
     def get_or_create_group(self, group_name: str, *, cur: Cursor = NotImplemented) -> Group:
+        group = self.group_registry.get(group_name)
+        if group is not None:
+            return group
+
         groups = list(self.find_existing_groups([group_name], cur=cur))
         if not groups:
             groups = list(self.add_new_groups([GroupPartial(name=group_name)], cur=cur))
 
+        self.group_registry.set(group_name, groups[0])
         return groups[0]
 
+    @optional_transaction()
+    def get_or_create_groups(self, group_names: Collection[str], *, cur: Cursor = NotImplemented) -> Dict[str, Group]:
+        """
+        Resolves multiple groups by their name at once, creating the ones that do not exist.
+        The groups are added to the group registry.
+        """
+        groups = self.group_registry.get_many(group_names)
+        missing = [name for name in group_names if name not in groups]
+        if not missing:
+            return groups
+
+        found = {g.name: g for g in self.find_existing_groups(missing, cur=cur)}
+        new_groups = [GroupPartial(name=name) for name in missing if name not in found]
+        if new_groups:
+            found.update({g.name: g for g in self.add_new_groups(new_groups, cur=cur)})
+
+        self.group_registry.update(found)
+        groups.update(found)
+        return groups
+
     @optional_transaction()
     def add_new_groups(self, groups: Collection[GroupPartial], *, cur: Cursor = NotImplemented) -> Iterable[Group]:
         sql = 'INSERT INTO groups (name, mangadex_id) VALUES %s ' \
@@ -1082,7 +1650,7 @@ class DbUtil:
         ]
         sql = f'''
             INSERT INTO manga_info as mi (manga_id, cover, bw, mu, mal, amz, ebj, engtl, raw, nu, kt, ap, al) 
-            VALUES %s
+            SELECT * FROM %s
             ON CONFLICT (manga_id) DO UPDATE SET 
                 cover=COALESCE(excluded.cover, mi.cover),
                 bw=COALESCE(excluded.bw, mi.bw),
@@ -1098,7 +1666,7 @@ class DbUtil:
                 al=COALESCE(excluded.al, mi.al)
                 {',last_updated=CURRENT_TIMESTAMP' if update_last_check else ''}
         '''
-        execute_values(cur, sql, data)
+        execute_unnest(cur, sql, data, ('int', *['text'] * 12))
 
     @optional_transaction()
     def update_manga_titles(self, titles: List[Tuple[int, str]], *, cur: Cursor = NotImplemented) -> None:
@@ -1187,6 +1755,7 @@ class DbUtil:
         cur.execute(sql, (notification_id,))
         return cur.fetchall()
 
+    @write_behind(DeferredWrites.update_notification_stats)
     @optional_transaction()
     def update_notification_stats(self,
                                   notification_id: int,
@@ -1211,7 +1780,55 @@ class DbUtil:
             'notification_id': notification_id
         })
 
+    @write_behind(DeferredWrites.disable_manga_service)
     @optional_transaction()
     def disable_manga_service(self, service_id: int, title_id: str, *, cur: Cursor = NotImplemented) -> None:
         sql = 'UPDATE manga_service SET disabled=TRUE WHERE service_id=%s AND title_id=%s'
         cur.execute(sql, (service_id, title_id))
+
+    @optional_transaction()
+    def flush_writes(self, *, cur: Cursor = NotImplemented) -> None:
+        """
+        Writes the updates buffered in the deferred writes of this instance
+        with a single statement for each table and set of updated columns
+        """
+        if self._deferred_writes is None:
+            return
+
+        writes = self._deferred_writes.pop_all()
+        for table, rows in writes.rows.items():
+            key_columns, column_types = DeferredWrites.COLUMNS[table]
+
+            # Rows that update the same columns are written together
+            by_columns: Dict[Tuple[str, ...], List[List[Any]]] = {}
+            for key, values in rows.items():
+                columns = tuple(c for c in column_types if c in values)
+                by_columns.setdefault(columns, []).append([*key, *(values[c] for c in columns)])
+
+            for columns, data in by_columns.items():
+                sql = f'UPDATE {table} t SET {", ".join(f"{c}=v.{c}" for c in columns)} ' \
+                      f'FROM %s AS v({", ".join((*key_columns, *columns))}) ' \
+                      f'WHERE {" AND ".join(f"t.{c}=v.{c}" for c in key_columns)}'
+                types = (*('int' for _ in key_columns), *(column_types[c] for c in columns))
+                execute_unnest(cur, sql, data, types)
+
+        if writes.disabled_titles:
+            sql = 'UPDATE manga_service ms SET disabled=TRUE FROM %s AS v(service_id, title_id) ' \
+                  'WHERE ms.service_id=v.service_id AND ms.title_id=v.title_id'
+            execute_unnest(cur, sql, list(writes.disabled_titles), ('int', 'text'))
+
+        if writes.notification_stats:
+            sql = '''
+                UPDATE user_notifications n
+                SET
+                    times_run=n.times_run + v.runs,
+                    times_failed=n.times_failed + v.failed,
+                    failed_in_row=CASE
+                        WHEN v.reset THEN v.failed_in_row
+                        ELSE n.failed_in_row + v.failed_in_row
+                    END
+                FROM %s AS v(notification_id, runs, failed, reset, failed_in_row)
+                WHERE n.notification_id=v.notification_id
+            '''
+            execute_unnest(cur, sql, [(notification_id, *stats) for notification_id, stats in writes.notification_stats.items()],
+                           ('int', 'int', 'int', 'bool', 'int'))
@@ -0,0 +1,41 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+logger = logging.getLogger('debug')
+
+T = TypeVar('T')
+
+
+class PersistPipeline:
+    """
+    Connects many network bound fetchers to a small amount of database workers.
+    Jobs are queued into a bounded queue and submitting blocks when the queue is full,
+    so fetchers can't get too far ahead of the database workers.
+    """
+
+    def __init__(self, workers: int, max_queued: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='persist')
+        # Limits the amount of jobs either waiting in the queue or being run
+        self._slots = threading.BoundedSemaphore(workers + max_queued)
+
+    def submit(self, fn: Callable[..., T], *args) -> 'Future[T]':
+        self._slots.acquire()
+        try:
+            fut = self._executor.submit(fn, *args)
+        except:
+            self._slots.release()
+            raise
+
+        fut.add_done_callback(lambda _: self._slots.release())
+        return fut
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self) -> 'PersistPipeline':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
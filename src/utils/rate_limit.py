@@ -0,0 +1,253 @@
+"""
+Per host rate limiting of HTTP requests.
+
+Requests to a host with a configured rate limit reserve a token from the token
+bucket of the host before they are sent. Reserving never blocks. It returns how long
+the request must wait so threads and coroutines sleep without holding any locks.
+Limits back off on 429 responses, respect Retry-After and X-RateLimit-* headers and
+recover gradually. Limits can be shared between processes through the rate_limits table.
+"""
+import asyncio
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, ContextManager, Dict, Mapping, Optional
+
+import psycopg
+from psycopg import Connection
+from pydantic import BaseModel
+
+from src.utils.token_bucket import TokenBucket
+
+logger = logging.getLogger('debug')
+
+ConnectionFactory = Callable[[], ContextManager[Connection]]
+
+
+class RateLimit(BaseModel):
+    requests: float
+    """Amount of requests allowed per period. Also the maximum burst size"""
+    per: float = 1
+    """Length of the period in seconds"""
+    min_ratio: float = 0.1
+    """Lowest fraction of the configured rate the limit backs off to"""
+
+    class Config:
+        allow_mutation = False
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.per
+
+
+def get_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Returns the seconds until requests are allowed again from the response headers
+    or None if the headers do not say
+    """
+    value = headers.get('Retry-After')
+    if value is not None:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            logger.warning(f'Invalid Retry-After header {value}')
+
+    value = headers.get('X-RateLimit-Retry-After') or headers.get('X-RateLimit-Reset')
+    if value is not None:
+        try:
+            seconds = float(value)
+        except ValueError:
+            logger.warning(f'Invalid rate limit reset header {value}')
+            return None
+
+        # Large values are unix timestamps
+        if seconds > 1e9:
+            seconds -= time.time()
+        return max(seconds, 0.0)
+
+    return None
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter of a single host shared by all threads of the process
+    """
+    BACKOFF_FACTOR = 0.5
+    """The rate is multiplied by this after a 429 response"""
+    RECOVERY_STEP = 0.05
+    """Fraction of the configured rate recovered after each successful response"""
+    DEFAULT_RETRY_AFTER = 5.0
+    """Seconds requests are blocked for after a 429 response without a Retry-After header"""
+
+    def __init__(self, host: str, limit: RateLimit, *, clock: Callable[[], float] = time.monotonic):
+        self.host = host
+        self.limit = limit
+        self.bucket = TokenBucket(limit.requests, limit.per, clock=clock)
+        self._clock = clock
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        """Current rate in requests per second"""
+        return self.bucket.rate
+
+    def _reserve_token(self) -> float:
+        return self.bucket.reserve()
+
+    def _blocked_for(self) -> float:
+        with self._lock:
+            return max(0.0, self._blocked_until - self._clock())
+
+    def reserve(self) -> float:
+        """
+        Reserves a request. Returns the seconds to wait before sending it
+        """
+        return max(self._reserve_token(), self._blocked_for())
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def block(self, seconds: float) -> None:
+        """
+        Blocks requests for the given amount of seconds
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+    def update(self, status: int, headers: Mapping[str, str]) -> None:
+        """
+        Adapts the limit to the status and headers of a response
+        """
+        retry_after = get_retry_after(headers)
+
+        if status == 429:
+            rate = max(self.rate * self.BACKOFF_FACTOR, self.limit.rate * self.limit.min_ratio)
+            logger.warning(f'Rate limited by {self.host}. Reducing rate to {rate:.2f}/s')
+            self.bucket.set_rate(rate)
+            self.block(self.DEFAULT_RETRY_AFTER if retry_after is None else retry_after)
+            return
+
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is not None and retry_after is not None and remaining.isdigit() and int(remaining) == 0:
+            self.block(retry_after)
+
+        if self.rate < self.limit.rate:
+            self.bucket.set_rate(min(self.rate + self.limit.rate * self.RECOVERY_STEP, self.limit.rate))
+
+    def __repr__(self):
+        return f'{type(self).__name__}(host={self.host}, rate={self.rate}, limit={self.limit})'
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    Rate limiter that reserves requests from a token bucket stored in the database
+    so the limit is shared by all processes. Falls back to the local bucket if the
+    database cannot be reached.
+    """
+
+    def __init__(self, host: str, limit: RateLimit, conn: ConnectionFactory, *,
+                 clock: Callable[[], float] = time.monotonic):
+        super().__init__(host, limit, clock=clock)
+        self.conn = conn
+
+    def _reserve_token(self) -> float:
+        sql = '''
+            INSERT INTO rate_limits AS rl (host, tokens, updated_at)
+            VALUES (%(host)s, %(capacity)s::float8 - 1, clock_timestamp())
+            ON CONFLICT (host) DO UPDATE SET
+                tokens=LEAST(
+                    %(capacity)s::float8,
+                    rl.tokens + EXTRACT(EPOCH FROM clock_timestamp() - rl.updated_at)::float8 * %(rate)s::float8
+                ) - 1,
+                updated_at=clock_timestamp()
+            RETURNING GREATEST(
+                -rl.tokens / %(rate)s::float8,
+                EXTRACT(EPOCH FROM rl.blocked_until - clock_timestamp())::float8,
+                0
+            ) AS wait
+        '''
+        try:
+            with self.conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql, {'host': self.host, 'capacity': self.limit.requests, 'rate': self.rate})
+                    row = cur.fetchone()
+        except psycopg.Error:
+            logger.exception(f'Failed to reserve a shared request for {self.host}')
+            return super()._reserve_token()
+
+        return float(row['wait']) if row else 0.0
+
+    def block(self, seconds: float) -> None:
+        super().block(seconds)
+
+        sql = '''
+            UPDATE rate_limits
+            SET blocked_until=GREATEST(blocked_until, clock_timestamp() + make_interval(secs => %s))
+            WHERE host=%s
+        '''
+        try:
+            with self.conn() as conn:
+                conn.execute(sql, (seconds, self.host))
+        except psycopg.Error:
+            logger.exception(f'Failed to block shared requests for {self.host}')
+
+
+_limiters_lock = threading.Lock()
+_limits: Dict[str, RateLimit] = {}
+_limiters: Dict[str, RateLimiter] = {}
+_shared_conn: Optional[ConnectionFactory] = None
+
+
+def _create_limiter(host: str, limit: RateLimit) -> RateLimiter:
+    if _shared_conn is not None:
+        return SharedRateLimiter(host, limit, _shared_conn)
+    return RateLimiter(host, limit)
+
+
+def configure_rate_limit(host: str, limit: Optional[RateLimit], *, replace: bool = True) -> None:
+    """
+    Sets the rate limit of the given host. None removes the limit.
+    If replace is False an existing limit is kept.
+    """
+    with _limiters_lock:
+        if not replace and host in _limits:
+            return
+
+        if limit is None:
+            _limits.pop(host, None)
+            _limiters.pop(host, None)
+            return
+
+        _limits[host] = limit
+        _limiters[host] = _create_limiter(host, limit)
+
+
+def share_rate_limits(conn: Optional[ConnectionFactory]) -> None:
+    """
+    Shares the rate limits of all hosts with other processes using connections from
+    the given factory. None makes the limits process local again.
+    """
+    global _shared_conn
+
+    with _limiters_lock:
+        _shared_conn = conn
+        for host, limit in _limits.items():
+            _limiters[host] = _create_limiter(host, limit)
+
+
+def get_limiter(host: str) -> Optional[RateLimiter]:
+    return _limiters.get(host)
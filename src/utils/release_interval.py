@@ -0,0 +1,127 @@
+"""
+Release interval calculation.
+
+The release interval of a manga is calculated from a window of the rounded
+intervals between its latest consecutive whole chapters. Windows are stored
+in the manga_release_intervals table and updated when chapters are added.
+"""
+import statistics
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from src.db.models.manga import MangaReleaseWindow
+from src.utils.utilities import round_seconds
+
+INTERVAL_ACCURACY = 60*60*4  # 4h
+"""Intervals are rounded to this many seconds. Shorter intervals are ignored"""
+MAX_CHAPTER_GAP = 2
+"""Chapters older than a gap larger than this in chapter numbers are not used"""
+MAX_CHAPTERS = 30
+"""Maximum amount of latest chapters used to calculate the interval"""
+
+ChapterRelease = Tuple[int, datetime]
+"""Chapter number and release date of a whole chapter"""
+
+
+def get_consecutive_chapters(chapters: Sequence[ChapterRelease]) -> List[ChapterRelease]:
+    """
+    Returns the chapters until the first gap larger than MAX_CHAPTER_GAP.
+    The chapters must be ordered by chapter number descending.
+    """
+    consecutive: List[ChapterRelease] = []
+    for c in chapters:
+        if consecutive and consecutive[-1][0] - c[0] > MAX_CHAPTER_GAP:
+            break
+        consecutive.append(c)
+
+    return consecutive
+
+
+def get_release_intervals(chapters: Sequence[ChapterRelease]) -> List[int]:
+    """
+    Returns the rounded intervals in seconds between consecutive chapters.
+    The chapters must be ordered by chapter number descending.
+    """
+    return [
+        round_seconds((a - b).total_seconds(), INTERVAL_ACCURACY)
+        for (_, a), (_, b) in zip(chapters[:-1], chapters[1:])
+    ]
+
+
+def select_interval(intervals: Sequence[float]) -> float:
+    """
+    Selects the release interval from a non-empty list of intervals
+    """
+    # mode does not raise error since 3.8
+    # https://docs.python.org/3/library/statistics.html#statistics.mode
+    # Try to find a single most commonly occurring value.
+    # If multiple values found fall back to median
+    modes = statistics.multimode(intervals)
+    if len(modes) > 1:
+        return statistics.median(intervals)
+
+    return modes[0]
+
+
+def interval_from_window(intervals: Sequence[int]) -> Optional[timedelta]:
+    """
+    Selects the release interval from the rounded intervals of a release window.
+    Returns None if none of the intervals are valid.
+    """
+    # Ignore updates within 4 hours of each other
+    valid = [t for t in intervals if t >= INTERVAL_ACCURACY]
+    if not valid:
+        return None
+
+    return timedelta(seconds=select_interval(valid))
+
+
+def window_from_chapters(manga_id: int, chapters: Sequence[ChapterRelease]) -> MangaReleaseWindow:
+    """
+    Creates the release window of a manga from its latest whole chapters.
+    The chapters must be non-empty and ordered by chapter number descending.
+    """
+    chapters = get_consecutive_chapters(chapters[:MAX_CHAPTERS])
+    return MangaReleaseWindow(
+        manga_id=manga_id,
+        chapter_numbers=[c[0] for c in chapters],
+        release_dates=[c[1] for c in chapters],
+        intervals=get_release_intervals(chapters)[::-1]
+    )
+
+
+def add_releases(window: MangaReleaseWindow, chapters: Iterable[ChapterRelease]) -> bool:
+    """
+    Adds chapters to the release window in any order. Chapters already in the window
+    keep their earliest release date. Returns False without changing the window
+    if a chapter is older than every chapter of a window that is not full, as
+    the window might then continue with older chapters that are not in it.
+    """
+    releases = dict(zip(window.chapter_numbers, window.release_dates))
+    oldest = window.chapter_numbers[-1]
+    full = len(window.chapter_numbers) >= MAX_CHAPTERS
+    for chapter_number, release_date in chapters:
+        if chapter_number < oldest and not full:
+            return False
+
+        current = releases.get(chapter_number)
+        if current is None or release_date < current:
+            releases[chapter_number] = release_date
+
+    new_window = window_from_chapters(window.manga_id, sorted(releases.items(), reverse=True))
+    window.chapter_numbers = new_window.chapter_numbers
+    window.release_dates = new_window.release_dates
+    window.intervals = new_window.intervals
+    return True
+
+
+def calculate_release_interval(chapters: Sequence[ChapterRelease]) -> Optional[timedelta]:
+    """
+    Calculates the release interval from the latest whole chapters of a manga.
+    The chapters must be ordered by chapter number descending.
+    Returns None if there is not enough data for an interval.
+    """
+    if not chapters:
+        return None
+
+    return interval_from_window(window_from_chapters(0, chapters).intervals)
@@ -0,0 +1,151 @@
+"""
+Release time prediction used to schedule title updates.
+
+The next release of a title is expected one release interval after its latest
+release, moved to the weekday and hour of day the title usually releases on.
+Titles are polled densely around the expected release and sparsely otherwise.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+from src.utils import release_interval
+
+PATTERN_THRESHOLD = 0.5
+"""Share of releases that must fall on the same weekday or hour for it to be used"""
+MIN_SPREAD = timedelta(hours=1)
+MAX_SPREAD = timedelta(days=1)
+MAX_POLL_INTERVAL = timedelta(days=1)
+"""Maximum time between two polls of a title"""
+
+
+class ReleasePrediction(NamedTuple):
+    expected: datetime
+    """Expected time of the next release"""
+    spread: timedelta
+    """How far from the expected time the release is likely to happen"""
+
+
+class ReleaseHistory(NamedTuple):
+    interval: Optional[timedelta]
+    releases: List[datetime]
+    """Release dates of the latest whole chapters ordered from newest to oldest"""
+
+
+def _dominant(values: Sequence[int]) -> Optional[int]:
+    value, count = Counter(values).most_common(1)[0]
+    if count / len(values) >= PATTERN_THRESHOLD:
+        return value
+    return None
+
+
+def predict_release(releases: Sequence[datetime], interval: Optional[timedelta]) -> Optional[ReleasePrediction]:
+    """
+    Predicts the next release from earlier release dates and the release interval
+    of the title. Returns None if there is not enough data for a prediction.
+    """
+    if interval is None or len(releases) < 2:
+        return None
+
+    expected = max(releases) + interval
+    spread = min(max(interval / 8, MIN_SPREAD), MAX_SPREAD)
+
+    # Weekly or slower releases usually happen on the same weekday
+    weekday = _dominant([r.weekday() for r in releases]) if interval >= timedelta(days=6) else None
+    if weekday is not None:
+        days = (weekday - expected.weekday() + 3) % 7 - 3
+        expected += timedelta(days=days)
+
+    hour = _dominant([r.hour for r in releases])
+    if hour is not None:
+        hours = (hour - expected.hour + 12) % 24 - 12
+        expected = (expected + timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
+        spread = MIN_SPREAD if weekday is not None or interval < timedelta(days=6) else spread
+
+    return ReleasePrediction(expected, spread)
+
+
+def next_poll(prediction: Optional[ReleasePrediction], now: datetime, check_interval: timedelta) -> datetime:
+    """
+    Returns the time a title should be polled next.
+    Polls every check interval around the expected release, sleeps until the release window
+    when it is in the future and backs off gradually when the release is late.
+    """
+    if prediction is None:
+        return now + check_interval
+
+    window_start = prediction.expected - prediction.spread
+    window_end = prediction.expected + prediction.spread
+
+    if now < window_start:
+        wait = min(window_start - now, MAX_POLL_INTERVAL)
+    elif now <= window_end:
+        wait = check_interval
+    else:
+        wait = min((now - window_end) / 2, MAX_POLL_INTERVAL)
+
+    return now + max(wait, check_interval)
+
+
+def history_from_chapters(chapters: Sequence[release_interval.ChapterRelease]) -> ReleaseHistory:
+    """
+    Creates the release history of a manga from its latest whole chapters.
+    The chapters must be ordered by chapter number descending.
+    """
+    return ReleaseHistory(
+        release_interval.calculate_release_interval(chapters),
+        [release_date for _, release_date in chapters[:release_interval.MAX_CHAPTERS]]
+    )
+
+
+def predict_next_poll(history: Optional[ReleaseHistory], now: datetime, check_interval: timedelta) -> datetime:
+    """
+    Returns the time a title with the given release history should be polled next
+    """
+    if history is None:
+        return next_poll(None, now, check_interval)
+
+    return next_poll(predict_release(history.releases, history.interval), now, check_interval)
+
+
+PollStrategy = Callable[[ReleaseHistory, datetime], datetime]
+"""Returns the time of the next poll from the release history and the current time"""
+
+
+class BacktestResult(NamedTuple):
+    polls: int
+    chapters: int
+    latencies: List[timedelta]
+    """Time between the release and the poll that found it for each found chapter"""
+
+    @property
+    def polls_per_chapter(self) -> float:
+        return self.polls / self.chapters if self.chapters else 0.0
+
+
+def backtest(chapters: Sequence[release_interval.ChapterRelease], strategy: PollStrategy,
+             warmup: int = 5) -> BacktestResult:
+    """
+    Replays the releases of the given whole chapters in release order, polling at
+    the times the strategy returns. The strategy only sees chapters released before
+    the poll. The first warmup chapters are used as the initial history.
+    """
+    chapters = sorted(chapters, key=lambda c: c[1])
+    if len(chapters) <= warmup:
+        return BacktestResult(0, 0, [])
+
+    found = list(chapters[:warmup])
+    polls = 0
+    latencies: List[timedelta] = []
+    now = found[-1][1]
+
+    for chapter in chapters[warmup:]:
+        history = history_from_chapters(sorted(found, key=lambda c: c[0], reverse=True))
+        while now < chapter[1]:
+            now = strategy(history, now)
+            polls += 1
+
+        latencies.append(now - chapter[1])
+        found.append(chapter)
+
+    return BacktestResult(polls, len(latencies), latencies)
@@ -0,0 +1,275 @@
+"""
+Shared pooled HTTP sessions.
+
+Every host gets its own requests.Session so connections are kept alive and reused
+between requests to the same host. Pool sizes, timeouts and retry policies can be
+configured per host with configure_host. Requests to hosts with a rate limit
+configured in src.utils.rate_limit wait for the limiter before they are sent.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union, Type
+from urllib.parse import urlsplit
+
+import requests
+from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from src.utils import rate_limit
+
+logger = logging.getLogger('debug')
+
+Timeout = Union[float, Tuple[float, float]]
+
+RATE_LIMIT_STATUSES = frozenset((429, 503))
+"""
+Retry statuses handled by PooledHTTPAdapter.send instead of urllib3
+so that every attempt goes through the rate limiter of the host
+"""
+
+
+class HttpConfig(BaseModel):
+    pool_connections: int = 4
+    """Amount of connection pools to cache"""
+    pool_maxsize: int = 10
+    """Maximum amount of kept alive connections in a single pool"""
+    timeout: Timeout = (10, 30)
+    """Default timeout used when a request does not specify one. Either a single value or (connect, read) pair"""
+    retries: int = 3
+    """How many times failed requests are retried"""
+    backoff_factor: float = 0.5
+    """Backoff factor for the sleep between retries. Sleeps for {backoff factor} * (2 ** ({retry number} - 1)) seconds"""
+    retry_statuses: Tuple[int, ...] = (429, 502, 503, 504)
+    """Response statuses that will be retried"""
+
+    class Config:
+        allow_mutation = False
+
+
+class HostStats:
+    """
+    Connection counters of a single host
+    """
+    def __init__(self):
+        self.requests = 0
+        self.connections_created = 0
+
+    @property
+    def connections_reused(self) -> int:
+        return max(self.requests - self.connections_created, 0)
+
+    def __repr__(self):
+        return f'{type(self).__name__}(requests={self.requests}, created={self.connections_created}, reused={self.connections_reused})'
+
+
+_stats_lock = threading.Lock()
+_host_stats: Dict[str, HostStats] = {}
+
+
+def _get_stats(host: str) -> HostStats:
+    stats = _host_stats.get(host)
+    if stats is None:
+        stats = _host_stats.setdefault(host, HostStats())
+    return stats
+
+
+def _record_request(host: str) -> None:
+    with _stats_lock:
+        _get_stats(host).requests += 1
+
+
+def _record_connection(host: str) -> None:
+    with _stats_lock:
+        _get_stats(host).connections_created += 1
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _record_connection(self.host)
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        _record_request(self.host)
+        return super()._make_request(*args, **kwargs)
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _record_connection(self.host)
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        _record_request(self.host)
+        return super()._make_request(*args, **kwargs)
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies a default timeout, the rate limit of the host
+    and records connection statistics
+    """
+    pool_classes: Dict[str, Type[HTTPConnectionPool]] = {
+        'http': CountingHTTPConnectionPool,
+        'https': CountingHTTPSConnectionPool
+    }
+
+    def __init__(self, config: HttpConfig):
+        self.timeout = config.timeout
+        self.retries = config.retries
+        self.backoff_factor = config.backoff_factor
+        self.limit_statuses = RATE_LIMIT_STATUSES.intersection(config.retry_statuses)
+        super().__init__(
+            pool_connections=config.pool_connections,
+            pool_maxsize=config.pool_maxsize,
+            max_retries=Retry(
+                total=config.retries,
+                backoff_factor=config.backoff_factor,
+                status_forcelist=[s for s in config.retry_statuses if s not in RATE_LIMIT_STATUSES],
+                raise_on_status=False
+            )
+        )
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self.pool_classes
+
+    @staticmethod
+    def can_retry(request: requests.PreparedRequest, r: requests.Response) -> bool:
+        """
+        Whether the request can be sent again. Like urllib3 only idempotent methods are retried.
+        Other requests are only retried when they were rate limited with a Retry-After header,
+        as they might have been processed otherwise.
+        """
+        if request.method in Retry.DEFAULT_ALLOWED_METHODS:
+            return True
+        return r.status_code == 429 and 'Retry-After' in r.headers
+
+    def retry_wait(self, r: requests.Response, attempt: int) -> float:
+        retry_after = rate_limit.get_retry_after(r.headers)
+        if retry_after is not None:
+            return retry_after
+        return self.backoff_factor * (2 ** attempt)
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+
+        host = urlsplit(request.url).hostname or ''
+        attempt = 0
+        while True:
+            # Fetched on every attempt since the limit of the host can be changed at any time
+            limiter = rate_limit.get_limiter(host)
+            if limiter is not None:
+                limiter.acquire()
+
+            r = super().send(request, timeout=timeout, **kwargs)
+            if limiter is not None:
+                limiter.update(r.status_code, r.headers)
+
+            if r.status_code not in self.limit_statuses or attempt >= self.retries or not self.can_retry(request, r):
+                return r
+
+            # On 429 the limiter already blocks until requests are allowed again
+            if limiter is None or r.status_code != 429:
+                time.sleep(self.retry_wait(r, attempt))
+
+            r.close()
+            attempt += 1
+
+
+DEFAULT_CONFIG = HttpConfig()
+
+_sessions_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+_host_configs: Dict[str, HttpConfig] = {}
+
+
+def _get_host(url: str) -> str:
+    host = urlsplit(url).hostname
+    if not host:
+        raise ValueError(f'Could not parse host from url {url}')
+    return host
+
+
+def create_session(config: HttpConfig = DEFAULT_CONFIG) -> requests.Session:
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(config)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def configure_host(host: str, config: HttpConfig) -> None:
+    """
+    Sets the session configuration of the given host.
+    Replaces the existing session of the host if it exists.
+    """
+    with _sessions_lock:
+        _host_configs[host] = config
+        old = _sessions.pop(host, None)
+
+    if old is not None:
+        old.close()
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Returns the shared session of the host of the given url
+    """
+    host = _get_host(url)
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = create_session(_host_configs.get(host, DEFAULT_CONFIG))
+            _sessions[host] = session
+
+    return session
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return get_session(url).get(url, **kwargs)
+
+
+def head(url: str, **kwargs) -> requests.Response:
+    return get_session(url).head(url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return get_session(url).post(url, **kwargs)
+
+
+def get_host_stats(host: Optional[str] = None) -> Dict[str, HostStats]:
+    """
+    Returns a snapshot of the connection counters of all hosts or only the given host
+    """
+    with _stats_lock:
+        items = _host_stats.items() if host is None else [(host, _get_stats(host))]
+        snapshot: Dict[str, HostStats] = {}
+        for h, stats in items:
+            copy = HostStats()
+            copy.requests = stats.requests
+            copy.connections_created = stats.connections_created
+            snapshot[h] = copy
+
+        return snapshot
+
+
+def log_host_stats() -> None:
+    for host, stats in get_host_stats().items():
+        logger.debug(f'{host}: {stats}')
+
+
+def close_sessions() -> None:
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+
+    for session in sessions:
+        session.close()
@@ -0,0 +1,85 @@
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """
+    Token bucket that holds at most capacity tokens and refills continuously
+    at the rate of capacity tokens per refill_time seconds.
+    """
+
+    def __init__(self, capacity: float, refill_time: float, *, tokens: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if capacity <= 0 or refill_time <= 0:
+            raise ValueError('Capacity and refill time must be positive')
+
+        self.capacity = capacity
+        self.rate = capacity / refill_time
+        self._clock = clock
+        self._tokens = capacity if tokens is None else min(tokens, capacity)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def try_consume(self, amount: float = 1) -> bool:
+        """
+        Removes the given amount of tokens if they are available
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < amount:
+                return False
+
+            self._tokens -= amount
+            return True
+
+    def consume(self, amount: float) -> None:
+        """
+        Removes the given amount of tokens unconditionally. Can put the bucket into debt
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+    def reserve(self, amount: float = 1) -> float:
+        """
+        Removes the given amount of tokens unconditionally and returns the
+        seconds until the bucket is out of debt, i.e. the reserved tokens are available
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    def set_rate(self, rate: float) -> None:
+        """
+        Changes the refill rate in tokens per second. Tokens refilled so far use the old rate
+        """
+        if rate <= 0:
+            raise ValueError('Rate must be positive')
+
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def time_until(self, amount: float = 1) -> float:
+        """
+        Seconds until the given amount of tokens is available
+        """
+        with self._lock:
+            self._refill()
+            return max(0.0, (amount - self._tokens) / self.rate)
+
+    def __repr__(self):
+        return f'{type(self).__name__}(capacity={self.capacity}, rate={self.rate}, tokens={self._tokens})'
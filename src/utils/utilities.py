@@ -1,9 +1,10 @@
 import logging
 import random
 import re
+import threading
 from datetime import timedelta, datetime, timezone, time
 from typing import (Optional, Tuple, Union, Iterable, Dict, TYPE_CHECKING,
-                    NoReturn)
+                    NoReturn, List, Collection)
 
 from psycopg.rows import DictRow
 
@@ -94,7 +95,58 @@ def is_valid_feed(feed) -> Optional[NoReturn]:
     return None
 
 
-def get_latest_chapters(rows: Iterable[Union[dict, DictRow]]) -> Dict[str, Tuple[int, int, datetime]]:
+LatestChapter = Tuple[int, int, datetime]
+"""Tuple of manga id, chapter number and release date"""
+
+
+class LatestChapters:
+    """
+    Thread safe collection of the latest whole chapter of each manga.
+    Chapters with a higher chapter number replace lower ones and of chapters
+    with the same number the one released first is kept.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[int, LatestChapter] = {}
+
+    def add(self, manga_id: int, chapter_number: int, release_date: datetime) -> None:
+        with self._lock:
+            self._add(manga_id, chapter_number, release_date)
+
+    def update(self, chapters: Iterable[LatestChapter]) -> None:
+        with self._lock:
+            for manga_id, chapter_number, release_date in chapters:
+                self._add(manga_id, chapter_number, release_date)
+
+    def _add(self, manga_id: int, chapter_number: int, release_date: datetime) -> None:
+        old = self._data.get(manga_id)
+        if old is not None:
+            if old[1] > chapter_number or (old[1] == chapter_number and old[2] <= release_date):
+                return
+
+        self._data[manga_id] = (manga_id, chapter_number, release_date)
+
+    def pop_all(self, manga_ids: Optional[Collection[int]] = None) -> List[LatestChapter]:
+        """
+        Removes every collected chapter and returns the ones of the given manga
+        or all of them if manga ids are not given.
+        """
+        with self._lock:
+            data, self._data = self._data, {}
+
+        if manga_ids is None:
+            return list(data.values())
+        return [c for manga_id, c in data.items() if manga_id in manga_ids]
+
+    def as_dict(self) -> Dict[int, LatestChapter]:
+        with self._lock:
+            return self._data.copy()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def get_latest_chapters(rows: Iterable[Union[dict, DictRow]]) -> Dict[int, LatestChapter]:
     """
     From a set of rows get the ones with the highest chapter number and smallest release date
     Args:
@@ -103,18 +155,12 @@ def get_latest_chapters(rows: Iterable[Union[dict, DictRow]]) -> Dict[str, Tuple
     Returns:
         dict: of rows with the highest chapter number and smallest release date for a single manga
     """
-    chapter_data: Dict[str, Tuple[int, int, datetime]] = {}
-    for row in rows:
-        if row['chapter_decimal'] is not None:
-            continue
-        manga_id = row['manga_id']
-        if manga_id in chapter_data:
-            if chapter_data[manga_id][1] > row['chapter_number'] or chapter_data[manga_id][2] > row['release_date']:
-                continue
-
-        chapter_data[manga_id] = (row['manga_id'], row['chapter_number'], row['release_date'])
-
-    return chapter_data
+    latest = LatestChapters()
+    latest.update(
+        (row['manga_id'], row['chapter_number'], row['release_date'])
+        for row in rows if row['chapter_decimal'] is None
+    )
+    return latest.as_dict()
 
 
 def inject_service_values(dbutil: 'DbUtil'):